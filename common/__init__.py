@@ -0,0 +1,8 @@
+"""
+Shared building blocks used by the Divar, Jabama and Digikala clients.
+
+The per-source folders keep their numbered, self-contained stage scripts;
+everything that has to work across sources (persistent queues, stage loading
+and similar infrastructure) lives here. Run tools that use this package from
+the repository root, e.g. ``python -m divar_scraper.batch``.
+"""
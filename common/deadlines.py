@@ -0,0 +1,168 @@
+"""
+Batch deadlines and hedged requests.
+
+A Deadline is created once for a whole batch and handed down to every request,
+which then uses the time that is left (capped by its usual timeout) instead of a
+fixed timeout. The Hedger cuts the tail of idempotent GET requests: when a
+request has not answered after the p95 latency observed on its endpoint, an
+identical request is sent and whichever answers first wins. Hedges are limited
+to a fraction of all requests, so total traffic only grows by a few percent.
+
+The stage scripts stay free of this module: their request functions take a
+'timeout' argument, and the batch code wraps them, e.g.
+
+    raw = hedged_call("divar/post", lambda timeout: get_divar_post_info(token, timeout=timeout), deadline)
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+
+class Deadline:
+    """A point in time by which a batch must be finished."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def request_timeout(deadline: Optional[Deadline], cap: float) -> Optional[float]:
+    """
+    The timeout for one request: the request's usual timeout, shortened to what is left of the deadline.
+    Returns None if the deadline has already passed (the request should not be sent).
+    """
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    return min(cap, remaining) if remaining > 0 else None
+
+
+class Hedger:
+    """
+    Sends a second copy of a slow idempotent request and keeps the first answer.
+
+    Args:
+        percentile (float): The latency percentile of an endpoint after which a hedge is sent.
+        max_hedge_ratio (float): The maximum share of requests that may be hedged.
+        min_samples (int): Number of latencies observed on an endpoint before hedging starts.
+        window (int): Number of recent latencies kept per endpoint.
+        workers (int): Size of the thread pool that sends the requests.
+    """
+
+    def __init__(self, percentile: float = 0.95, max_hedge_ratio: float = 0.1, min_samples: int = 20,
+                 window: int = 500, workers: int = 64):
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._recorded = defaultdict(int)
+        self._delays: Dict[str, float] = {}
+        self._stats = defaultdict(lambda: {"requests": 0, "hedges": 0, "hedge_wins": 0})
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+
+    def record(self, endpoint: str, seconds: float):
+        """Adds the latency of a successful request to the endpoint's window."""
+        with self._lock:
+            latencies = self._latencies[endpoint]
+            latencies.append(seconds)
+            self._recorded[endpoint] += 1
+            # Sorting a few hundred values is cheap, but there is no need to do it on every request.
+            if len(latencies) >= self.min_samples and self._recorded[endpoint] % 10 == 0:
+                ordered = sorted(latencies)
+                self._delays[endpoint] = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """The current p95 (or configured percentile) latency of an endpoint, or None while warming up."""
+        with self._lock:
+            return self._delays.get(endpoint)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+
+    def _timed(self, endpoint: str, function: Callable[[float], Any], timeout: float):
+        started = time.monotonic()
+        result = function(timeout)
+        if result is not None:
+            self.record(endpoint, time.monotonic() - started)
+        return result
+
+    def _may_hedge(self, endpoint: str) -> bool:
+        with self._lock:
+            counts = self._stats[endpoint]
+            if counts["hedges"] + 1 > counts["requests"] * self.max_hedge_ratio:
+                return False
+            counts["hedges"] += 1
+            return True
+
+    def call(self, endpoint: str, function: Callable[[float], Any], deadline: Optional[Deadline] = None,
+             timeout: float = 15) -> Optional[Any]:
+        """
+        Runs 'function(timeout)', hedging it if it is slow.
+
+        Args:
+            endpoint (str): The name latencies are tracked under (e.g. "divar/post").
+            function (callable): Sends the request with the given timeout and returns the parsed
+                result, or None on failure (the convention of the stage scripts).
+            deadline (Deadline, optional): The batch deadline.
+            timeout (float): The usual timeout of the request, used as a cap.
+
+        Returns:
+            The first non-None result, or None if every attempt failed or the deadline has passed.
+        """
+        first_timeout = request_timeout(deadline, timeout)
+        if first_timeout is None:
+            return None
+        with self._lock:
+            self._stats[endpoint]["requests"] += 1
+
+        delay = self.hedge_delay(endpoint)
+        if delay is None or delay >= first_timeout:
+            # No hedge is possible: send the request from the calling thread.
+            return self._timed(endpoint, function, first_timeout)
+
+        first = self._executor.submit(self._timed, endpoint, function, first_timeout)
+
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        hedge_timeout = request_timeout(deadline, timeout)
+        if hedge_timeout is None or not self._may_hedge(endpoint):
+            return first.result()
+        hedge = self._executor.submit(self._timed, endpoint, function, hedge_timeout)
+
+        # The first non-None answer wins; the other request finishes in the background and is discarded.
+        pending = {first, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                if result is not None:
+                    if future is hedge:
+                        with self._lock:
+                            self._stats[endpoint]["hedge_wins"] += 1
+                    return result
+        return None
+
+
+# The hedger shared by all batch code, so latencies of an endpoint are tracked across batches.
+DEFAULT_HEDGER = Hedger()
+
+
+def hedged_call(endpoint: str, function: Callable[[float], Any], deadline: Optional[Deadline] = None,
+                timeout: float = 15) -> Optional[Any]:
+    """Hedger.call on the shared hedger."""
+    return DEFAULT_HEDGER.call(endpoint, function, deadline, timeout)
@@ -0,0 +1,436 @@
+"""
+Distributed crawl mode: several worker nodes pull leased batches of work from a
+shared coordinator.
+
+Two coordinators are available:
+
+- SQLiteCoordinator: a SQLite file on a shared disk (or on one box, for testing
+  a 1-node vs. N-node run).
+- RedisCoordinator: any Redis-compatible server, for real multi-machine runs.
+  Requires the optional 'redis' package.
+
+Workers renew the leases of their in-flight items with heartbeats. When the
+queue runs dry, idle workers steal items that have been in flight for too long,
+and the first result committed for an item wins, so every item is committed
+exactly once.
+
+Usage (from the repository root):
+    python -m common.distributed enqueue sqlite:///crawl.db divar-details tokens.json
+    python -m common.distributed worker sqlite:///crawl.db divar-details --nodes 4
+    python -m common.distributed export sqlite:///crawl.db divar-details details.json
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.work_queue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Jobs a worker can run: name -> (module, handler function).
+# Every handler takes (key, payload) and returns the result, or None on failure.
+JOBS = {
+    "divar-details": ("divar_scraper.batch", "fetch_simplified_post"),
+    "jabama-search": ("jabama_scraper.batch", "fetch_search_results"),
+    "digikala-search": ("digikala_scraper.batch", "fetch_search_page"),
+    "digikala-reports": ("digikala_scraper.batch", "fetch_product_report"),
+}
+
+
+def resolve_job(job: str) -> Callable[[str, Any], Optional[Any]]:
+    """Returns the handler function registered under a job name."""
+    if job not in JOBS:
+        raise ValueError(f"Unknown job '{job}'. Available jobs: {', '.join(sorted(JOBS))}")
+    module_name, function_name = JOBS[job]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SQLiteCoordinator(WorkQueue):
+    """
+    A coordinator backed by a SQLite file shared by all worker processes.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 60, max_attempts: int = 5, steal_after: float = 120):
+        super().__init__(path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        self.steal_after = steal_after
+
+    def heartbeat(self, owner: str, keys: Iterable[str]):
+        """Renews the leases of the items the worker is still processing."""
+        expires = time.time() + self.lease_seconds
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET lease_expires = ? WHERE key = ? AND owner = ? AND state = ?",
+                [(expires, key, owner, LEASED) for key in keys],
+            )
+
+    def steal(self, owner: str, count: int) -> List[Tuple[str, Any]]:
+        """
+        Takes a duplicate copy of items that another worker has had in flight for
+        more than 'steal_after' seconds. The original lease is left untouched;
+        whichever worker commits first wins. Items leased without an owner (or
+        before the queue file recorded owners) can be stolen by any worker.
+        """
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT key, payload FROM items WHERE state = ? AND owner IS NOT ? "
+                "AND COALESCE(leased_at, updated) < ? ORDER BY COALESCE(leased_at, updated) LIMIT ?",
+                (LEASED, owner, now - self.steal_after, count),
+            ).fetchall()
+            # Reset leased_at so other idle workers do not steal the same items again.
+            self._conn.executemany(
+                "UPDATE items SET leased_at = ? WHERE key = ?", [(now, key) for key, _ in rows]
+            )
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def commit(self, owner: str, results: List[Tuple[str, Any]]) -> int:
+        """
+        Stores a batch of results in one transaction. An item that is already done
+        is not overwritten.
+
+        Returns:
+            int: The number of results that were committed by this call.
+        """
+        now = time.time()
+        before = self._conn.total_changes
+        # Results are written here directly, not through the checkpoint buffer of complete().
+        for key, _ in results:
+            self._lease_expires.pop(key, None)
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE items SET state = ?, result = ?, error = NULL, lease_expires = NULL, updated = ? "
+                "WHERE key = ? AND state != ?",
+                [(DONE, json.dumps(result, ensure_ascii=False), now, key, DONE) for key, result in results],
+            )
+        return self._conn.total_changes - before
+
+    def release(self, owner: str, key: str, error: str = ""):
+        """Gives an item back after a failed attempt, unless another worker now owns it."""
+        self._lease_expires.pop(key, None)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_expires = NULL, updated = ? WHERE key = ? AND owner = ? AND state = ?",
+                (self.max_attempts, FAILED, PENDING, error, time.time(), key, owner, LEASED),
+            )
+
+    def is_finished(self) -> bool:
+        counts = self.counts()
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+
+# Atomically re-queues expired leases and leases up to ARGV[3] items.
+# KEYS: pending list, leases zset (key -> expiry), started zset (key -> lease start),
+#       results hash, owners hash, attempts hash, failed set
+LEASE_SCRIPT = """
+local now, ttl, count, owner, max_attempts = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4], tonumber(ARGV[5])
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], key)
+    redis.call('ZREM', KEYS[3], key)
+    if redis.call('HEXISTS', KEYS[4], key) == 0 then
+        redis.call('RPUSH', KEYS[1], key)
+    end
+end
+local leased = {}
+while #leased < count do
+    local key = redis.call('LPOP', KEYS[1])
+    if not key then break end
+    if redis.call('HEXISTS', KEYS[4], key) == 0 then
+        if redis.call('HINCRBY', KEYS[6], key, 1) > max_attempts then
+            redis.call('SADD', KEYS[7], key)
+        else
+            redis.call('ZADD', KEYS[2], now + ttl, key)
+            redis.call('ZADD', KEYS[3], now, key)
+            redis.call('HSET', KEYS[5], key, owner)
+            table.insert(leased, key)
+        end
+    end
+end
+return leased
+"""
+
+# KEYS: started zset, owners hash
+STEAL_SCRIPT = """
+local now, count, owner, steal_after = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4])
+local stolen = {}
+for _, key in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now - steal_after)) do
+    if #stolen >= count then break end
+    if redis.call('HGET', KEYS[2], key) ~= owner then
+        redis.call('ZADD', KEYS[1], now, key)
+        table.insert(stolen, key)
+    end
+end
+return stolen
+"""
+
+# KEYS: leases zset, owners hash
+HEARTBEAT_SCRIPT = """
+local expires, owner = tonumber(ARGV[1]), ARGV[2]
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == owner then
+        redis.call('ZADD', KEYS[1], 'XX', expires, ARGV[i])
+    end
+end
+return 0
+"""
+
+# KEYS: leases zset, started zset, owners hash, attempts hash, pending list, failed set
+RELEASE_SCRIPT = """
+local key, owner, max_attempts = ARGV[1], ARGV[2], tonumber(ARGV[3])
+if redis.call('HGET', KEYS[3], key) ~= owner or not redis.call('ZSCORE', KEYS[1], key) then
+    return 0
+end
+redis.call('ZREM', KEYS[1], key)
+redis.call('ZREM', KEYS[2], key)
+if tonumber(redis.call('HGET', KEYS[4], key) or '0') >= max_attempts then
+    redis.call('SADD', KEYS[6], key)
+else
+    redis.call('RPUSH', KEYS[5], key)
+end
+return 1
+"""
+
+
+class RedisCoordinator:
+    """
+    A coordinator backed by a Redis-compatible server. All keys live under 'namespace'.
+    """
+
+    def __init__(self, url: str, namespace: str = "crawl", lease_seconds: float = 60,
+                 max_attempts: int = 5, steal_after: float = 120):
+        if redis is None:
+            raise ImportError("The 'redis' package is required for the Redis coordinator (pip install redis).")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.steal_after = steal_after
+
+        self._keys = {name: f"{namespace}:{name}" for name in
+                      ("payloads", "pending", "leases", "started", "results", "owners", "attempts", "failed")}
+        self._lease = self._redis.register_script(LEASE_SCRIPT)
+        self._steal = self._redis.register_script(STEAL_SCRIPT)
+        self._heartbeat = self._redis.register_script(HEARTBEAT_SCRIPT)
+        self._release = self._redis.register_script(RELEASE_SCRIPT)
+
+    def _k(self, *names: str) -> List[str]:
+        return [self._keys[name] for name in names]
+
+    def _payloads(self, keys: List[str]) -> List[Tuple[str, Any]]:
+        if not keys:
+            return []
+        payloads = self._redis.hmget(self._keys["payloads"], keys)
+        return [(key, json.loads(payload) if payload else None) for key, payload in zip(keys, payloads)]
+
+    def enqueue(self, items: Iterable[Tuple[str, Any]]) -> int:
+        items = [(str(key), json.dumps(payload, ensure_ascii=False)) for key, payload in items]
+        pipe = self._redis.pipeline()
+        for key, payload in items:
+            pipe.hsetnx(self._keys["payloads"], key, payload)
+        added = [key for (key, _), is_new in zip(items, pipe.execute()) if is_new]
+        if added:
+            self._redis.rpush(self._keys["pending"], *added)
+        return len(added)
+
+    def lease(self, count: int = 1, owner: Optional[str] = None) -> List[Tuple[str, Any]]:
+        keys = self._lease(
+            keys=self._k("pending", "leases", "started", "results", "owners", "attempts", "failed"),
+            args=[time.time(), self.lease_seconds, count, owner or "", self.max_attempts],
+        )
+        return self._payloads(keys)
+
+    def heartbeat(self, owner: str, keys: Iterable[str]):
+        keys = list(keys)
+        if keys:
+            self._heartbeat(keys=self._k("leases", "owners"), args=[time.time() + self.lease_seconds, owner, *keys])
+
+    def steal(self, owner: str, count: int) -> List[Tuple[str, Any]]:
+        keys = self._steal(keys=self._k("started", "owners"), args=[time.time(), count, owner, self.steal_after])
+        return self._payloads(keys)
+
+    def commit(self, owner: str, results: List[Tuple[str, Any]]) -> int:
+        pipe = self._redis.pipeline()
+        for key, result in results:
+            # HSETNX makes the first committed result for a key the only one.
+            pipe.hsetnx(self._keys["results"], key, json.dumps(result, ensure_ascii=False))
+            pipe.zrem(self._keys["leases"], key)
+            pipe.zrem(self._keys["started"], key)
+        replies = pipe.execute()
+        return sum(1 for reply in replies[::3] if reply)
+
+    def release(self, owner: str, key: str, error: str = ""):
+        self._release(
+            keys=self._k("leases", "started", "owners", "attempts", "pending", "failed"),
+            args=[key, owner, self.max_attempts],
+        )
+
+    def counts(self) -> Dict[str, int]:
+        pipe = self._redis.pipeline()
+        pipe.llen(self._keys["pending"])
+        pipe.zcard(self._keys["leases"])
+        pipe.hlen(self._keys["results"])
+        pipe.scard(self._keys["failed"])
+        return dict(zip((PENDING, LEASED, DONE, FAILED), pipe.execute()))
+
+    def is_finished(self) -> bool:
+        counts = self.counts()
+        return not counts[PENDING] and not counts[LEASED]
+
+    def results(self) -> Iterator[Tuple[str, Any]]:
+        for key, result in self._redis.hscan_iter(self._keys["results"]):
+            yield key, json.loads(result)
+
+    def close(self):
+        self._redis.close()
+
+
+def open_coordinator(url: str, namespace: str = "crawl", **options):
+    """
+    Opens a coordinator from a URL: 'sqlite:///path/to/file.db' or 'redis://host:6379/0'.
+    For SQLite, the namespace is appended to the file name so several jobs can share a folder.
+    """
+    if url.startswith("sqlite:///"):
+        path = url[len("sqlite:///"):]
+        root, ext = os.path.splitext(path)
+        return SQLiteCoordinator(f"{root}.{namespace}{ext or '.db'}", **options)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCoordinator(url, namespace=namespace, **options)
+    raise ValueError(f"Unsupported coordinator URL: {url}")
+
+
+def run_worker(
+    coordinator,
+    handler: Callable[[str, Any], Optional[Any]],
+    worker_id: Optional[str] = None,
+    batch_size: int = 20,
+    threads: int = 4,
+    idle_sleep: float = 1.0,
+) -> Dict[str, int]:
+    """
+    Pulls leased batches from the coordinator and processes them until all work is done.
+
+    While a batch is in flight, its leases are renewed every third of the lease
+    time. When nothing is pending, the worker steals straggling items from other
+    workers; it exits once no item is pending or leased anymore.
+
+    Returns:
+        dict: Statistics of this worker: processed, committed and failed items.
+    """
+    worker_id = worker_id or default_worker_id()
+    heartbeat_every = max(coordinator.lease_seconds / 3, 0.1)
+    stats = {"processed": 0, "committed": 0, "failed": 0}
+
+    def process(key, payload):
+        try:
+            return handler(key, payload), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            batch = coordinator.lease(batch_size, owner=worker_id) or coordinator.steal(worker_id, batch_size)
+            if not batch:
+                if coordinator.is_finished():
+                    break
+                time.sleep(idle_sleep)
+                continue
+
+            futures = {executor.submit(process, key, payload): key for key, payload in batch}
+            in_flight = set(futures)
+            while in_flight:
+                _, in_flight = wait(in_flight, timeout=heartbeat_every)
+                if in_flight:
+                    coordinator.heartbeat(worker_id, [futures[f] for f in in_flight])
+
+            results = []
+            for future, key in futures.items():
+                result, error = future.result()
+                stats["processed"] += 1
+                if result is None:
+                    stats["failed"] += 1
+                    coordinator.release(worker_id, key, error or "empty result")
+                else:
+                    results.append((key, result))
+            stats["committed"] += coordinator.commit(worker_id, results)
+
+    return stats
+
+
+def _worker_process(url: str, job: str, options: dict, batch_size: int, threads: int) -> Dict[str, int]:
+    coordinator = open_coordinator(url, namespace=job, **options)
+    try:
+        return run_worker(coordinator, resolve_job(job), batch_size=batch_size, threads=threads)
+    finally:
+        coordinator.close()
+
+
+def run_local_cluster(url: str, job: str, nodes: int = 2, batch_size: int = 20, threads: int = 4,
+                      **options) -> List[Dict[str, int]]:
+    """
+    Starts 'nodes' worker processes on this machine against the same coordinator.
+    Useful for comparing a 1-node and an N-node run on a single box.
+    """
+    with multiprocessing.Pool(nodes) as pool:
+        return pool.starmap(_worker_process, [(url, job, options, batch_size, threads)] * nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed crawl coordinator and worker.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="Add work items from a JSON file.")
+    enqueue_parser.add_argument("url")
+    enqueue_parser.add_argument("job", choices=sorted(JOBS))
+    enqueue_parser.add_argument("input", help="JSON list of keys, or an object mapping keys to payloads.")
+
+    worker_parser = subparsers.add_parser("worker", help="Run worker node(s) until the queue is empty.")
+    worker_parser.add_argument("url")
+    worker_parser.add_argument("job", choices=sorted(JOBS))
+    worker_parser.add_argument("--nodes", type=int, default=1)
+    worker_parser.add_argument("--threads", type=int, default=4)
+    worker_parser.add_argument("--batch-size", type=int, default=20)
+
+    export_parser = subparsers.add_parser("export", help="Write all committed results to a JSON file.")
+    export_parser.add_argument("url")
+    export_parser.add_argument("job", choices=sorted(JOBS))
+    export_parser.add_argument("output")
+
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        with open(args.input, encoding="utf-8") as f:
+            items = json.load(f)
+        pairs = items.items() if isinstance(items, dict) else ((key, None) for key in items)
+        coordinator = open_coordinator(args.url, namespace=args.job)
+        print(f"{coordinator.enqueue(pairs)} new items added.")
+        coordinator.close()
+
+    elif args.command == "worker":
+        started = time.time()
+        stats = run_local_cluster(args.url, args.job, nodes=args.nodes,
+                                  batch_size=args.batch_size, threads=args.threads)
+        print(json.dumps({"elapsed_seconds": round(time.time() - started, 2), "nodes": stats}, indent=4))
+
+    elif args.command == "export":
+        coordinator = open_coordinator(args.url, namespace=args.job)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(coordinator.results()), f, ensure_ascii=False, indent=4)
+        coordinator.close()
+
+
+if __name__ == "__main__":
+    main()
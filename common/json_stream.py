@@ -0,0 +1,250 @@
+"""
+Incremental JSON parsing of large responses.
+
+iter_json_array() reads a JSON document chunk by chunk and yields the elements of
+the array found at a key path (e.g. "result.items" in Jabama search responses or
+"data.products" in Digikala search pages) one at a time. Everything outside that
+path is skipped without being decoded, and each element is decoded on its own
+with the C json decoder, so the parser itself holds about one element plus one
+chunk instead of the raw body and the whole decoded response tree. Callers that
+collect the (cleaned) elements, e.g. into a list, still hold those.
+
+Usage:
+    response = requests.post(url, json=payload, stream=True, timeout=20)
+    for item in iter_response_items(response, "result.items", deadline=deadline):
+        ...
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional, Union
+
+from common.deadlines import Deadline
+
+# From just after an opening quote to the closing quote, skipping escaped characters.
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# The characters that matter while skipping over a container.
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_SCALAR = re.compile(r'[^,}\]\s]*')
+_WHITESPACE = re.compile(r'\s*')
+_DECODER = json.JSONDecoder()
+
+
+class _Reader:
+    """A text buffer filled from an iterator of byte or text chunks."""
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]], compact_at: int = 1 << 16):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+        self._compact_at = compact_at
+
+    def fill(self) -> bool:
+        """Appends the next chunk to the buffer. Returns False at the end of the input."""
+        while not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                tail = self._decoder.decode(b"", final=True)
+            else:
+                tail = self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if tail:
+                self.text += tail
+                return True
+        return False
+
+    def compact(self):
+        """Drops the consumed part of the buffer."""
+        if self.pos >= self._compact_at:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character ('' at the end of the input)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            raise ValueError(f"Expected '{character}' at offset {self.pos} of the JSON stream")
+        self.pos += 1
+
+    def skip_string(self):
+        start = self.pos
+        while True:
+            match = _STRING_TAIL.match(self.text, start + 1)
+            if match:
+                self.pos = match.end()
+                return
+            if not self.fill():
+                raise ValueError("Unterminated string in the JSON stream")
+
+    def read_string(self) -> str:
+        if self.peek() != '"':
+            raise ValueError(f"Expected a string at offset {self.pos} of the JSON stream")
+        start = self.pos
+        self.skip_string()
+        return json.loads(self.text[start:self.pos])
+
+    def skip_value(self):
+        """
+        Moves past the value that starts at the current position. The consumed text is
+        dropped as the value is skipped, so skipping a large value does not buffer it.
+        """
+        character = self.peek()
+        if character == '"':
+            self.skip_string()
+        elif character in "{[":
+            depth = 0
+            while True:
+                self.compact()
+                match = _STRUCTURE.search(self.text, self.pos)
+                if match is None:
+                    self.pos = len(self.text)
+                    if not self.fill():
+                        raise ValueError("Unexpected end of the JSON stream")
+                    continue
+                self.pos = match.start()
+                token = match.group()
+                if token == '"':
+                    self.skip_string()
+                    continue
+                self.pos += 1
+                depth += 1 if token in "{[" else -1
+                if depth == 0:
+                    return
+        else:
+            while True:
+                end = _SCALAR.match(self.text, self.pos).end()
+                # A number may continue in the next chunk.
+                if end < len(self.text) or not self.fill():
+                    self.pos = end
+                    return
+
+    def read_value(self) -> Any:
+        """
+        Decodes the value that starts at the current position with the C decoder. If the value
+        is not complete in the buffer yet, the buffer is at least doubled before the next attempt,
+        so a value spanning many chunks is not decoded over and over.
+        """
+        self.peek()
+        wanted = 0
+        while True:
+            if self.eof or len(self.text) - self.pos >= wanted:
+                try:
+                    value, end = _DECODER.raw_decode(self.text, self.pos)
+                    # A number may continue in the next chunk, even if the decoder stopped before the
+                    # end of the buffer (e.g. at "705." of "705.83"): wait until its characters end.
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        end_of_scalar = _SCALAR.match(self.text, self.pos).end()
+                    else:
+                        end_of_scalar = end
+                    if end_of_scalar < len(self.text) or self.eof:
+                        self.pos = end
+                        return value
+                except json.JSONDecodeError as e:
+                    if self.eof:
+                        raise ValueError(f"Invalid JSON stream: {e}") from None
+                wanted = 2 * (len(self.text) - self.pos)
+            self.fill()
+
+
+def _split_path(path: Union[str, List[str]]) -> List[str]:
+    if isinstance(path, str):
+        return [part for part in path.split(".") if part]
+    return list(path)
+
+
+def _separator(reader: _Reader, closing: str) -> bool:
+    """
+    Consumes what follows a member or an element: ',' (returns True, another one must follow)
+    or the closing bracket (returns False).
+    """
+    character = reader.peek()
+    reader.pos += 1
+    if character == ",":
+        return True
+    if character == closing:
+        return False
+    raise ValueError(f"Expected ',' or '{closing}' at offset {reader.pos - 1} of the JSON stream")
+
+
+def _find(reader: _Reader, path: List[str]) -> bool:
+    """Moves the reader into the value at 'path'. Returns False if the path does not exist."""
+    for key in path:
+        if reader.peek() != "{":
+            return False
+        reader.pos += 1
+        if reader.peek() == "}":
+            return False
+        while True:
+            name = reader.read_string()
+            reader.expect(":")
+            if name == key:
+                break
+            reader.skip_value()
+            reader.compact()
+            if not _separator(reader, "}"):
+                return False
+    return True
+
+
+def iter_json_array(chunks: Iterable[Union[bytes, str]], path: Union[str, List[str]]) -> Iterator[Any]:
+    """
+    Yields the elements of the array at 'path' of a JSON document read from chunks.
+
+    Args:
+        chunks: Byte (UTF-8) or text chunks of the document, e.g. response.iter_content().
+        path: Dotted object keys of the array, e.g. "data.products". An empty path means the
+            document itself is the array.
+
+    Yields:
+        The decoded array elements, in order. Nothing is yielded if the path does not exist
+        or does not lead to an array (e.g. "data": null).
+
+    Raises:
+        ValueError: If the document is not valid JSON up to the end of the array (the rest
+            of the document is not read).
+    """
+    reader = _Reader(chunks)
+    if not _find(reader, _split_path(path)) or reader.peek() != "[":
+        return
+    reader.pos += 1
+    if reader.peek() == "]":
+        return
+    while True:
+        if reader.peek() in ("", ",", "]"):
+            raise ValueError(f"Expected a value at offset {reader.pos} of the JSON stream")
+        yield reader.read_value()
+        reader.compact()
+        if not _separator(reader, "]"):
+            return
+
+
+def _chunks_until(chunks: Iterable[bytes], deadline: Optional[Deadline]) -> Iterator[bytes]:
+    for chunk in chunks:
+        if deadline is not None and deadline.expired():
+            raise TimeoutError("The deadline passed while the response was being read")
+        yield chunk
+
+
+def iter_response_items(response, path: Union[str, List[str]], chunk_size: int = 1 << 16,
+                        deadline: Optional[Deadline] = None) -> Iterator[Any]:
+    """
+    Yields the array elements at 'path' of a requests response opened with stream=True.
+    The response is closed when the iteration ends or is abandoned.
+
+    The request timeout of a streamed response only limits each socket read, so a slow
+    body can outlast it; with a 'deadline', TimeoutError is raised once it has passed.
+    """
+    try:
+        yield from iter_json_array(_chunks_until(response.iter_content(chunk_size=chunk_size), deadline), path)
+    finally:
+        response.close()
@@ -0,0 +1,442 @@
+"""
+Runs the stages of a client as a DAG, handing records between stages in memory.
+
+Every stage consumes batches of records from its upstream stage(s), processes the
+records on its own thread pool and passes its output records downstream in
+batches as soon as a batch is full (or its oldest record has waited
+"flush_seconds", or the stage has nothing left to do), so stage N+1 starts
+working on the first results of stage N instead of waiting for a file. Bounded queues between the
+stages keep memory flat: a fast stage waits for a slow one.
+
+A run is described by a JSON config file:
+
+    {
+        "batch_size": 20,
+        "archive": "raw_archive",
+        "deadline_seconds": 600,
+        "inputs": [{"query": "گیتار یاماها"}],
+        "stages": [
+            {"name": "suggestions", "type": "divar.suggestions", "limit": 3},
+            {"name": "search", "type": "divar.search", "after": "suggestions",
+             "concurrency": 2, "unique_by": "token", "options": {"num_results": 20}},
+            {"name": "details", "type": "divar.details", "after": "search",
+             "concurrency": 8, "output": "divar_details.jsonl"}
+        ]
+    }
+
+"archive" (a RawArchive directory), "deadline_seconds" (a time limit for the
+whole run, see common/deadlines.py) and "flush_seconds" (how long a partial
+output batch may wait, default 1) are optional.
+
+Stage settings:
+    name / type    A unique name and one of STAGE_TYPES.
+    after          The upstream stage name, or a list of names. Stages without it receive "inputs".
+    concurrency    Number of records processed in parallel (default 1).
+    options        Keyword arguments for the stage function.
+    limit          Maximum number of output records per input record.
+    unique_by      Drop output records whose value for this field was already emitted by the stage.
+    output         A JSON Lines file that receives every output record of the stage.
+
+Usage (from the repository root):
+    python -m common.pipeline pipelines/divar.json --query "گیتار"
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from common.deadlines import Deadline, hedged_call, request_timeout
+from common.json_stream import iter_response_items
+from common.raw_archive import RawArchive
+from common.stages import load_stage
+
+
+# --- Stage functions: (record, archive, deadline, **options) -> output records ---
+# GET requests are hedged; POST requests only get their timeout shortened to the time left.
+def divar_suggestions(record: Dict[str, Any], archive=None, deadline: Deadline = None,
+                      city_id: str = '1') -> Iterator[Dict[str, Any]]:
+    """
+    Yields a {"query", "category", ...} record per suggested category of the query. "category" is
+    the slug the next stages search in; the suggestion's display subtitle is kept as "category_title".
+    """
+    stage = load_stage("divar_scraper", "1_get_suggestions.py")
+    timeout = request_timeout(deadline, 15)
+    if timeout is None:
+        return
+    for suggestion in stage.get_suggestions(record["query"], city_id, timeout) or []:
+        if suggestion.get("value"):
+            yield {**suggestion, "query": record["query"], "category": suggestion["value"],
+                   "category_title": suggestion.get("category")}
+
+
+def divar_filters(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("divar_scraper", "2_get_fillters.py")
+    timeout = request_timeout(deadline, 15)
+    if timeout is None:
+        return
+    filters = stage.fetch_filters_with_locations(record["query"], record["category"], timeout)
+    if filters is not None:
+        yield {"query": record["query"], "category": record["category"], "filters": filters}
+
+
+def divar_search(record: Dict[str, Any], archive=None, deadline: Deadline = None, num_results: int = None,
+                 filters: dict = None) -> Iterator[Dict[str, Any]]:
+    """Yields every search result row (extract_post_data) of a {"query", "category"} record."""
+    stage = load_stage("divar_scraper", "3_get_search.py")
+    timeout = request_timeout(deadline, 15)
+    if timeout is None:
+        return
+    posts = stage.fetch_search_posts(record["query"], record["category"], num_results,
+                                     record.get("search_filters") or filters, archive, timeout)
+    for post in (posts or {}).values():
+        yield {"query": record["query"], "category": record["category"], **post}
+
+
+def divar_details(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("divar_scraper", "4_get_details_search.py")
+    raw_post = hedged_call(
+        "divar/post", lambda timeout: stage.get_divar_post_info(record["token"], archive, timeout), deadline
+    )
+    simplified = stage.simplify_post_data(raw_post)
+    if simplified:
+        yield {"token": record["token"], **simplified}
+
+
+def jabama_suggestions(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("jabama_scraper", "1_get_suggestions.py")
+    suggestions = hedged_call(
+        "jabama/suggestions", lambda timeout: stage.fetch_suggestions(record["query"], timeout), deadline, timeout=10
+    )
+    for suggestion in suggestions or []:
+        if suggestion.get("api_keyword"):
+            yield {"query": record["query"], **suggestion}
+
+
+def jabama_filters(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("jabama_scraper", "2_get_filters.py")
+    timeout = request_timeout(deadline, 15)
+    if timeout is None:
+        return
+    filters = stage.fetch_filters(record["api_keyword"], timeout)
+    if filters is not None:
+        yield {"api_keyword": record["api_keyword"], "filters": filters}
+
+
+def _jabama_search_filters(record: Dict[str, Any], filters: dict = None) -> Optional[dict]:
+    """The suggestion's "pre_filters", overridden by the record's "selected_filters" (or the stage's 'filters')."""
+    pre_filters = record.get("pre_filters")
+    merged = dict(pre_filters) if isinstance(pre_filters, dict) else {}
+    merged.update(record.get("selected_filters") or filters or {})
+    return merged or None
+
+
+def jabama_search(record: Dict[str, Any], archive=None, deadline: Deadline = None, results_count: int = 10,
+                  filters: dict = None, stream: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every cleaned listing (clean_item) for the record's "api_keyword", searched with the
+    suggestion's "pre_filters" plus the selected filters. With 'stream' (and no archive, which
+    needs the raw body), listings are parsed and passed on as the response arrives.
+    """
+    stage = load_stage("jabama_scraper", "3_execute_search.py")
+    timeout = request_timeout(deadline, 20)
+    if timeout is None:
+        return
+    search_filters = _jabama_search_filters(record, filters)
+    if stream and archive is None:
+        response = stage.open_search_stream(record["api_keyword"], search_filters, results_count, timeout)
+        if response is not None:
+            for item in iter_response_items(response, "result.items", deadline=deadline):
+                yield {"api_keyword": record["api_keyword"], **stage.clean_item(item)}
+        return
+    items = stage.fetch_search_items(record["api_keyword"], search_filters, results_count, archive, timeout)
+    for item in items or []:
+        yield {"api_keyword": record["api_keyword"], **stage.clean_item(item)}
+
+
+def digikala_autocomplete(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("digikala_scraper", "1_search_autocomplate.py")
+
+    def fetch(timeout: float):
+        # Errors come back as {"error": ...}; the hedger expects None for a failed request.
+        info = stage.get_digikala_autocomplete_info(record["query"], timeout)
+        return None if "error" in info else info
+
+    info = hedged_call("digikala/autocomplete", fetch, deadline, timeout=10) or {}
+    for suggestion in info.get("suggestions") or []:
+        yield {"query": suggestion, "source_query": record["query"]}
+
+
+def digikala_search(record: Dict[str, Any], archive=None, deadline: Deadline = None, pages: int = 1,
+                    filters: dict = None, stream: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every product (clean_product) of the first 'pages' result pages of the query. With
+    'stream' (and no archive), pages are parsed incrementally and not hedged.
+    """
+    stage = load_stage("digikala_scraper", "2_search.py")
+    if stream and archive is None:
+        for page in range(1, pages + 1):
+            timeout = request_timeout(deadline, 15)
+            if timeout is None:
+                return
+            response = stage.open_search_stream(record["query"], page, record.get("filters") or filters, timeout)
+            if response is None:
+                return
+            count = 0
+            for product in iter_response_items(response, "data.products", deadline=deadline):
+                count += 1
+                yield {"query": record["query"], **stage.clean_product(product)}
+            if not count:
+                return
+        return
+    for page in range(1, pages + 1):
+        products = hedged_call(
+            "digikala/search",
+            lambda timeout, page=page: stage.search_digikala(
+                record["query"], page, record.get("filters") or filters, archive, timeout
+            ),
+            deadline,
+        )
+        if not products:
+            return
+        for product in products:
+            yield {"query": record["query"], **product}
+
+
+def digikala_details(record: Dict[str, Any], archive=None, deadline: Deadline = None) -> Iterator[Dict[str, Any]]:
+    stage = load_stage("digikala_scraper", "3_final_digikala.py")
+    product_url = record.get("product_page_url") or record.get("url")
+    if not product_url:
+        return
+    report = stage.product_details(
+        product_url, archive, call=lambda endpoint, send: hedged_call(endpoint, send, deadline)
+    )
+    if report:
+        yield {"product_page_url": product_url, **report}
+
+
+STAGE_TYPES: Dict[str, Callable[..., Iterable[Dict[str, Any]]]] = {
+    "divar.suggestions": divar_suggestions,
+    "divar.filters": divar_filters,
+    "divar.search": divar_search,
+    "divar.details": divar_details,
+    "jabama.suggestions": jabama_suggestions,
+    "jabama.filters": jabama_filters,
+    "jabama.search": jabama_search,
+    "digikala.autocomplete": digikala_autocomplete,
+    "digikala.search": digikala_search,
+    "digikala.details": digikala_details,
+}
+
+# Marks the end of the records sent by one upstream stage.
+_DONE = object()
+
+
+class _StageRunner:
+    """Runs one stage: reads input batches, processes the records on a thread pool and forwards output batches."""
+
+    def __init__(self, config: Dict[str, Any], batch_size: int, queue_size: int, archive=None,
+                 deadline: Optional[Deadline] = None, flush_seconds: float = 1.0):
+        self.name = config["name"]
+        if config.get("type") not in STAGE_TYPES:
+            raise ValueError(f"Stage '{self.name}' has an unknown type: {config.get('type')}")
+        self.function = STAGE_TYPES[config["type"]]
+        after = config.get("after") or []
+        self.parents = [after] if isinstance(after, str) else list(after)
+        self.concurrency = max(1, int(config.get("concurrency", 1)))
+        self.options = config.get("options") or {}
+        self.limit = config.get("limit")
+        self.unique_by = config.get("unique_by")
+        self.output_filename = config.get("output")
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.archive = archive
+        self.deadline = deadline
+
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.children: List["_StageRunner"] = []
+        self.stats = {"received": 0, "emitted": 0, "errors": 0, "duplicates": 0, "seconds": 0.0}
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_since = 0.0
+        self._in_flight = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._output = None
+
+    def _emit(self, records: List[Dict[str, Any]]):
+        with self._lock:
+            for record in records:
+                if self.unique_by is not None:
+                    key = str(record.get(self.unique_by))
+                    if key in self._seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    self._seen.add(key)
+                self.stats["emitted"] += 1
+                if self._output is not None:
+                    self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if not self._buffer:
+                    self._buffer_since = time.monotonic()
+                self._buffer.append(record)
+            if len(self._buffer) < self.batch_size and time.monotonic() - self._buffer_since < self.flush_seconds:
+                return
+            batch, self._buffer = self._buffer, []
+        # Forward outside the lock: a full downstream queue only blocks this worker.
+        self._forward(batch)
+
+    def _flush(self, stale_only: bool = False):
+        """Forwards a partial output batch (with 'stale_only', only once it is older than flush_seconds)."""
+        with self._lock:
+            if not self._buffer or (stale_only and time.monotonic() - self._buffer_since < self.flush_seconds):
+                return
+            batch, self._buffer = self._buffer, []
+        self._forward(batch)
+
+    def _forward(self, batch):
+        for child in self.children:
+            child.inbox.put(batch)
+
+    def _process(self, record: Dict[str, Any], slots: threading.Semaphore):
+        try:
+            outputs = self.function(record, archive=self.archive, deadline=self.deadline, **self.options)
+            # Records are emitted as the stage function yields them, not when the whole record is done.
+            for output in islice(outputs, self.limit):
+                self._emit([output])
+        except Exception as e:
+            with self._lock:
+                self.stats["errors"] += 1
+            print(f"[Pipeline Warning] Stage '{self.name}' failed on a record. Reason: {e}")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                idle = self._in_flight == 0 and self.inbox.empty()
+            # Nothing else is being processed: downstream should not wait for a full batch.
+            if idle:
+                self._flush()
+            slots.release()
+
+    def run(self):
+        started = time.time()
+        # At most two records per worker are queued in the pool, so input stays in the inbox (and upstream waits).
+        slots = threading.Semaphore(self.concurrency * 2)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            if self.output_filename:
+                self._output = open(self.output_filename, "w", encoding="utf-8")
+            finished_parents = 0
+            while finished_parents < max(1, len(self.parents)):
+                try:
+                    batch = self.inbox.get(timeout=self.flush_seconds)
+                except queue.Empty:
+                    self._flush(stale_only=True)
+                    continue
+                if batch is _DONE:
+                    finished_parents += 1
+                    continue
+                for record in batch:
+                    self.stats["received"] += 1
+                    while not slots.acquire(timeout=self.flush_seconds):
+                        self._flush(stale_only=True)
+                    with self._lock:
+                        self._in_flight += 1
+                    executor.submit(self._process, record, slots)
+            # Wait for the records still in flight (all slots free), forwarding stale output meanwhile.
+            for _ in range(self.concurrency * 2):
+                while not slots.acquire(timeout=self.flush_seconds):
+                    self._flush(stale_only=True)
+        finally:
+            executor.shutdown(wait=True)
+            if self._buffer:
+                self._forward(self._buffer)
+                self._buffer = []
+            for child in self.children:
+                child.inbox.put(_DONE)
+            if self._output is not None:
+                self._output.close()
+            self.stats["seconds"] = round(time.time() - started, 2)
+
+
+def _build_stages(config: Dict[str, Any], archive=None, deadline: Optional[Deadline] = None) -> List[_StageRunner]:
+    batch_size = int(config.get("batch_size", 20))
+    queue_size = int(config.get("queue_size", 8))
+    flush_seconds = float(config.get("flush_seconds", 1.0))
+    stages = [_StageRunner(stage, batch_size, queue_size, archive, deadline, flush_seconds)
+              for stage in config.get("stages") or []]
+    if not stages:
+        raise ValueError("The pipeline config has no stages")
+
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for parent in stage.parents:
+            if parent not in by_name:
+                raise ValueError(f"Stage '{stage.name}' runs after an unknown stage: {parent}")
+            by_name[parent].children.append(stage)
+
+    # Reject cycles: every stage must be reachable from the roots in dependency order.
+    resolved = set()
+    while len(resolved) < len(stages):
+        ready = [s.name for s in stages if s.name not in resolved and all(p in resolved for p in s.parents)]
+        if not ready:
+            raise ValueError("The pipeline stages contain a cycle")
+        resolved.update(ready)
+    return stages
+
+
+def run_pipeline(config: Dict[str, Any], inputs: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs a pipeline described by a config dictionary (see the module documentation).
+
+    Args:
+        config (dict): The pipeline config.
+        inputs (list, optional): Records for the root stages; overrides config["inputs"].
+
+    Returns:
+        dict: Per-stage counters (received, emitted, errors, duplicates, seconds).
+    """
+    inputs = inputs if inputs is not None else config.get("inputs") or []
+    archive = RawArchive(config["archive"]) if config.get("archive") else None
+    try:
+        deadline = Deadline(config["deadline_seconds"]) if config.get("deadline_seconds") else None
+        stages = _build_stages(config, archive, deadline)
+        threads = [threading.Thread(target=stage.run, name=f"stage-{stage.name}", daemon=True) for stage in stages]
+        for thread in threads:
+            thread.start()
+
+        batch_size = int(config.get("batch_size", 20))
+        roots = [stage for stage in stages if not stage.parents]
+        for start in range(0, len(inputs), batch_size):
+            for root in roots:
+                root.inbox.put(inputs[start:start + batch_size])
+        for root in roots:
+            root.inbox.put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        return {stage.name: stage.stats for stage in stages}
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stages of a client as one pipeline.")
+    parser.add_argument("config", help="The JSON pipeline config file.")
+    parser.add_argument("--query", action="append", help='Input record {"query": ...} (repeatable); overrides the config inputs.')
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+    inputs = [{"query": query} for query in args.query] if args.query else None
+    print(json.dumps(run_pipeline(config, inputs), ensure_ascii=False, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+An append-only archive of raw API responses.
+
+Responses are stored compressed (zstd when the 'zstandard' package is installed,
+zlib otherwise) in numbered segment files. A fixed-width index file maps the hash
+of (endpoint, id) to the record's position and is memory-mapped, so single
+lookups are random access while full scans read the segments sequentially.
+
+Finding the latest entry of a key goes through an in-memory dict (key hash ->
+entry number) that is built from the mapped index when the archive is opened.
+Opening therefore reads the whole index once (O(number of records)), and the
+dict holds roughly 100 bytes per distinct key, i.e. about 100 MB for a million
+archived responses; only the entries and the bodies stay on disk.
+
+Layout of the archive directory:
+    segment-00000.dat   records: header, key, compressed body
+    index.bin           one INDEX_ENTRY per stored record, in write order
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Iterator, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codecs stored with every record, so an archive written with zstd stays readable.
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# key hash, segment number, offset, record length, timestamp, codec
+INDEX_ENTRY = struct.Struct("<QIQIqB3x")
+# key length, compressed body length, codec
+RECORD_HEADER = struct.Struct("<IIB")
+
+INDEX_FILENAME = "index.bin"
+
+
+def _key(endpoint: str, item_id: Any) -> bytes:
+    # A tab cannot appear in endpoint names, so ids may contain any other character.
+    return f"{endpoint}\t{item_id}".encode("utf-8")
+
+
+def _key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+class RawArchive:
+    """
+    Stores and retrieves raw response bodies by (endpoint, id).
+
+    Storing the same (endpoint, id) again keeps both versions; lookups return the latest.
+    The archive can be shared by the worker threads of one process: zstd codecs are not
+    thread-safe, so every thread compresses and decompresses with codecs of its own.
+
+    Args:
+        directory (str): The folder holding the segments and the index.
+        compression_level (int): The zstd (or zlib) compression level.
+        segment_size (int): Start a new segment file after this many bytes.
+    """
+
+    def __init__(self, directory: str = "raw_archive", compression_level: int = 10,
+                 segment_size: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+
+        self._codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        self._compression_level = compression_level
+        self._codecs = threading.local()
+
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, INDEX_FILENAME)
+        self._repair()
+        self._index_file = open(self._index_path, "ab")
+        self._latest = {}   # key hash -> entry number of the latest version
+        self._load_index()
+
+        self._segment = max(self._segment_numbers(), default=0)
+        self._segment_file = open(self._segment_path(self._segment), "ab")
+        self._readers = {}
+
+    # --- Files ---
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:05d}.dat")
+
+    def _segment_numbers(self):
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".dat"):
+                yield int(name[len("segment-"):-len(".dat")])
+
+    def _entries(self) -> int:
+        return os.path.getsize(self._index_path) // INDEX_ENTRY.size if os.path.exists(self._index_path) else 0
+
+    def _repair(self):
+        """Drops index entries that point past the end of their segment (an interrupted write)."""
+        entries = self._entries()
+        if not entries:
+            return
+        with open(self._index_path, "r+b") as f:
+            valid = entries
+            while valid:
+                f.seek((valid - 1) * INDEX_ENTRY.size)
+                _, segment, offset, length, _, _ = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                path = self._segment_path(segment)
+                if os.path.exists(path) and offset + length <= os.path.getsize(path):
+                    break
+                valid -= 1
+            f.truncate(valid * INDEX_ENTRY.size)
+
+    def _load_index(self):
+        self._index_map = None
+        self._mapped_entries = 0
+        entries = self._entries()
+        if not entries:
+            return
+        with open(self._index_path, "rb") as f:
+            self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for number, (key_hash, *_) in enumerate(INDEX_ENTRY.iter_unpack(self._index_map[:entries * INDEX_ENTRY.size])):
+            self._latest[key_hash] = number
+        self._mapped_entries = entries
+
+    def _entry(self, number: int) -> Tuple:
+        if self._index_map is None or number >= self._mapped_entries:
+            # Entries written since the index was mapped: remap to include them.
+            self._index_file.flush()
+            if self._index_map is not None:
+                self._index_map.close()
+            with open(self._index_path, "rb") as f:
+                self._index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_entries = len(self._index_map) // INDEX_ENTRY.size
+        return INDEX_ENTRY.unpack_from(self._index_map, number * INDEX_ENTRY.size)
+
+    # --- Compression ---
+    def _zstd(self):
+        """Returns the (compressor, decompressor) pair of the calling thread."""
+        codecs = self._codecs
+        if not hasattr(codecs, "compressor"):
+            codecs.compressor = zstandard.ZstdCompressor(level=self._compression_level)
+            codecs.decompressor = zstandard.ZstdDecompressor()
+        return codecs.compressor, codecs.decompressor
+
+    def _compress(self, body: bytes) -> bytes:
+        if self._codec == CODEC_ZSTD:
+            return self._zstd()[0].compress(body)
+        return zlib.compress(body, min(self._compression_level, 9))
+
+    def _decompress(self, data: bytes, codec: int) -> bytes:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ImportError("This archive contains zstd records; install the 'zstandard' package to read it.")
+            return self._zstd()[1].decompress(data)
+        return zlib.decompress(data)
+
+    # --- Writing ---
+    def put(self, endpoint: str, item_id: Any, body: Union[bytes, str, dict, list], timestamp: Optional[int] = None):
+        """
+        Stores one raw response body.
+
+        Args:
+            endpoint (str): A short name of the API endpoint, e.g. 'divar/post'.
+            item_id: The id of the requested item, e.g. the post token.
+            body: The raw response bytes (response.content). Text and parsed JSON are accepted too.
+            timestamp (int, optional): The fetch time. Defaults to now.
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        elif not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+        key = _key(endpoint, item_id)
+        compressed = self._compress(body)
+        record = RECORD_HEADER.pack(len(key), len(compressed), self._codec) + key + compressed
+
+        with self._lock:
+            if self._segment_file.tell() + len(record) > self.segment_size and self._segment_file.tell() > 0:
+                self._segment_file.close()
+                self._segment += 1
+                self._segment_file = open(self._segment_path(self._segment), "ab")
+
+            offset = self._segment_file.tell()
+            self._segment_file.write(record)
+            # The record must be on disk before the index entry that points to it.
+            self._segment_file.flush()
+            self._index_file.write(INDEX_ENTRY.pack(
+                _key_hash(key), self._segment, offset, len(record),
+                int(timestamp if timestamp is not None else time.time()), self._codec,
+            ))
+            self._index_file.flush()
+            self._latest[_key_hash(key)] = self._entries() - 1
+
+    # --- Reading ---
+    def _read_record(self, segment: int, offset: int, length: int) -> Tuple[bytes, bytes, int]:
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self._segment_path(segment), "rb")
+        reader.seek(offset)
+        data = reader.read(length)
+        key_length, body_length, codec = RECORD_HEADER.unpack_from(data)
+        start = RECORD_HEADER.size
+        return data[start:start + key_length], data[start + key_length:start + key_length + body_length], codec
+
+    def get(self, endpoint: str, item_id: Any) -> Optional[bytes]:
+        """Returns the latest raw body stored for (endpoint, id), or None."""
+        key = _key(endpoint, item_id)
+        with self._lock:
+            number = self._latest.get(_key_hash(key))
+            if number is None:
+                return None
+            _, segment, offset, length, _, _ = self._entry(number)
+            stored_key, data, codec = self._read_record(segment, offset, length)
+        if stored_key != key:
+            return None  # 64-bit hash collision
+        return self._decompress(data, codec)
+
+    def get_json(self, endpoint: str, item_id: Any) -> Optional[Any]:
+        body = self.get(endpoint, item_id)
+        return json.loads(body) if body is not None else None
+
+    def __contains__(self, endpoint_and_id: Tuple[str, Any]) -> bool:
+        return _key_hash(_key(*endpoint_and_id)) in self._latest
+
+    def __len__(self) -> int:
+        """The number of distinct (endpoint, id) pairs stored."""
+        return len(self._latest)
+
+    def scan(self, endpoint: Optional[str] = None, latest_only: bool = True) -> Iterator[Tuple[str, str, int, bytes]]:
+        """
+        Reads the archive sequentially, segment by segment.
+
+        Args:
+            endpoint (str, optional): Only yield records of this endpoint.
+            latest_only (bool): Skip versions that were stored again later.
+
+        Yields:
+            tuple: (endpoint, id, timestamp, raw body).
+        """
+        with self._lock:
+            self._segment_file.flush()
+            entries = self._entries()
+        prefix = _key(endpoint, "") if endpoint else None
+
+        current_segment, segment_file = None, None
+        try:
+            with open(self._index_path, "rb") as index:
+                for number in range(entries):
+                    key_hash, segment, offset, length, timestamp, _ = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+                    if latest_only and self._latest.get(key_hash) != number:
+                        continue
+                    if segment != current_segment:
+                        if segment_file:
+                            segment_file.close()
+                        segment_file = open(self._segment_path(segment), "rb")
+                        current_segment = segment
+                    # Records are read in write order, so this is a forward-only read.
+                    segment_file.seek(offset)
+                    data = segment_file.read(length)
+                    key_length, body_length, codec = RECORD_HEADER.unpack_from(data)
+                    key = data[RECORD_HEADER.size:RECORD_HEADER.size + key_length]
+                    if prefix and not key.startswith(prefix):
+                        continue
+                    record_endpoint, _, item_id = key.decode("utf-8").partition("\t")
+                    body = data[RECORD_HEADER.size + key_length:RECORD_HEADER.size + key_length + body_length]
+                    yield record_endpoint, item_id, timestamp, self._decompress(body, codec)
+        finally:
+            if segment_file:
+                segment_file.close()
+
+    def stats(self) -> dict:
+        """Returns the number of records and the stored size on disk."""
+        stored = sum(os.path.getsize(self._segment_path(n)) for n in self._segment_numbers())
+        return {"records": self._entries(), "distinct_keys": len(self), "stored_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._segment_file.close()
+            self._index_file.close()
+            if self._index_map is not None:
+                self._index_map.close()
+            for reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,220 @@
+"""
+Offline re-parsing of archived raw responses.
+
+Runs the current extractors of the stage scripts over everything stored in a
+RawArchive (see common/raw_archive.py) on a process pool, without any network
+access. The regenerated records are streamed to a JSON Lines file, compared with
+the output of a previous run and summarised in a throughput report.
+
+A record is identified by its endpoint, the archived item it was parsed from and
+its key inside that item: the same post or product appears on many archived
+search pages, and each occurrence is compared with the same occurrence of the
+previous run.
+
+Usage (from the repository root):
+    python -m common.reparse raw_archive reparsed.jsonl --previous old_reparsed.jsonl --workers 8
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common.raw_archive import RawArchive
+from common.stages import load_stage
+
+
+# --- Extractors: (item id, parsed raw response) -> [(output key, record), ...] ---
+def extract_divar_post(item_id: str, raw: dict) -> List[Tuple[str, Any]]:
+    simplified = load_stage("divar_scraper", "4_get_details_search.py").simplify_post_data(raw)
+    return [(item_id, simplified)] if simplified else []
+
+
+def extract_divar_search(item_id: str, raw: dict) -> List[Tuple[str, Any]]:
+    posts = load_stage("divar_scraper", "3_get_search.py").extract_post_data(raw)
+    return [(post["token"], post) for post in posts.values() if post.get("token")]
+
+
+def extract_jabama_keyword(item_id: str, raw: dict) -> List[Tuple[str, Any]]:
+    stage = load_stage("jabama_scraper", "3_execute_search.py")
+    items = raw.get("result", {}).get("items", [])
+    return [(item.get("id") or f"{item_id}#{i}", stage.clean_item(item)) for i, item in enumerate(items)]
+
+
+def extract_digikala_search(item_id: str, raw: dict) -> List[Tuple[str, Any]]:
+    stage = load_stage("digikala_scraper", "2_search.py")
+    products = (raw.get("data") or {}).get("products") or []
+    return [(product["id"], stage.clean_product(product)) for product in products if product.get("id") is not None]
+
+
+def extract_digikala_product(item_id: str, raw: dict) -> List[Tuple[str, Any]]:
+    stage = load_stage("digikala_scraper", "3_final_digikala.py")
+    product_info = (raw.get("data") or {}).get("product")
+    if not product_info:
+        return []
+    return [(item_id, {
+        "product_summary": stage.summarize_product(product_info),
+        "seller_offers": stage.extract_seller_offers(product_info),
+    })]
+
+
+EXTRACTORS = {
+    "divar/post": extract_divar_post,
+    "divar/search": extract_divar_search,
+    "jabama/keyword": extract_jabama_keyword,
+    "digikala/search": extract_digikala_search,
+    "digikala/product": extract_digikala_product,
+}
+
+
+def _parse_batch(batch: List[Tuple[str, str, bytes]]) -> Tuple[List[Tuple[str, str, str, Any]], int]:
+    """
+    Runs in a worker process: parses a batch of raw records.
+
+    Returns:
+        tuple: The (endpoint, item id, key, record) outputs and the number of records that failed to parse.
+    """
+    outputs, errors = [], 0
+    for endpoint, item_id, body in batch:
+        try:
+            for key, record in EXTRACTORS[endpoint](item_id, json.loads(body)):
+                outputs.append((endpoint, item_id, str(key), record))
+        except Exception:
+            errors += 1
+    return outputs, errors
+
+
+def _digest(record: Any) -> bytes:
+    return hashlib.blake2b(json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=16).digest()
+
+
+def load_previous_digests(filename: str) -> Dict[Tuple[str, str, str], bytes]:
+    """Reads the output of an earlier run and keeps only a digest of each (source, item, key) record."""
+    digests = {}
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            digests.setdefault((row["source"], row.get("item"), row["key"]), _digest(row["data"]))
+    return digests
+
+
+def _batches(archive: RawArchive, endpoints: Iterable[str], batch_size: int):
+    batch, batch_bytes = [], 0
+    for endpoint in endpoints:
+        for record_endpoint, item_id, _, body in archive.scan(endpoint):
+            batch.append((record_endpoint, item_id, body))
+            batch_bytes += len(body)
+            if len(batch) >= batch_size:
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+    if batch:
+        yield batch, batch_bytes
+
+
+def reparse_archive(
+    archive_dir: str,
+    output_filename: str,
+    previous_filename: Optional[str] = None,
+    endpoints: Optional[List[str]] = None,
+    workers: int = None,
+    batch_size: int = 500,
+    max_samples: int = 20,
+) -> Dict[str, Any]:
+    """
+    Re-runs the extractors over every archived raw response.
+
+    Args:
+        archive_dir (str): The RawArchive directory.
+        output_filename (str): The JSON Lines file to write; one {"source", "item", "key", "data"} object per line.
+        previous_filename (str, optional): The output of an earlier run to compare against.
+        endpoints (list, optional): Restrict the run to these endpoints. Defaults to all known extractors.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        batch_size (int): Number of raw records sent to a worker at once.
+        max_samples (int): Number of example keys listed per diff category.
+
+    Returns:
+        dict: The diff summary and the throughput report (also printed by the CLI).
+    """
+    endpoints = endpoints or list(EXTRACTORS)
+    previous = load_previous_digests(previous_filename) if previous_filename else None
+
+    diff = {"added": 0, "changed": 0, "unchanged": 0, "removed": 0}
+    samples = {"added": [], "changed": [], "removed": []}
+    seen = set()
+    stats = {"raw_records": 0, "raw_bytes": 0, "output_records": 0, "errors": 0}
+    started = time.time()
+
+    archive = RawArchive(archive_dir)
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor, \
+                open(output_filename, "w", encoding="utf-8") as output:
+            pending = []
+            batches = _batches(archive, endpoints, batch_size)
+
+            def collect(future, batch_records, batch_bytes):
+                outputs, errors = future.result()
+                stats["raw_records"] += batch_records
+                stats["raw_bytes"] += batch_bytes
+                stats["errors"] += errors
+                for endpoint, item_id, key, record in outputs:
+                    output.write(json.dumps({"source": endpoint, "item": item_id, "key": key, "data": record},
+                                            ensure_ascii=False) + "\n")
+                    stats["output_records"] += 1
+                    # A key repeated inside one item is compared once, on both sides (first occurrence).
+                    if previous is None or (endpoint, item_id, key) in seen:
+                        continue
+                    seen.add((endpoint, item_id, key))
+                    old_digest = previous.get((endpoint, item_id, key))
+                    category = "added" if old_digest is None else "unchanged" if old_digest == _digest(record) else "changed"
+                    diff[category] += 1
+                    if category in samples and len(samples[category]) < max_samples:
+                        samples[category].append(f"{endpoint}:{item_id}:{key}")
+
+            # Keep a bounded number of batches in flight so memory stays flat.
+            for batch, batch_bytes in batches:
+                pending.append((executor.submit(_parse_batch, batch), len(batch), batch_bytes))
+                if len(pending) >= workers * 2:
+                    collect(*pending.pop(0))
+            for item in pending:
+                collect(*item)
+    finally:
+        archive.close()
+
+    elapsed = time.time() - started
+    report = {
+        "throughput": {
+            **stats,
+            "elapsed_seconds": round(elapsed, 2),
+            "records_per_second": round(stats["raw_records"] / elapsed, 1) if elapsed else None,
+            "mb_per_second": round(stats["raw_bytes"] / elapsed / 1e6, 2) if elapsed else None,
+            "workers": workers,
+        }
+    }
+    if previous is not None:
+        removed = [key for key in previous if key not in seen]
+        diff["removed"] = len(removed)
+        samples["removed"] = [f"{endpoint}:{item_id}:{key}" for endpoint, item_id, key in removed[:max_samples]]
+        report["diff"] = {**diff, "samples": samples}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate outputs from archived raw responses.")
+    parser.add_argument("archive_dir")
+    parser.add_argument("output")
+    parser.add_argument("--previous", help="Output of an earlier run to diff against.")
+    parser.add_argument("--endpoint", action="append", choices=sorted(EXTRACTORS), help="Limit to an endpoint (repeatable).")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    report = reparse_archive(args.archive_dir, args.output, args.previous, args.endpoint, args.workers, args.batch_size)
+    print(json.dumps(report, ensure_ascii=False, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+# The repository root: the parent of this 'common' package.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_stage(source_dir: str, script_name: str):
+    """
+    Loads one of the numbered stage scripts (e.g. '4_get_details_search.py') as a module.
+
+    The stage scripts start with a digit, so they cannot be imported with a normal
+    'import' statement. The module is loaded once and cached in sys.modules.
+
+    Args:
+        source_dir (str): The client folder, e.g. 'divar_scraper'.
+        script_name (str): The file name of the stage script inside that folder.
+
+    Returns:
+        module: The loaded stage module.
+    """
+    module_name = f"{source_dir}._stage_{Path(script_name).stem}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    script_path = REPO_ROOT / source_dir / script_name
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load stage script: {script_path}")
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
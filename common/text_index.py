@@ -0,0 +1,344 @@
+"""
+Persian text normalisation and an on-disk inverted index for local full-text search.
+
+The index lives in a SQLite file. Every batch of added documents becomes a new
+posting segment: for each term, the sorted document ids of the batch are stored
+as delta-encoded, zlib-compressed uint32 arrays. Queries read only the postings
+of the requested terms (prefix queries use a range scan over the term B-tree),
+and compact() merges the segments of every term into one.
+
+Query syntax:
+    گیتار یاماها          both terms (AND)
+    گیتار OR ویولن        either clause
+    گیتار -برقی           exclude a term
+    لپ*                   every term starting with a prefix
+
+Usage (from the repository root):
+    python -m common.text_index add search.db divar-posts detail_posts.json
+    python -m common.text_index search search.db "گیتار یاماها"
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# --- Normalisation ---
+CHARACTER_MAP = str.maketrans({
+    "ي": "ی", "ى": "ی", "ئ": "ی",
+    "ك": "ک",
+    "ة": "ه", "ۀ": "ه",
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ؤ": "و",
+    "‌": " ",   # zero-width non-joiner: 'لپ‌تاپ' and 'لپ تاپ' give the same tokens
+    "ـ": "",    # tatweel
+    **{persian: str(digit) for digit, persian in enumerate("۰۱۲۳۴۵۶۷۸۹")},
+    **{arabic: str(digit) for digit, arabic in enumerate("٠١٢٣٤٥٦٧٨٩")},
+})
+DIACRITICS = re.compile(r"[ً-ٰٟ]")
+NON_WORD = re.compile(r"[^\w\s]|_")
+
+
+def normalize(text: Optional[str]) -> str:
+    """
+    Normalises Persian text for matching: Arabic letter forms become their Persian
+    equivalents, Persian/Arabic digits become Latin digits, diacritics and tatweel are
+    removed, punctuation becomes whitespace and Latin letters are lowercased.
+    """
+    text = DIACRITICS.sub("", (text or "").translate(CHARACTER_MAP)).lower()
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Splits normalised text into search terms."""
+    return normalize(text).split()
+
+
+# --- Documents of each source: record -> (key, title, text) ---
+def _divar_post(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    # simplify_post_data output has no token of its own: it comes from the keys of the file
+    # written by divar_scraper/batch.py ('_key') or from the "token" field of the pipeline output.
+    key = record.get("_key") or record.get("token")
+    if key is None:
+        raise ValueError("A Divar post record has no token: index the token -> post file of "
+                         "divar_scraper/batch.py, or records with a 'token' field.")
+    return key, record.get("title"), f"{record.get('title') or ''} {record.get('description') or ''}"
+
+
+def _divar_search(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    return record.get("token"), record.get("title"), f"{record.get('title') or ''} {record.get('district_persian') or ''}"
+
+
+def _jabama_listing(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    return record.get("place_id"), record.get("name"), f"{record.get('name') or ''} {record.get('description') or ''}"
+
+
+def _digikala_product(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    return record.get("id"), record.get("title_fa"), record.get("title_fa") or ""
+
+
+def _digikala_report(record: Dict[str, Any]) -> Tuple[str, str, str]:
+    summary = record.get("product_summary") or {}
+    return summary.get("id"), summary.get("name"), f"{summary.get('name') or ''} {summary.get('brand') or ''}"
+
+
+DOCUMENT_BUILDERS: Dict[str, Callable[[Dict[str, Any]], Tuple[str, str, str]]] = {
+    "divar-posts": _divar_post,
+    "divar-search": _divar_search,
+    "jabama-listings": _jabama_listing,
+    "digikala-products": _digikala_product,
+    "digikala-reports": _digikala_report,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id  INTEGER PRIMARY KEY,
+    source  TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    title   TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS documents_key ON documents (source, key);
+CREATE TABLE IF NOT EXISTS postings (
+    term     TEXT NOT NULL,
+    segment  INTEGER NOT NULL,
+    doc_ids  BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+"""
+
+
+def encode_postings(doc_ids: np.ndarray) -> bytes:
+    """Compresses a sorted array of document ids: delta encoding, then zlib."""
+    return zlib.compress(np.diff(doc_ids, prepend=0).astype(np.uint32).tobytes())
+
+
+def decode_postings(data: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(data), dtype=np.uint32), dtype=np.int64)
+
+
+class TextIndex:
+    """
+    An incrementally updated inverted index over documents from all three clients.
+
+    Documents are identified by (source, key); adding a document with a key that is
+    already indexed replaces the earlier version.
+    """
+
+    def __init__(self, path: str = "text_index.db"):
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._deleted = np.array(
+            [doc_id for (doc_id,) in self._conn.execute("SELECT doc_id FROM documents WHERE deleted = 1")],
+            dtype=np.int64,
+        )
+
+    # --- Indexing ---
+    def add_documents(self, documents: Iterable[Tuple[str, Any, Optional[str], str]]) -> int:
+        """
+        Adds a batch of documents as one new posting segment.
+
+        Args:
+            documents: (source, key, title, text) tuples.
+
+        Returns:
+            int: The number of documents added.
+        """
+        postings = defaultdict(list)
+        count = 0
+        with self._conn:
+            segment = self._conn.execute("SELECT COALESCE(MAX(segment), -1) + 1 FROM postings").fetchone()[0]
+            for source, key, title, text in documents:
+                if key is None:
+                    continue
+                key = str(key)
+                replaced = self._conn.execute(
+                    "UPDATE documents SET deleted = 1 WHERE source = ? AND key = ? AND deleted = 0", (source, key)
+                ).rowcount
+                if replaced:
+                    self._deleted = None  # reloaded lazily
+                doc_id = self._conn.execute(
+                    "INSERT INTO documents (source, key, title) VALUES (?, ?, ?)", (source, key, title)
+                ).lastrowid
+                for term in set(tokenize(text)):
+                    postings[term].append(doc_id)
+                count += 1
+
+            # Doc ids only grow, so every per-term list is already sorted.
+            self._conn.executemany(
+                "INSERT INTO postings (term, segment, doc_ids) VALUES (?, ?, ?)",
+                [(term, segment, encode_postings(np.asarray(ids, dtype=np.int64))) for term, ids in postings.items()],
+            )
+        return count
+
+    def add_records(self, source: str, records: Iterable[Dict[str, Any]]) -> int:
+        """Adds output records of one of the clients; 'source' is a key of DOCUMENT_BUILDERS."""
+        builder = DOCUMENT_BUILDERS[source]
+        return self.add_documents((source, *builder(record)) for record in records)
+
+    def compact(self):
+        """Merges all segments of every term into a single posting list."""
+        with self._conn:
+            terms = [term for (term,) in self._conn.execute(
+                "SELECT term FROM postings GROUP BY term HAVING COUNT(*) > 1")]
+            for term in terms:
+                merged = self._postings(term)
+                merged = merged[~np.isin(merged, self._deleted_ids())]
+                self._conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+                self._conn.execute("INSERT INTO postings (term, segment, doc_ids) VALUES (?, 0, ?)",
+                                   (term, encode_postings(merged)))
+
+    # --- Querying ---
+    def _deleted_ids(self) -> np.ndarray:
+        if self._deleted is None:
+            self._deleted = np.array(
+                [doc_id for (doc_id,) in self._conn.execute("SELECT doc_id FROM documents WHERE deleted = 1")],
+                dtype=np.int64,
+            )
+        return self._deleted
+
+    def _postings(self, term: str) -> np.ndarray:
+        rows = self._conn.execute("SELECT doc_ids FROM postings WHERE term = ? ORDER BY segment", (term,)).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        # Segments hold increasing doc id ranges, so concatenation keeps the list sorted.
+        return np.concatenate([decode_postings(data) for (data,) in rows])
+
+    def _prefix_postings(self, prefix: str) -> np.ndarray:
+        # Every term starting with 'prefix' sorts between prefix and prefix + the highest code point.
+        rows = self._conn.execute(
+            "SELECT doc_ids FROM postings WHERE term >= ? AND term < ?", (prefix, prefix + "\U0010ffff")
+        ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([decode_postings(data) for (data,) in rows]))
+
+    def _term_postings(self, word: str) -> np.ndarray:
+        if word.endswith("*"):
+            terms = tokenize(word[:-1])
+            if not terms:
+                return np.empty(0, dtype=np.int64)
+            # 'لپ تا*' style: all words but the last must match exactly.
+            result = self._prefix_postings(terms[-1])
+            for term in terms[:-1]:
+                result = np.intersect1d(result, self._postings(term), assume_unique=True)
+            return result
+
+        result = None
+        # A word like 'لپ‌تاپ' may normalise to several terms; all of them must match.
+        for term in tokenize(word):
+            postings = self._postings(term)
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+    def search_ids(self, query: str) -> np.ndarray:
+        """Evaluates a boolean query and returns the matching document ids in ascending order."""
+        matches = np.empty(0, dtype=np.int64)
+        for clause in re.split(r"\s+OR\s+", query.strip()):
+            include, exclude = [], []
+            for word in clause.split():
+                if word.startswith("-") and len(word) > 1:
+                    exclude.append(word[1:])
+                else:
+                    include.append(word)
+            if not include:
+                continue
+
+            # Intersect the shortest lists first.
+            lists = sorted((self._term_postings(word) for word in include), key=len)
+            result = lists[0]
+            for postings in lists[1:]:
+                if not len(result):
+                    break
+                result = np.intersect1d(result, postings, assume_unique=True)
+            for word in exclude:
+                result = np.setdiff1d(result, self._term_postings(word), assume_unique=True)
+            matches = np.union1d(matches, result)
+
+        return np.setdiff1d(matches, self._deleted_ids(), assume_unique=True)
+
+    def search(self, query: str, limit: Optional[int] = 20, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Runs a boolean query.
+
+        Args:
+            query (str): The query, see the module documentation for the syntax.
+            limit (int): The maximum number of results; the most recently added documents come first.
+            source (str, optional): Only return documents of this source.
+
+        Returns:
+            list: {"source", "key", "title"} dictionaries.
+        """
+        doc_ids = self.search_ids(query)[::-1]
+        results = []
+        for start in range(0, len(doc_ids), 500):
+            chunk = [int(doc_id) for doc_id in doc_ids[start:start + 500]]
+            rows = self._conn.execute(
+                f"SELECT doc_id, source, key, title FROM documents WHERE doc_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            by_id = {row[0]: row[1:] for row in rows}
+            for doc_id in chunk:
+                doc_source, key, title = by_id[doc_id]
+                if source is None or doc_source == source:
+                    results.append({"source": doc_source, "key": key, "title": title})
+                    if limit is not None and len(results) >= limit:
+                        return results
+        return results
+
+    def close(self):
+        self._conn.close()
+
+
+def _load_records(filename: str) -> List[Dict[str, Any]]:
+    """
+    Reads an output file of the clients: a list of records, a dictionary of records
+    (e.g. {"result_1": {...}} or {token: {...}}), in which case the key is kept as '_key',
+    or a JSON Lines file of records (the "output" of a pipeline stage, see common/pipeline.py).
+    """
+    with open(filename, encoding="utf-8") as f:
+        if filename.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    if isinstance(data, dict):
+        return [{"_key": key, **record} for key, record in data.items() if isinstance(record, dict)]
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local full-text search over collected data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Index an output JSON file.")
+    add_parser.add_argument("index")
+    add_parser.add_argument("source", choices=sorted(DOCUMENT_BUILDERS))
+    add_parser.add_argument("filename")
+
+    search_parser = subparsers.add_parser("search", help="Run a query.")
+    search_parser.add_argument("index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.add_argument("--source", choices=sorted(DOCUMENT_BUILDERS))
+
+    compact_parser = subparsers.add_parser("compact", help="Merge posting segments.")
+    compact_parser.add_argument("index")
+
+    args = parser.parse_args()
+    index = TextIndex(args.index)
+    if args.command == "add":
+        print(f"{index.add_records(args.source, _load_records(args.filename))} documents indexed.")
+    elif args.command == "search":
+        print(json.dumps(index.search(args.query, args.limit, args.source), ensure_ascii=False, indent=4))
+    elif args.command == "compact":
+        index.compact()
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
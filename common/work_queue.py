@@ -0,0 +1,281 @@
+import json
+import math
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.deadlines import Deadline
+
+# Item states stored in the 'items' table.
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    key           TEXT PRIMARY KEY,
+    payload       TEXT,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    owner         TEXT,
+    leased_at     REAL,
+    result        TEXT,
+    error         TEXT,
+    updated       REAL
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_expires);
+"""
+# Columns added after the first version of the schema, added to older queue files on open.
+ADDED_COLUMNS = {"owner": "TEXT", "leased_at": "REAL"}
+
+
+class WorkQueue:
+    """
+    A durable work queue stored in a single SQLite file.
+
+    Every item has a unique key (a Divar token, a Digikala product URL, ...) and
+    moves through the states pending -> leased -> done. A leased item whose lease
+    has expired (e.g. because the process crashed) is handed out again, while a
+    done item is never handed out a second time.
+
+    Completed results are buffered and written in batches of 'checkpoint_every'
+    items, so a crash loses at most one batch of work, which is then simply
+    re-leased on the next run. A buffered item is still leased in the file, so
+    the buffer is also written before the first of its leases (as taken by this
+    queue object) is about to expire; otherwise another worker could lease the
+    item again and redo it.
+    """
+
+    def __init__(
+        self,
+        path: str = "work_queue.db",
+        lease_seconds: float = 300,
+        max_attempts: int = 5,
+        checkpoint_every: int = 50,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.checkpoint_every = checkpoint_every
+        self._pending_writes: List[Tuple] = []
+        # Lease expiry of the items leased by this object, and the time by which the buffer must be written.
+        self._lease_expires: Dict[str, float] = {}
+        self._checkpoint_by = math.inf
+
+        # check_same_thread=False lets the queue be created in one thread and used in
+        # another; it is not meant for simultaneous use from several threads
+        # (run_queue keeps every queue call on the calling thread).
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """Adds the columns a queue file created by an older version is missing."""
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE items ADD COLUMN {column} {column_type}")
+
+    # --- Adding work ---
+    def enqueue(self, items: Iterable[Tuple[str, Any]]) -> int:
+        """
+        Adds (key, payload) pairs to the queue. Keys that already exist keep their state.
+
+        Returns:
+            int: The number of newly added items.
+        """
+        now = time.time()
+        rows = [(str(key), json.dumps(payload, ensure_ascii=False), now) for key, payload in items]
+        before = self._conn.total_changes
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (key, payload, updated) VALUES (?, ?, ?)", rows
+            )
+        return self._conn.total_changes - before
+
+    # --- Taking work ---
+    def lease(self, count: int = 1, owner: Optional[str] = None) -> List[Tuple[str, Any]]:
+        """
+        Leases up to 'count' items that are pending or whose lease has expired.
+
+        Args:
+            count (int): The maximum number of items to lease.
+            owner (str, optional): An identifier of the worker taking the items.
+
+        Returns:
+            list: A list of (key, payload) tuples.
+        """
+        now = time.time()
+        with self._conn:
+            # BEGIN IMMEDIATE keeps two processes sharing the file from leasing the same rows.
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Expired leases of items without attempts left will never be picked up again.
+            self._conn.execute(
+                "UPDATE items SET state = ?, lease_expires = NULL, updated = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                "SELECT key, payload FROM items "
+                "WHERE attempts < ? AND (state = ? OR (state = ? AND lease_expires < ?)) "
+                "ORDER BY attempts, rowid LIMIT ?",
+                (self.max_attempts, PENDING, LEASED, now, count),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE items SET state = ?, attempts = attempts + 1, lease_expires = ?, "
+                "owner = ?, leased_at = ?, updated = ? WHERE key = ?",
+                [(LEASED, now + self.lease_seconds, owner, now, now, key) for key, _ in rows],
+            )
+        self._lease_expires.update((key, now + self.lease_seconds) for key, _ in rows)
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    # --- Reporting results ---
+    def complete(self, key: str, result: Any = None):
+        """
+        Marks an item as done. The write is checkpointed with the next batch, or earlier
+        when less than a tenth of the lease time of a buffered item is left (see checkpoint_if_due).
+        """
+        self._pending_writes.append(
+            ("UPDATE items SET state = ?, result = ?, error = NULL, lease_expires = NULL, updated = ? WHERE key = ?",
+             (DONE, json.dumps(result, ensure_ascii=False), time.time(), key))
+        )
+        expires = self._lease_expires.pop(key, None)
+        if expires is not None:
+            self._checkpoint_by = min(self._checkpoint_by, expires - self.lease_seconds / 10)
+        if len(self._pending_writes) >= self.checkpoint_every:
+            self.checkpoint()
+        else:
+            self.checkpoint_if_due()
+
+    def fail(self, key: str, error: str = ""):
+        """
+        Returns an item to the queue, or marks it failed once it ran out of attempts.
+        Failures are written immediately so the item can be retried in the same run.
+        """
+        self._lease_expires.pop(key, None)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = ?, lease_expires = NULL, updated = ? WHERE key = ?",
+                (self.max_attempts, FAILED, PENDING, error, time.time(), key),
+            )
+
+    def release(self, key: str):
+        """
+        Puts a leased item back to pending without counting the attempt, e.g. when the batch
+        deadline passed before the item could be fetched.
+
+        lease() counts an attempt up front; release() refunds it (attempts - 1, never below 0),
+        so an item cut off by a deadline on every run never runs out of attempts. An item that
+        is not leased anymore (completed, failed or already released) is left unchanged.
+        """
+        self._lease_expires.pop(key, None)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE items SET state = ?, attempts = MAX(attempts - 1, 0), lease_expires = NULL, updated = ? "
+                "WHERE key = ? AND state = ?",
+                (PENDING, time.time(), key, LEASED),
+            )
+
+    def checkpoint(self):
+        """Writes all buffered results to disk in a single transaction."""
+        self._checkpoint_by = math.inf
+        if not self._pending_writes:
+            return
+        writes, self._pending_writes = self._pending_writes, []
+        with self._conn:
+            for statement, params in writes:
+                self._conn.execute(statement, params)
+
+    def checkpoint_if_due(self):
+        """Writes the buffered results if the lease of one of them is about to expire."""
+        if time.time() >= self._checkpoint_by:
+            self.checkpoint()
+
+    # --- Inspection ---
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of items in each state."""
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def results(self) -> Iterator[Tuple[str, Any]]:
+        """Yields (key, result) for every completed item."""
+        cursor = self._conn.execute("SELECT key, result FROM items WHERE state = ? ORDER BY rowid", (DONE,))
+        for key, result in cursor:
+            yield key, json.loads(result) if result is not None else None
+
+    def close(self):
+        self.checkpoint()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def run_queue(
+    queue: WorkQueue,
+    handler: Callable[[str, Any], Optional[Any]],
+    workers: int = 4,
+    batch_size: int = 20,
+    deadline: Optional[Deadline] = None,
+) -> Dict[str, int]:
+    """
+    Processes every available item of a queue with 'handler' until nothing is left,
+    or until the deadline passes; items not leased by then stay pending for the next run.
+
+    The handler receives (key, payload) and returns the result to store. A return
+    value of None (the convention used by the stage scripts for a failed request)
+    or a raised exception counts as a failed attempt, except after the deadline has
+    passed: the item is then put back to pending without using up an attempt.
+
+    Args:
+        queue (WorkQueue): The queue to drain.
+        handler (callable): The function that fetches one item.
+        workers (int): Number of worker threads.
+        batch_size (int): Number of items leased at a time.
+        deadline (Deadline, optional): Stop leasing new items once this deadline has passed
+            (see common/deadlines.py). The handler should pass it on to its requests.
+
+    Returns:
+        dict: The final number of items in each state.
+    """
+    def process(item):
+        key, payload = item
+        try:
+            return key, handler(key, payload), None
+        except Exception as e:
+            return key, None, str(e)
+
+    # While a slow item runs, the results buffered before it are checkpointed before their leases expire.
+    poll_seconds = max(queue.lease_seconds / 20, 0.01)
+
+    def outcomes(executor, batch):
+        futures = [executor.submit(process, item) for item in batch]
+        for future in futures:
+            while not wait([future], timeout=poll_seconds).done:
+                queue.checkpoint_if_due()
+            yield future.result()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while deadline is None or not deadline.expired():
+            batch = queue.lease(batch_size)
+            if not batch:
+                break
+            for key, result, error in outcomes(executor, batch):
+                if result is None and deadline is not None and deadline.expired():
+                    queue.release(key)
+                elif result is None:
+                    queue.fail(key, error or "empty result")
+                else:
+                    queue.complete(key, result)
+
+    queue.checkpoint()
+    return queue.counts()
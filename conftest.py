@@ -0,0 +1 @@
+# Puts the repository root on sys.path, so tests import the packages the way the tools run them (python -m ...).
@@ -1,7 +1,7 @@
 import requests
 import json
 
-def get_digikala_autocomplete_info(search_term: str) -> dict:
+def get_digikala_autocomplete_info(search_term: str, timeout: float = 10) -> dict:
     """
     اطلاعات تکمیل خودکار (autocomplete) را برای یک عبارت از API دیجی‌کالا دریافت می‌کند.
 
@@ -11,6 +11,7 @@ def get_digikala_autocomplete_info(search_term: str) -> dict:
 
     Args:
         search_term (str): کلمه یا عبارتی که می‌خواهید جستجو کنید.
+        timeout (float): حداکثر زمان انتظار برای پاسخ (ثانیه).
 
     Returns:
         dict: دیکشنری جامع حاوی اطلاعات استخراج شده.
@@ -24,7 +25,7 @@ def get_digikala_autocomplete_info(search_term: str) -> dict:
     }
 
     try:
-        response = requests.get(api_url, params=params, headers=headers, timeout=10)
+        response = requests.get(api_url, params=params, headers=headers, timeout=timeout)
         response.raise_for_status()
 
         data = response.json().get('data', {})
@@ -89,5 +90,4 @@ if __name__ == "__main__":
     # فراخوانی تابع
     autocomplete_data = get_digikala_autocomplete_info(query)
 
-    # Return the result for LLM consumption
-    return autocomplete_data
\ No newline at end of file
+    print(json.dumps(autocomplete_data, ensure_ascii=False, indent=4))
\ No newline at end of file
@@ -1,33 +1,57 @@
 import requests
 import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 # تنظیمات لاگ‌گیری برای نمایش بهتر خطاها و اطلاعات
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def search_digikala(query: str, page: int = 1, filters: Dict[str, Any] = None):
+def clean_product(product: Dict[str, Any]) -> Dict[str, Any]:
     """
-    محصولات را بر اساس یک عبارت و فیلترهای مشخص در سایت دیجی‌کالا جستجو می‌کند.
-
-    Args:
-        query (str): عبارت مورد نظر برای جستجو (مثلاً 'ماشین').
-        page (int): شماره صفحه نتایج. پیش‌فرض 1 است.
-        filters (dict, optional): دیکشنری شامل فیلترهای جستجو. مثال:
-            {
-                'price': {'min': 500000, 'max': 2000000}, # قیمت بین ۵۰۰ هزار تا ۲ میلیون تومان
-                'has_selling_stock': True,                  # فقط کالاهای موجود
-                'brands': [36599, 4841],                     # فیلتر بر اساس ID برند
-                'seller_types': ['digikala']                # فقط کالاهای فروشنده دیجی‌کالا
-            }
-
-    Returns:
-        list: لیستی از دیکشنری‌ها که هر کدام اطلاعات یک محصول را شامل می‌شود.
-              در صورت بروز خطا یا عدم وجود نتیجه، لیست خالی برمی‌گرداند.
+    اطلاعات یک محصول از فهرست 'data.products' پاسخ API جستجو را به ساختار ساده تبدیل می‌کند.
     """
+    default_variant = product.get('default_variant', {})
+    price_info = default_variant.get('price', {})
+    seller_info = default_variant.get('seller', {})
+    rating_info = product.get('rating', {})
     
-    api_url = "https://api.digikala.com/v1/search/"
+    product_uri = product.get('url', {}).get('uri', '')
+    product_url = f"https://www.digikala.com{product_uri}" if product_uri else "لینک ناموجود"
+
+    return {
+        'id': product.get('id'),
+        'title_fa': product.get('title_fa', 'بدون عنوان'),
+        'status': product.get('status', 'نامشخص'),
+        'image_url': product.get('images', {}).get('main', {}).get('url', [None])[0],
+        'product_page_url': product_url,
+        'price': {
+            'selling_price': price_info.get('selling_price', 0),
+            'rrp_price': price_info.get('rrp_price', 0),
+            'discount_percent': price_info.get('discount_percent', 0),
+        },
+        'rating': {
+            'rate': rating_info.get('rate', 0),
+            'count': rating_info.get('count', 0),
+        },
+        'seller': {
+            'name': seller_info.get('title', 'نامشخص'),
+            'url': seller_info.get('url', 'لینک ناموجود')
+        },
+        'digiclub_points': default_variant.get('digiclub', {}).get('point', 0)
+    }
+
+
+SEARCH_API_URL = "https://api.digikala.com/v1/search/"
+SEARCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
 
+
+def build_search_params(query: str, page: int = 1, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    پارامترهای درخواست جستجو را از عبارت، شماره صفحه و فیلترها می‌سازد
+    (قالب فیلترها در توضیحات search_digikala آمده است).
+    """
     # پارامترهای پایه
     params = {
         'q': query,
@@ -54,65 +78,127 @@ def search_digikala(query: str, page: int = 1, filters: Dict[str, Any] = None):
                 for i, item_id in enumerate(value):
                     params[f'{key}[{i}]'] = item_id
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    return params
 
-    logging.info(f"در حال ارسال درخواست برای جستجوی '{query}' در صفحه {page}...")
-    
+
+def _send_search_request(query: str, page: int, filters: Dict[str, Any], timeout: float, stream: bool = False):
+    """
+    درخواست جستجو را ارسال می‌کند؛ هر سه تابع جستجوی این فایل از آن استفاده می‌کنند.
+    در صورت بروز خطا پاسخ (در صورت وجود) بسته می‌شود تا اتصال آزاد شود.
+
+    Returns:
+        tuple: (params, response)، یا None در صورت بروز خطا.
+    """
+    params = build_search_params(query, page, filters)
+    response = None
     try:
-        response = requests.get(api_url, params=params, headers=headers)
+        response = requests.get(SEARCH_API_URL, params=params, headers=SEARCH_HEADERS, timeout=timeout, stream=stream)
         response.raise_for_status()
     except requests.exceptions.RequestException as e:
-        logging.error(f"خطا در برقراری ارتباط با سرور دیجی‌کالا: {e}")
-        return []
+        if response is not None:
+            response.close()
+        logging.error(f"خطا در برقراری ارتباط با سرور دیجی‌کالا (جستجوی '{query}'، صفحه {page}): {e}")
+        return None
+    return params, response
 
-    data = response.json()
 
-    if not data.get('data') or not data['data'].get('products'):
+def _read_search_data(response) -> Optional[Dict[str, Any]]:
+    """
+    شیء 'data' پاسخ جستجو را برمی‌گرداند، یا None اگر بدنه پاسخ JSON معتبر نباشد.
+    """
+    try:
+        return response.json().get('data') or {}
+    except ValueError as e:
+        logging.error(f"پاسخ دیجی‌کالا قابل خواندن نیست: {e}")
+        return None
+
+
+def open_search_stream(query: str, page: int = 1, filters: Dict[str, Any] = None, timeout: float = 15):
+    """
+    درخواست جستجو را بدون خواندن بدنه پاسخ ارسال می‌کند (برای صفحه‌های بزرگ).
+    فراخوان بدنه را به صورت جریانی می‌خواند (مثلاً با common/json_stream.py) و پاسخ را می‌بندد.
+
+    Returns:
+        requests.Response: پاسخ باز، یا None در صورت بروز خطا.
+    """
+    sent = _send_search_request(query, page, filters, timeout, stream=True)
+    return sent[1] if sent is not None else None
+
+
+def search_digikala(query: str, page: int = 1, filters: Dict[str, Any] = None, archive=None, timeout: float = 15):
+    """
+    محصولات را بر اساس یک عبارت و فیلترهای مشخص در سایت دیجی‌کالا جستجو می‌کند.
+
+    Args:
+        query (str): عبارت مورد نظر برای جستجو (مثلاً 'ماشین').
+        page (int): شماره صفحه نتایج. پیش‌فرض 1 است.
+        filters (dict, optional): دیکشنری شامل فیلترهای جستجو. مثال:
+            {
+                'price': {'min': 500000, 'max': 2000000}, # قیمت بین ۵۰۰ هزار تا ۲ میلیون تومان
+                'has_selling_stock': True,                  # فقط کالاهای موجود
+                'brands': [36599, 4841],                     # فیلتر بر اساس ID برند
+                'seller_types': ['digikala']                # فقط کالاهای فروشنده دیجی‌کالا
+            }
+        archive (RawArchive, optional): در صورت تعیین، پاسخ خام API در آرشیو ذخیره می‌شود
+            (common/raw_archive.py).
+        timeout (float): حداکثر زمان انتظار برای پاسخ (ثانیه).
+
+    Returns:
+        list: لیستی از دیکشنری‌ها که هر کدام اطلاعات یک محصول را شامل می‌شود.
+              در صورت عدم وجود نتیجه لیست خالی، و در صورت بروز خطا None برمی‌گرداند
+              (تا صف کار و درخواست‌های موازی خطا را از صفحه خالی تشخیص دهند).
+    """
+    logging.info(f"در حال ارسال درخواست برای جستجوی '{query}' در صفحه {page}...")
+    sent = _send_search_request(query, page, filters, timeout)
+    if sent is None:
+        return None
+    params, response = sent
+
+    if archive is not None:
+        archive.put('digikala/search', json.dumps(params, sort_keys=True, ensure_ascii=False), response.content)
+
+    data = _read_search_data(response)
+    if data is None:
+        return None
+
+    if not data.get('products'):
         logging.warning("هیچ محصولی برای این جستجو و فیلترها یافت نشد.")
         return []
 
-    products_list = data['data']['products']
+    products_list = data['products']
     cleaned_products = []
     
     logging.info(f"تعداد {len(products_list)} محصول یافت شد. در حال پردازش اطلاعات...")
 
     for product in products_list:
-        default_variant = product.get('default_variant', {})
-        price_info = default_variant.get('price', {})
-        seller_info = default_variant.get('seller', {})
-        rating_info = product.get('rating', {})
-        
-        product_uri = product.get('url', {}).get('uri', '')
-        product_url = f"https://www.digikala.com{product_uri}" if product_uri else "لینک ناموجود"
-
-        cleaned_product_data = {
-            'id': product.get('id'),
-            'title_fa': product.get('title_fa', 'بدون عنوان'),
-            'status': product.get('status', 'نامشخص'),
-            'image_url': product.get('images', {}).get('main', {}).get('url', [None])[0],
-            'product_page_url': product_url,
-            'price': {
-                'selling_price': price_info.get('selling_price', 0),
-                'rrp_price': price_info.get('rrp_price', 0),
-                'discount_percent': price_info.get('discount_percent', 0),
-            },
-            'rating': {
-                'rate': rating_info.get('rate', 0),
-                'count': rating_info.get('count', 0),
-            },
-            'seller': {
-                'name': seller_info.get('title', 'نامشخص'),
-                'url': seller_info.get('url', 'لینک ناموجود')
-            },
-            'digiclub_points': default_variant.get('digiclub', {}).get('point', 0)
-        }
-        cleaned_products.append(cleaned_product_data)
+        cleaned_products.append(clean_product(product))
 
     return cleaned_products
 
 
+def search_digikala_page(query: str, page: int = 1, filters: Dict[str, Any] = None, timeout: float = 15):
+    """
+    یک صفحه از نتایج جستجو را همراه با اطلاعات صفحه‌بندی (pager) برمی‌گرداند؛
+    برای برنامه‌ریزی تقسیم جستجو به بازه‌های قیمت (price_bands.py) لازم است.
+
+    Returns:
+        dict: {'products': [...], 'total_items': int, 'total_pages': int}،
+              یا None در صورت بروز خطا.
+    """
+    sent = _send_search_request(query, page, filters, timeout)
+    data = _read_search_data(sent[1]) if sent is not None else None
+    if data is None:
+        return None
+
+    products = [clean_product(product) for product in data.get('products') or []]
+    pager = data.get('pager') or {}
+    return {
+        'products': products,
+        'total_items': pager.get('total_items', len(products)),
+        'total_pages': pager.get('total_pages', 1),
+    }
+
+
 
 # Start-------------------------------------------------------------------------------------------
 if __name__ == "__main__":
@@ -3,7 +3,7 @@
 import requests
 import json
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Callable, List, Optional
 
 # --- Constants ---
 API_V1_BASE_URL = "https://api.digikala.com/v1/"
@@ -11,13 +11,62 @@ API_V2_BASE_URL = "https://api.digikala.com/v2/"
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
 
-def product_details(product_url: str) -> Optional[Dict[str, Any]]:
+def summarize_product(product_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Builds the product summary from the 'data.product' object of the v2 product API.
+    """
+    main_variant = product_info.get('default_variant', {})
+    
+    colors_list = product_info.get('colors')
+    available_colors_str = " - ".join([c.get('title', '') for c in colors_list]) if colors_list else "Not specified"
+        
+    stats = main_variant.get('statistics', {})
+    keys_to_remove = {"is_incredible", "is_promotion", "is_locked_for_digiplus", "bnpl_active"}
+    filtered_stats = {k: v for k, v in stats.items() if k not in keys_to_remove} if stats else {}
+    
+    return {
+        "name": product_info.get('title_fa'),
+        "id": product_info.get('id'),
+        "category": product_info.get('category', {}).get('title_fa'),
+        "brand": product_info.get('brand', {}).get('title_fa'),
+        "price_info": main_variant.get('price'),
+        "available_colors": available_colors_str,
+        "statistics": filtered_stats
+    }
+
+
+def extract_seller_offers(product_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Builds the list of offers, one per seller, from the variants of a product.
+    """
+    unique_offers = []
+    seen_sellers = set()
+    for variant in product_info.get('variants', []):
+        seller_name = variant.get('seller', {}).get('title')
+        if seller_name and seller_name not in seen_sellers:
+            unique_offers.append({
+                "seller_name": seller_name,
+                "price": variant.get('price', {}).get('selling_price'),
+                "warranty": variant.get('warranty', {}).get('title_fa'),
+                "shipping_info": variant.get('shipment_methods', {}).get('description'),
+            })
+            seen_sellers.add(seller_name)
+    return unique_offers
+
+
+def product_details(product_url: str, archive=None, timeout: float = 15,
+                    call: Optional[Callable[[str, Callable[[float], Any]], Any]] = None) -> Optional[Dict[str, Any]]:
     """
     Generates a complete product report from a Digikala URL.
     This function runs silently and only prints output if an error occurs.
 
     Args:
         product_url: The URL of the Digikala product page.
+        archive: Optional RawArchive (common/raw_archive.py) that receives every raw response.
+        timeout: The timeout of each request in seconds.
+        call: Optional wrapper for each of the three GET requests, called as
+            call(endpoint, send) where send(timeout) returns the response or None
+            (e.g. a hedged call bounded by a batch deadline, see common/deadlines.py).
 
     Returns:
         A dictionary containing the full product report, or None if a critical error occurs.
@@ -29,12 +78,30 @@ def product_details(product_url: str) -> Optional[Dict[str, Any]]:
         return None
     product_id = match.group(1)
 
+    headers = {'User-Agent': USER_AGENT}
+    errors = {}
+
+    def get(endpoint: str, url: str, params: Optional[Dict[str, Any]] = None):
+        def send(request_timeout: float):
+            try:
+                response = requests.get(url, params=params, headers=headers, timeout=request_timeout)
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                errors[endpoint] = e
+                return None
+
+        response = call(endpoint, send) if call is not None else send(timeout)
+        if response is None:
+            raise requests.exceptions.RequestException(errors.get(endpoint, "no time left before the deadline"))
+        return response
+
     # --- 2. Fetch Main Product and Seller Data (v2 API) ---
     product_api_url = f"{API_V2_BASE_URL}product/{product_id}/"
-    headers = {'User-Agent': USER_AGENT}
     try:
-        response = requests.get(product_api_url, headers=headers, timeout=15)
-        response.raise_for_status()
+        response = get("digikala/product", product_api_url)
+        if archive is not None:
+            archive.put("digikala/product", product_id, response.content)
         product_data = response.json()
     except requests.exceptions.RequestException as e:
         print(f"[Error] Failed to fetch main product data. Reason: {e}")
@@ -47,38 +114,10 @@ def product_details(product_url: str) -> Optional[Dict[str, Any]]:
     product_info = product_data['data']['product']
 
     # --- 3. Process Product Details ---
-    main_variant = product_info.get('default_variant', {})
-    
-    colors_list = product_info.get('colors')
-    available_colors_str = " - ".join([c.get('title', '') for c in colors_list]) if colors_list else "Not specified"
-        
-    stats = main_variant.get('statistics', {})
-    keys_to_remove = {"is_incredible", "is_promotion", "is_locked_for_digiplus", "bnpl_active"}
-    filtered_stats = {k: v for k, v in stats.items() if k not in keys_to_remove} if stats else {}
-    
-    product_summary = {
-        "name": product_info.get('title_fa'),
-        "id": product_info.get('id'),
-        "category": product_info.get('category', {}).get('title_fa'),
-        "brand": product_info.get('brand', {}).get('title_fa'),
-        "price_info": main_variant.get('price'),
-        "available_colors": available_colors_str,
-        "statistics": filtered_stats
-    }
+    product_summary = summarize_product(product_info)
 
     # --- 4. Process Seller Offers ---
-    unique_offers = []
-    seen_sellers = set()
-    for variant in product_info.get('variants', []):
-        seller_name = variant.get('seller', {}).get('title')
-        if seller_name and seller_name not in seen_sellers:
-            unique_offers.append({
-                "seller_name": seller_name,
-                "price": variant.get('price', {}).get('selling_price'),
-                "warranty": variant.get('warranty', {}).get('title_fa'),
-                "shipping_info": variant.get('shipment_methods', {}).get('description'),
-            })
-            seen_sellers.add(seller_name)
+    unique_offers = extract_seller_offers(product_info)
 
     # --- 5. Fetch and Process User Feedback (v1 API) ---
     user_feedback = {"comments": [], "questions": []}
@@ -86,8 +125,9 @@ def product_details(product_url: str) -> Optional[Dict[str, Any]]:
     # Fetch comments
     try:
         comments_api_url = f"{API_V1_BASE_URL}rate-review/products/{product_id}/"
-        response = requests.get(comments_api_url, params={'page': 1}, headers=headers, timeout=15)
-        response.raise_for_status()
+        response = get("digikala/comments", comments_api_url, {'page': 1})
+        if archive is not None:
+            archive.put("digikala/comments", f"{product_id}:1", response.content)
         comments_data = response.json()
         if comments_data and 'data' in comments_data:
             raw_comments = (comments_data.get('data', {}).get('comments', []))[:10]
@@ -98,8 +138,9 @@ def product_details(product_url: str) -> Optional[Dict[str, Any]]:
     # Fetch questions
     try:
         questions_api_url = f"{API_V1_BASE_URL}product/{product_id}/questions/"
-        response = requests.get(questions_api_url, headers=headers, timeout=15)
-        response.raise_for_status()
+        response = get("digikala/questions", questions_api_url)
+        if archive is not None:
+            archive.put("digikala/questions", f"{product_id}:1", response.content)
         questions_data = response.json()
         if questions_data and 'data' in questions_data:
             all_raw_questions = questions_data.get('data', {}).get('questions', [])
@@ -0,0 +1,103 @@
+import json
+from typing import Any, Dict, Iterable
+
+import requests
+
+from common.deadlines import Deadline, hedged_call, request_timeout
+from common.json_stream import iter_response_items
+from common.stages import load_stage
+from common.work_queue import WorkQueue, run_queue
+
+search_stage = load_stage("digikala_scraper", "2_search.py")
+report_stage = load_stage("digikala_scraper", "3_final_digikala.py")
+
+
+def fetch_search_page(key: str, payload: Dict[str, Any], archive=None, deadline: Deadline = None):
+    """
+    Fetches one search results page. The payload holds the arguments of search_digikala:
+    {"query": ..., "page": ..., "filters": ...}. Slow requests are hedged.
+    Returns None if the request failed (the item is retried) and [] for a page without results.
+
+    With "stream": true in the payload, the page is parsed incrementally (common/json_stream.py)
+    instead of being hedged, unless an archive (which needs the raw body) is given.
+    """
+    if payload.get("stream") and archive is None:
+        timeout = request_timeout(deadline, 15)
+        if timeout is None:
+            return None
+        response = search_stage.open_search_stream(
+            payload["query"], page=payload.get("page", 1), filters=payload.get("filters"), timeout=timeout
+        )
+        if response is None:
+            return None
+        try:
+            products = iter_response_items(response, "data.products", deadline=deadline)
+            return [search_stage.clean_product(product) for product in products]
+        except (ValueError, TimeoutError, requests.exceptions.RequestException):
+            return None
+    return hedged_call(
+        "digikala/search",
+        lambda timeout: search_stage.search_digikala(
+            payload["query"], page=payload.get("page", 1), filters=payload.get("filters"), archive=archive,
+            timeout=timeout,
+        ),
+        deadline,
+    )
+
+
+def fetch_product_report(product_url: str, payload: Any = None, archive=None, deadline: Deadline = None):
+    """
+    Generates the report for one product URL. Returns None on failure. Each of its GET requests
+    is hedged on its own and gets the time left before the deadline.
+    """
+    return report_stage.product_details(
+        product_url, archive, call=lambda endpoint, send: hedged_call(endpoint, send, deadline)
+    )
+
+
+def crawl_product_reports(
+    product_urls: Iterable[str],
+    queue_path: str = "digikala_reports_queue.db",
+    workers: int = 4,
+    checkpoint_every: int = 50,
+    archive=None,
+    deadline_seconds: float = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Generates reports for many products through a durable work queue.
+
+    Re-running with the same 'queue_path' after a crash resumes the batch:
+    completed products are not fetched again.
+
+    Args:
+        product_urls: Digikala product page URLs (e.g. 'product_page_url' from 2_search.py).
+        queue_path: The SQLite file used as the work queue.
+        workers: Number of products fetched in parallel.
+        checkpoint_every: Number of completed reports written to disk at once.
+        archive: Optional RawArchive that keeps every raw response.
+        deadline_seconds: Optional time limit for the whole crawl; products not fetched by then
+            stay in the queue for the next run.
+
+    Returns:
+        A dictionary mapping each product URL to its report.
+    """
+    with WorkQueue(queue_path, checkpoint_every=checkpoint_every) as queue:
+        queue.enqueue((url, None) for url in product_urls if url)
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        run_queue(
+            queue,
+            lambda url, payload: fetch_product_report(url, payload, archive, deadline),
+            workers=workers,
+            deadline=deadline,
+        )
+        return dict(queue.results())
+
+
+if __name__ == "__main__":
+    # The output of 2_search.py
+    with open("digikala_filtered_results.json", encoding="utf-8") as f:
+        search_results = json.load(f)
+
+    reports = crawl_product_reports(p.get("product_page_url") for p in search_results)
+    with open("digikala_reports.json", "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=4)
@@ -0,0 +1,257 @@
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import requests
+
+from common.deadlines import Deadline, hedged_call
+
+# --- Constants ---
+API_V1_BASE_URL = "https://api.digikala.com/v1/"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# A failed page is requested again this many times, 'RETRY_DELAY' * attempt seconds apart.
+PAGE_RETRIES = 2
+RETRY_DELAY = 1.0
+# The comment order that the 'since' early stop relies on.
+NEWEST_FIRST = {'sort': 'created_at'}
+
+PERSIAN_MONTHS = {
+    "فروردین": 1, "اردیبهشت": 2, "خرداد": 3, "تیر": 4, "مرداد": 5, "شهریور": 6,
+    "مهر": 7, "آبان": 8, "آذر": 9, "دی": 10, "بهمن": 11, "اسفند": 12,
+}
+PERSIAN_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+
+def parse_persian_date(text: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """
+    Converts a date such as '۲۴ آذر ۱۴۰۲' (the 'created_at' format of comments) to (1402, 9, 24).
+    Returns None if the text cannot be parsed.
+    """
+    if not text:
+        return None
+    match = re.search(r"(\d{1,2})\s+(\S+)\s+(\d{4})", text.translate(PERSIAN_DIGITS))
+    if not match or match.group(2) not in PERSIAN_MONTHS:
+        return None
+    return int(match.group(3)), PERSIAN_MONTHS[match.group(2)], int(match.group(1))
+
+
+def _fetch_page(url: str, page: int, archive=None, archive_endpoint: str = "", archive_id: str = "",
+                deadline: Optional[Deadline] = None, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Fetches one page of a paginated v1 endpoint and returns its 'data' object.
+    Pages slower than usual are hedged (see common/deadlines.py) and failed pages are retried.
+
+    Raises:
+        requests.exceptions.RequestException: If the page still fails after PAGE_RETRIES retries
+            or the deadline passes first.
+    """
+    def fetch(timeout: float):
+        try:
+            response = requests.get(url, params={**(params or {}), 'page': page}, headers={'User-Agent': USER_AGENT},
+                                    timeout=timeout)
+            response.raise_for_status()
+            if archive is not None:
+                archive.put(archive_endpoint, f"{archive_id}:{page}", response.content)
+            return response.json().get('data') or {}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"[API Warning] Could not fetch page {page} of {url}. Reason: {e}")
+            return None
+
+    for attempt in range(PAGE_RETRIES + 1):
+        if attempt:
+            delay = RETRY_DELAY * attempt
+            if deadline is not None and deadline.remaining() <= delay:
+                break
+            time.sleep(delay)
+        data = hedged_call(archive_endpoint, fetch, deadline)
+        if data is not None:
+            return data
+    raise requests.exceptions.RequestException(f"Page {page} of {url} could not be fetched; the stream is incomplete")
+
+
+def _iter_pages(url: str, prefetch: int, archive, archive_endpoint: str, archive_id: str,
+                deadline: Optional[Deadline] = None, params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the 'data' object of every page, in order.
+
+    Page 1 is fetched first to learn the total number of pages; the remaining pages
+    are then fetched concurrently, at most 'prefetch' pages ahead of the consumer, so
+    memory stays bounded no matter how many pages the product has. Pending requests
+    are cancelled when the consumer stops early. A page that cannot be fetched ends
+    the stream with the RequestException of _fetch_page instead of being skipped.
+    """
+    first_page = _fetch_page(url, 1, archive, archive_endpoint, archive_id, deadline, params)
+    yield first_page
+
+    total_pages = (first_page.get('pager') or {}).get('total_pages') or 1
+    if total_pages <= 1:
+        return
+
+    executor = ThreadPoolExecutor(max_workers=prefetch)
+    try:
+        pages = iter(range(2, total_pages + 1))
+        window = [executor.submit(_fetch_page, url, page, archive, archive_endpoint, archive_id, deadline, params)
+                  for page in _take(pages, prefetch)]
+        while window:
+            data = window.pop(0).result()
+            for page in _take(pages, 1):
+                window.append(executor.submit(_fetch_page, url, page, archive, archive_endpoint, archive_id,
+                                              deadline, params))
+            yield data
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _take(iterator: Iterator[int], count: int):
+    for _ in range(count):
+        value = next(iterator, None)
+        if value is None:
+            return
+        yield value
+
+
+def iter_comments(
+    product_id: int,
+    max_items: Optional[int] = None,
+    since: Optional[Tuple[int, int, int]] = None,
+    min_rating: Optional[float] = None,
+    max_rating: Optional[float] = None,
+    stop_when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    prefetch: int = 4,
+    archive=None,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streams every comment of a product, page by page.
+
+    Args:
+        product_id: The Digikala product id (the number after 'dkp-').
+        max_items: Stop after yielding this many comments.
+        since: A Jalali date (year, month, day). Comments older than this date are skipped; the
+            pages are then requested newest first, and the stream stops after a page whose dated
+            comments are all older (a few comments out of order, e.g. pinned ones, do not end it).
+        min_rating / max_rating: Only yield comments whose rating is within these bounds.
+        stop_when: A custom predicate; the stream stops at the first raw comment for which it returns True.
+        prefetch: Number of pages requested concurrently ahead of the consumer.
+        archive: Optional RawArchive (common/raw_archive.py) that receives every raw page.
+        deadline: Optional Deadline (common/deadlines.py); pages are not requested after it has passed.
+
+    Yields:
+        A dictionary per comment: body, title, rating, created_at, likes and dislikes.
+
+    Raises:
+        requests.exceptions.RequestException: If a page cannot be fetched (see _fetch_page).
+    """
+    url = f"{API_V1_BASE_URL}rate-review/products/{product_id}/"
+    params, archive_id = None, str(product_id)
+    if since is not None:
+        # Pages of another order are archived under their own ids.
+        params, archive_id = NEWEST_FIRST, f"{product_id}:newest"
+    yielded = 0
+    for data in _iter_pages(url, prefetch, archive, "digikala/comments", archive_id, deadline, params):
+        dated = older = 0
+        for comment in data.get('comments') or []:
+            if stop_when is not None and stop_when(comment):
+                return
+            created = parse_persian_date(comment.get('created_at'))
+            if since is not None and created is not None:
+                dated += 1
+                if created < since:
+                    older += 1
+                    continue
+
+            rating = comment.get('rate')
+            if min_rating is not None and (rating is None or rating < min_rating):
+                continue
+            if max_rating is not None and (rating is None or rating > max_rating):
+                continue
+
+            reactions = comment.get('reactions') or {}
+            yield {
+                "body": comment.get('body'),
+                "title": comment.get('title'),
+                "rating": rating,
+                "created_at": comment.get('created_at'),
+                "likes": reactions.get('likes'),
+                "dislikes": reactions.get('dislikes'),
+            }
+            yielded += 1
+            if max_items is not None and yielded >= max_items:
+                return
+        if dated and older == dated:
+            return
+
+
+def iter_questions(
+    product_id: int,
+    max_items: Optional[int] = None,
+    answered_only: bool = True,
+    stop_when: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    prefetch: int = 4,
+    archive=None,
+    deadline: Optional[Deadline] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streams every question of a product, page by page.
+
+    Args:
+        product_id: The Digikala product id.
+        max_items: Stop after yielding this many questions.
+        answered_only: Skip questions without answers (as product_details does).
+        stop_when: A custom predicate; the stream stops at the first raw question for which it returns True.
+        prefetch: Number of pages requested concurrently ahead of the consumer.
+        archive: Optional RawArchive that receives every raw page.
+        deadline: Optional Deadline; pages are not requested after it has passed.
+
+    Yields:
+        A dictionary per question: the question text and the texts of all its answers.
+
+    Raises:
+        requests.exceptions.RequestException: If a page cannot be fetched (see _fetch_page).
+    """
+    url = f"{API_V1_BASE_URL}product/{product_id}/questions/"
+    yielded = 0
+    for data in _iter_pages(url, prefetch, archive, "digikala/questions", str(product_id), deadline):
+        for question in data.get('questions') or []:
+            if stop_when is not None and stop_when(question):
+                return
+            answer_texts = [ans.get('text') for ans in question.get('answers') or [] if ans.get('text')]
+            if answered_only and not answer_texts:
+                continue
+
+            yield {"question": question.get('text'), "created_at": question.get('created_at'), "answers": answer_texts}
+            yielded += 1
+            if max_items is not None and yielded >= max_items:
+                return
+
+
+def save_feedback_stream(product_id: int, filename: str, **options) -> Dict[str, int]:
+    """
+    Writes all comments and questions of a product to a JSON Lines file as they arrive.
+    Extra keyword arguments are passed to iter_comments; max_items, prefetch, archive and
+    deadline are passed to iter_questions as well.
+
+    Returns:
+        The number of comments and questions written, and "complete": False if a page of
+        either stream could not be fetched (the file then holds what came before it).
+    """
+    question_options = {key: options[key] for key in ("max_items", "prefetch", "archive", "deadline") if key in options}
+    counts = {"comments": 0, "questions": 0, "complete": True}
+    with open(filename, 'w', encoding='utf-8') as f:
+        for kind, stream in (("comment", lambda: iter_comments(product_id, **options)),
+                             ("question", lambda: iter_questions(product_id, **question_options))):
+            try:
+                for record in stream():
+                    f.write(json.dumps({"type": kind, **record}, ensure_ascii=False) + "\n")
+                    counts[f"{kind}s"] += 1
+            except requests.exceptions.RequestException as e:
+                print(f"[API Warning] The {kind}s of product {product_id} are incomplete. Reason: {e}")
+                counts["complete"] = False
+    return counts
+
+
+if __name__ == "__main__":
+    save_feedback_stream(390759, "digikala_feedback_390759.jsonl", since=(1402, 1, 1))
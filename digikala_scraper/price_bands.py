@@ -0,0 +1,177 @@
+import argparse
+import json
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.deadlines import Deadline, hedged_call
+from common.stages import load_stage
+
+search_stage = load_stage("digikala_scraper", "2_search.py")
+
+# The search API does not serve pages past this one, whatever the number of results.
+DEFAULT_PAGE_CAP = 100
+
+
+def split_range(low: int, high: int, parts: int) -> List[Tuple[int, int]]:
+    """
+    Splits the price range [low, high] into up to 'parts' adjacent ranges with integer bounds.
+
+    Prices are spread over orders of magnitude, so the cut points are spaced geometrically:
+    a range of 1,000 to 1,000,000 split in 3 gives about 1,000-10,000, 10,000-100,000 and
+    100,000-1,000,000. When the geometric cuts collapse on a narrow range, the range is bisected,
+    so any range of more than one price is always split.
+    """
+    if high <= low or parts < 2:
+        return [(low, high)]
+    start = max(low, 1)
+    cuts = []
+    if high > start:
+        ratio = (high / start) ** (1 / parts)
+        cuts = sorted(cut for cut in {int(round(start * ratio ** i)) for i in range(1, parts)} if low < cut <= high)
+    if not cuts:
+        cuts = [(low + high) // 2 + 1]
+    edges = [low] + cuts + [high + 1]
+    return [(edges[i], edges[i + 1] - 1) for i in range(len(edges) - 1)]
+
+
+class PriceBandCrawler:
+    """
+    Collects every result of a broad Digikala search despite the page cap of the API.
+
+    The query is split recursively into price bands with the price[min] / price[max]
+    filters until every band has few enough results to be read within the page cap.
+    The first page of a band is fetched to learn its number of results, and it is
+    kept as the band's first page, so only the probes of bands that had to be split
+    again are extra requests. The bands are then crawled concurrently and products
+    are merged by id.
+
+    Products without a price cannot be matched by a price filter, so they are not
+    reached through the bands.
+
+    Args:
+        query: The search phrase.
+        filters: Other filters of search_digikala (2_search.py); a 'price' entry is replaced.
+        page_cap: The last page the API serves.
+        workers: Number of requests in flight.
+        deadline_seconds: Optional time limit for the whole crawl.
+    """
+
+    def __init__(self, query: str, filters: Optional[Dict[str, Any]] = None, page_cap: int = DEFAULT_PAGE_CAP,
+                 workers: int = 8, deadline_seconds: Optional[float] = None):
+        self.query = query
+        self.filters = {key: value for key, value in (filters or {}).items() if key != "price"}
+        self.page_cap = page_cap
+        self.workers = workers
+        self.deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _fetch(self, band: Tuple[int, int], page: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.requests += 1
+        filters = {**self.filters, "price": {"min": band[0], "max": band[1]}}
+        return hedged_call(
+            "digikala/search",
+            lambda timeout: search_stage.search_digikala_page(self.query, page, filters, timeout),
+            self.deadline,
+        )
+
+    def _pages(self, first_page: Dict[str, Any]) -> Tuple[int, int]:
+        """Returns the number of pages a band needs and the number the API serves for it."""
+        page_size = len(first_page["products"])
+        if not page_size or first_page["total_items"] <= page_size:
+            return 1, 1
+        needed = math.ceil(first_page["total_items"] / page_size)
+        return needed, min(self.page_cap, max(first_page["total_pages"], 1))
+
+    def plan(self, min_price: int = 0, max_price: int = 10 ** 10) -> List[Dict[str, Any]]:
+        """
+        Splits the price range into bands that each fit within the page cap.
+
+        A band that does not fit is split into about twice as many parts as its results
+        need, so most parts fit at the next level and few probes are repeated.
+
+        Returns:
+            list: One {"min", "max", "total_items", "pages", "complete", "first_page"} entry per band,
+                ordered by price. "complete" is False for a band that still exceeds the cap but
+                cannot be split further (a single price), or whose probe failed ("first_page" None).
+        """
+        bands = []
+        pending = [(min_price, max_price)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending:
+                probes = list(zip(pending, executor.map(lambda band: self._fetch(band, 1), pending)))
+                pending = []
+                for band, first_page in probes:
+                    if first_page is None:
+                        bands.append({"min": band[0], "max": band[1], "total_items": None, "pages": 0,
+                                      "complete": False, "first_page": None})
+                        continue
+                    needed, served = self._pages(first_page)
+                    if needed > served and band[1] > band[0]:
+                        capacity = served * len(first_page["products"])
+                        parts = split_range(band[0], band[1], math.ceil(2 * first_page["total_items"] / capacity))
+                        # split_range always splits a band of more than one price; the guard keeps a
+                        # band that could not be split from being probed forever.
+                        if len(parts) > 1:
+                            pending.extend(parts)
+                            continue
+                    bands.append({"min": band[0], "max": band[1], "total_items": first_page["total_items"],
+                                  "pages": min(needed, served), "complete": needed <= served,
+                                  "first_page": first_page["products"]})
+        return sorted(bands, key=lambda band: band["min"])
+
+    def crawl(self, min_price: int = 0, max_price: int = 10 ** 10) -> Dict[str, Any]:
+        """
+        Plans the bands, then fetches the remaining pages of every band concurrently.
+
+        Returns:
+            dict: {"products": [...] (unique by id), "bands": [...] (without their pages),
+                "requests": number of requests sent, "complete": True if every band was read in full}.
+        """
+        bands = self.plan(min_price, max_price)
+        pages = [((band["min"], band["max"]), page) for band in bands for page in range(2, band["pages"] + 1)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda task: self._fetch(*task), pages))
+
+        products: Dict[Any, Dict[str, Any]] = {}
+        failed_pages = 0
+        for page in [band["first_page"] for band in bands] + [result and result["products"] for result in results]:
+            if page is None:
+                failed_pages += 1
+                continue
+            for product in page:
+                products.setdefault(product.get("id"), product)
+
+        for band in bands:
+            del band["first_page"]
+        return {
+            "products": list(products.values()),
+            "bands": bands,
+            "requests": self.requests,
+            "complete": failed_pages == 0 and all(band["complete"] for band in bands),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect every result of a Digikala search by splitting it into price bands.")
+    parser.add_argument("query")
+    parser.add_argument("--min-price", type=int, default=0)
+    parser.add_argument("--max-price", type=int, default=10 ** 10)
+    parser.add_argument("--page-cap", type=int, default=DEFAULT_PAGE_CAP)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--output", default="digikala_all_results.json")
+    args = parser.parse_args()
+
+    crawler = PriceBandCrawler(args.query, page_cap=args.page_cap, workers=args.workers)
+    result = crawler.crawl(args.min_price, args.max_price)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result["products"], f, ensure_ascii=False, indent=4)
+    print(f"{len(result['products'])} products in {len(result['bands'])} bands, "
+          f"{result['requests']} requests, complete: {result['complete']}")
+
+
+if __name__ == "__main__":
+    main()
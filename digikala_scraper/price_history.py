@@ -0,0 +1,309 @@
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# --- Constants ---
+# One append-only binary file per column; row i of every column is one price snapshot.
+COLUMNS = {
+    "series": np.int32,          # index into the (product_id, seller) series list
+    "timestamp": np.int64,       # unix time of the snapshot
+    "selling_price": np.int64,
+    "rrp_price": np.int64,
+    "discount_percent": np.int16,
+}
+SERIES_FILENAME = "series.jsonl"
+NO_PRICE = np.iinfo(np.int64).max
+
+
+def implied_discount(selling_price: Optional[int], rrp_price: Optional[int]) -> int:
+    """Returns the discount percent implied by a selling price and a reference price."""
+    if not selling_price or not rrp_price or selling_price >= rrp_price:
+        return 0
+    return round((1 - selling_price / rrp_price) * 100)
+
+
+class PriceHistoryStore:
+    """
+    A columnar, append-only store of Digikala price snapshots.
+
+    Every snapshot belongs to a series, i.e. one (product_id, seller) pair. The
+    columns are plain binary files that are memory-mapped for analysis, so the
+    change detection below runs as vectorised NumPy operations over the whole
+    history instead of Python loops over JSON reports.
+    """
+
+    def __init__(self, directory: str = "digikala_price_history"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self._series_keys: List[Tuple[int, str]] = []
+        self._series_index: Dict[Tuple[int, str], int] = {}
+        series_path = os.path.join(directory, SERIES_FILENAME)
+        if os.path.exists(series_path):
+            with open(series_path, encoding="utf-8") as f:
+                for line in f:
+                    product_id, seller = json.loads(line)
+                    self._series_index[(product_id, seller)] = len(self._series_keys)
+                    self._series_keys.append((product_id, seller))
+
+        self._repair()
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _repair(self):
+        """Truncates all columns to the same number of rows after an interrupted append."""
+        rows = min(self._rows_on_disk(name) for name in COLUMNS)
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            if os.path.exists(path) and os.path.getsize(path) != rows * np.dtype(dtype).itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * np.dtype(dtype).itemsize)
+
+    def _rows_on_disk(self, name: str) -> int:
+        path = self._column_path(name)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // np.dtype(COLUMNS[name]).itemsize
+
+    def __len__(self) -> int:
+        return self._rows_on_disk("series")
+
+    # --- Writing ---
+    def _series_id(self, product_id: int, seller: str, new_series: list) -> int:
+        key = (int(product_id), seller or "")
+        if key not in self._series_index:
+            self._series_index[key] = len(self._series_keys)
+            self._series_keys.append(key)
+            new_series.append(key)
+        return self._series_index[key]
+
+    def append(self, snapshots: Iterable[Dict[str, Any]], timestamp: Optional[int] = None) -> int:
+        """
+        Appends price snapshots to the store.
+
+        Args:
+            snapshots: Dictionaries with 'product_id', 'seller', 'selling_price' and
+                optionally 'rrp_price' and 'discount_percent'. Snapshots without a
+                positive selling price (unavailable products) are skipped.
+            timestamp: The unix time of the snapshots. Defaults to now.
+
+        Returns:
+            The number of appended snapshots.
+        """
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        new_series = []
+        rows = {name: [] for name in COLUMNS}
+
+        for snapshot in snapshots:
+            selling_price = snapshot.get("selling_price") or 0
+            if snapshot.get("product_id") is None or selling_price <= 0:
+                continue
+            rows["series"].append(self._series_id(snapshot["product_id"], snapshot.get("seller"), new_series))
+            rows["timestamp"].append(timestamp)
+            rows["selling_price"].append(selling_price)
+            rows["rrp_price"].append(snapshot.get("rrp_price") or selling_price)
+            rows["discount_percent"].append(snapshot.get("discount_percent") or 0)
+
+        if not rows["series"]:
+            return 0
+
+        # The series list is written first, so every stored row refers to a known series.
+        if new_series:
+            with open(os.path.join(self.directory, SERIES_FILENAME), "a", encoding="utf-8") as f:
+                for key in new_series:
+                    f.write(json.dumps(key, ensure_ascii=False) + "\n")
+        for name, dtype in COLUMNS.items():
+            with open(self._column_path(name), "ab") as f:
+                f.write(np.asarray(rows[name], dtype=dtype).tobytes())
+
+        return len(rows["series"])
+
+    def add_search_results(self, products: List[Dict[str, Any]], timestamp: Optional[int] = None) -> int:
+        """Appends the products returned by search_digikala (2_search.py)."""
+        return self.append(
+            (
+                {
+                    "product_id": product.get("id"),
+                    "seller": product.get("seller", {}).get("name"),
+                    "selling_price": product.get("price", {}).get("selling_price"),
+                    "rrp_price": product.get("price", {}).get("rrp_price"),
+                    "discount_percent": product.get("price", {}).get("discount_percent"),
+                }
+                for product in products
+            ),
+            timestamp,
+        )
+
+    def add_product_report(self, report: Dict[str, Any], timestamp: Optional[int] = None) -> int:
+        """Appends the per-seller offers of a report generated by product_details (3_final_digikala.py)."""
+        product_id = report.get("product_summary", {}).get("id")
+        price_info = report.get("product_summary", {}).get("price_info") or {}
+        return self.append(
+            (
+                {
+                    "product_id": product_id,
+                    "seller": offer.get("seller_name"),
+                    "selling_price": offer.get("price"),
+                    # The reference price is the same for every seller of the product.
+                    "rrp_price": price_info.get("rrp_price"),
+                    "discount_percent": implied_discount(offer.get("price"), price_info.get("rrp_price")),
+                }
+                for offer in report.get("seller_offers", [])
+            ),
+            timestamp,
+        )
+
+    # --- Reading ---
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Returns every column as a read-only memory-mapped array."""
+        rows = len(self)
+        if rows == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return {
+            name: np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(rows,))
+            for name, dtype in COLUMNS.items()
+        }
+
+    def series_keys(self, series: np.ndarray) -> List[Tuple[int, str]]:
+        """Maps series ids back to (product_id, seller) pairs."""
+        return [self._series_keys[i] for i in series]
+
+    def _grouped(self):
+        """
+        Sorts the history by (series, timestamp) and returns the sorted columns along
+        with the first and last row of every series.
+        """
+        columns = self.columns()
+        order = np.lexsort((columns["timestamp"], columns["series"]))
+        ordered = {name: np.asarray(values)[order] for name, values in columns.items()}
+
+        series = ordered["series"]
+        if not len(series):
+            return ordered, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+        ends = np.r_[starts[1:], len(series)] - 1
+        return ordered, starts, ends
+
+    def latest_changes(self) -> Dict[str, np.ndarray]:
+        """
+        Compares the latest snapshot of every series with the one before it and with
+        the lowest price ever seen before it.
+
+        Returns:
+            A dictionary of arrays, one entry per series with at least two snapshots:
+            'series', 'previous_price', 'latest_price', 'change_percent', 'previous_low'.
+        """
+        ordered, starts, ends = self._grouped()
+        prices = ordered["selling_price"]
+
+        # The lowest price before the latest snapshot: hide the latest rows, then reduce per series.
+        # reduceat runs over every series, so each segment stops at the start of the next series;
+        # series with a single snapshot are only dropped afterwards.
+        earlier_prices = prices.copy()
+        earlier_prices[ends] = NO_PRICE
+        previous_low = np.minimum.reduceat(earlier_prices, starts) if len(starts) else np.empty(0, dtype=np.int64)
+
+        has_history = ends > starts
+        ends, previous_low = ends[has_history], previous_low[has_history]
+
+        previous_price = prices[ends - 1]
+        latest_price = prices[ends]
+        return {
+            "series": ordered["series"][ends],
+            "previous_price": previous_price,
+            "latest_price": latest_price,
+            "change_percent": (latest_price - previous_price) / previous_price * 100,
+            "previous_low": previous_low,
+        }
+
+    def price_drops(self, min_percent: float = 10) -> Dict[str, np.ndarray]:
+        """Series whose latest price dropped at least 'min_percent' percent since the previous snapshot."""
+        changes = self.latest_changes()
+        mask = changes["change_percent"] <= -min_percent
+        return {name: values[mask] for name, values in changes.items()}
+
+    def new_lows(self) -> Dict[str, np.ndarray]:
+        """Series whose latest price is lower than every earlier price."""
+        changes = self.latest_changes()
+        mask = changes["latest_price"] < changes["previous_low"]
+        return {name: values[mask] for name, values in changes.items()}
+
+    def discount_anomalies(self, tolerance: float = 5, z_threshold: float = 3) -> Dict[str, np.ndarray]:
+        """
+        Flags latest snapshots whose discount looks suspicious.
+
+        A snapshot is flagged when the advertised discount differs from the one implied
+        by 'rrp_price' and 'selling_price' by more than 'tolerance' points, or when the
+        implied discount is a statistical outlier (z-score above 'z_threshold') among
+        the latest snapshots of all series.
+
+        Returns:
+            A dictionary of arrays: 'series', 'selling_price', 'rrp_price',
+            'discount_percent', 'implied_discount', 'mismatch', 'outlier'.
+        """
+        ordered, _, ends = self._grouped()
+        if not len(ends):
+            return {
+                "series": np.empty(0, dtype=COLUMNS["series"]),
+                "selling_price": np.empty(0, dtype=COLUMNS["selling_price"]),
+                "rrp_price": np.empty(0, dtype=COLUMNS["rrp_price"]),
+                "discount_percent": np.empty(0, dtype=COLUMNS["discount_percent"]),
+                "implied_discount": np.empty(0, dtype=np.float64),
+                "mismatch": np.empty(0, dtype=bool),
+                "outlier": np.empty(0, dtype=bool),
+            }
+        selling = ordered["selling_price"][ends].astype(np.float64)
+        rrp = ordered["rrp_price"][ends].astype(np.float64)
+        advertised = ordered["discount_percent"][ends]
+
+        implied = np.where(rrp > 0, (1 - selling / np.where(rrp > 0, rrp, 1)) * 100, 0)
+        mismatch = np.abs(implied - advertised) > tolerance
+        std = implied.std() if len(implied) else 0
+        outlier = (implied - implied.mean()) / std > z_threshold if std > 0 else np.zeros(len(implied), dtype=bool)
+
+        mask = mismatch | outlier
+        return {
+            "series": ordered["series"][ends][mask],
+            "selling_price": ordered["selling_price"][ends][mask],
+            "rrp_price": ordered["rrp_price"][ends][mask],
+            "discount_percent": advertised[mask],
+            "implied_discount": implied[mask],
+            "mismatch": mismatch[mask],
+            "outlier": outlier[mask],
+        }
+
+    def to_records(self, result: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        """Converts one of the array results above into a list of JSON-friendly dictionaries."""
+        records = []
+        for i, (product_id, seller) in enumerate(self.series_keys(result["series"])):
+            record = {"product_id": product_id, "seller": seller}
+            for name, values in result.items():
+                if name != "series":
+                    record[name] = values[i].item()
+            records.append(record)
+        return records
+
+
+def main():
+    search_results_filename = "digikala_filtered_results.json"
+    store = PriceHistoryStore()
+
+    # Append the latest snapshot from the output of 2_search.py
+    with open(search_results_filename, encoding="utf-8") as f:
+        store.add_search_results(json.load(f))
+
+    report = {
+        "price_drops": store.to_records(store.price_drops(min_percent=10)),
+        "new_lows": store.to_records(store.new_lows()),
+        "discount_anomalies": store.to_records(store.discount_anomalies()),
+    }
+    with open("digikala_price_changes.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    name       TEXT,
+    category   TEXT,
+    best_price INTEGER
+);
+CREATE TABLE IF NOT EXISTS offers (
+    product_id  INTEGER NOT NULL,
+    seller      TEXT NOT NULL,
+    category    TEXT,
+    price       INTEGER NOT NULL,
+    is_best     INTEGER NOT NULL,
+    price_ratio REAL NOT NULL,
+    updated     INTEGER NOT NULL,
+    PRIMARY KEY (product_id, seller)
+);
+CREATE INDEX IF NOT EXISTS offers_seller ON offers (seller, price);
+CREATE INDEX IF NOT EXISTS offers_category ON offers (category, seller);
+CREATE INDEX IF NOT EXISTS offers_category_price ON offers (category, price);
+CREATE TABLE IF NOT EXISTS sellers (
+    seller      TEXT PRIMARY KEY,
+    offers      INTEGER NOT NULL DEFAULT 0,
+    best_offers INTEGER NOT NULL DEFAULT 0,
+    ratio_sum   REAL NOT NULL DEFAULT 0
+);
+"""
+
+SELLER_ORDERINGS = {
+    "best_share": "CAST(best_offers AS REAL) / offers DESC",
+    "offers": "offers DESC",
+    "price_ratio": "ratio_sum / offers ASC",
+}
+
+
+class SellerIndex:
+    """
+    An incrementally maintained index of Digikala sellers, stored in a SQLite file.
+
+    Every (product, seller) offer is kept once with its price, whether it is the
+    best price of the product and its ratio to that best price. Adding a report only
+    touches the offers of that product, and per-seller counters are updated by
+    difference, so rankings never re-read the stored reports.
+    """
+
+    def __init__(self, path: str = "digikala_sellers.db"):
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # --- Updates ---
+    def _update_product(self, product_id: int, offers: Dict[str, int], name: Optional[str] = None,
+                        category: Optional[str] = None, replace: bool = True):
+        """
+        Writes the offers of one product and updates the seller counters.
+
+        Args:
+            product_id: The Digikala product id.
+            offers: Seller name -> selling price.
+            replace: True when 'offers' is the full list of the product (a product report); False
+                when it only adds or updates some offers (a search result shows one seller).
+        """
+        conn = self._conn
+        known = conn.execute("SELECT name, category FROM products WHERE product_id = ?", (product_id,)).fetchone()
+        if known is not None:
+            name = name or known[0]
+            category = category or known[1]
+
+        old = conn.execute(
+            "SELECT seller, price, is_best, price_ratio FROM offers WHERE product_id = ?", (product_id,)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE sellers SET offers = offers - 1, best_offers = best_offers - ?, ratio_sum = ratio_sum - ? "
+            "WHERE seller = ?",
+            [(is_best, ratio, seller) for seller, _, is_best, ratio in old],
+        )
+        conn.execute("DELETE FROM offers WHERE product_id = ?", (product_id,))
+
+        merged = {} if replace else {seller: price for seller, price, _, _ in old}
+        merged.update(offers)
+        best_price = min(merged.values()) if merged else None
+        now = int(time.time())
+        rows = [
+            (product_id, seller, category, price, int(price == best_price), price / best_price, now)
+            for seller, price in merged.items()
+        ]
+        conn.executemany(
+            "INSERT INTO offers (product_id, seller, category, price, is_best, price_ratio, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany("INSERT OR IGNORE INTO sellers (seller) VALUES (?)", [(row[1],) for row in rows])
+        conn.executemany(
+            "UPDATE sellers SET offers = offers + 1, best_offers = best_offers + ?, ratio_sum = ratio_sum + ? "
+            "WHERE seller = ?",
+            [(row[4], row[5], row[1]) for row in rows],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO products (product_id, name, category, best_price) VALUES (?, ?, ?, ?)",
+            (product_id, name, category, best_price),
+        )
+
+    def add_product_reports(self, reports: Iterable[Dict[str, Any]]) -> int:
+        """
+        Adds outputs of product_details (3_final_digikala.py) in one transaction. The seller
+        offers of a report replace the offers stored for its product.
+
+        Returns:
+            The number of offers stored.
+        """
+        count = 0
+        with self._conn:
+            for report in reports:
+                summary = (report or {}).get("product_summary") or {}
+                if summary.get("id") is None:
+                    continue
+                offers = {
+                    offer["seller_name"]: int(offer["price"])
+                    for offer in report.get("seller_offers") or []
+                    if offer.get("seller_name") and offer.get("price")
+                }
+                self._update_product(int(summary["id"]), offers, summary.get("name"), summary.get("category"))
+                count += len(offers)
+        return count
+
+    def add_product_report(self, report: Dict[str, Any]) -> int:
+        """Adds a single product report as it arrives (see add_product_reports)."""
+        return self.add_product_reports([report])
+
+    def add_search_results(self, products: Iterable[Dict[str, Any]]) -> int:
+        """
+        Adds the output of search_digikala (2_search.py). Each product shows the offer of
+        one seller, which is added to (or updates) the offers known for the product.
+
+        Returns:
+            The number of offers added or updated.
+        """
+        count = 0
+        with self._conn:
+            for product in products:
+                price = (product.get("price") or {}).get("selling_price")
+                seller = (product.get("seller") or {}).get("name")
+                if product.get("id") is None or not price or not seller or seller == "نامشخص":
+                    continue
+                self._update_product(int(product["id"]), {seller: int(price)}, product.get("title_fa"), replace=False)
+                count += 1
+        return count
+
+    # --- Queries ---
+    def seller(self, seller: str, max_products: int = 100) -> Optional[Dict[str, Any]]:
+        """
+        Returns the statistics of one seller: number of offers, min and median price, share of
+        offers at the best price of their product, mean ratio to the best price and the product ids.
+        """
+        row = self._conn.execute(
+            "SELECT offers, best_offers, ratio_sum FROM sellers WHERE seller = ? AND offers > 0", (seller,)
+        ).fetchone()
+        if row is None:
+            return None
+        offers, best_offers, ratio_sum = row
+
+        # Both the minimum and the median are read from the (seller, price) index.
+        min_price = self._conn.execute(
+            "SELECT price FROM offers WHERE seller = ? ORDER BY price LIMIT 1", (seller,)
+        ).fetchone()[0]
+        middle = self._conn.execute(
+            "SELECT price FROM offers WHERE seller = ? ORDER BY price LIMIT ? OFFSET ?",
+            (seller, 2 - offers % 2, (offers - 1) // 2),
+        ).fetchall()
+        products = [product_id for (product_id,) in self._conn.execute(
+            "SELECT product_id FROM offers WHERE seller = ? ORDER BY updated DESC LIMIT ?", (seller, max_products))]
+        return {
+            "seller": seller,
+            "offers": offers,
+            "min_price": min_price,
+            "median_price": sum(price for (price,) in middle) / len(middle),
+            "best_price_share": best_offers / offers,
+            "mean_price_ratio": ratio_sum / offers,
+            "products": products,
+        }
+
+    def top_sellers(self, k: int = 10, by: str = "best_share", min_offers: int = 5) -> List[Dict[str, Any]]:
+        """
+        Ranks sellers over all categories.
+
+        Args:
+            k: Number of sellers returned.
+            by: 'best_share' (share of offers at the best price), 'offers' (number of offers)
+                or 'price_ratio' (mean price relative to the best offer, lowest first).
+            min_offers: Ignore sellers with fewer offers.
+        """
+        if by not in SELLER_ORDERINGS:
+            raise ValueError(f"Unknown ordering '{by}'. Available: {', '.join(SELLER_ORDERINGS)}")
+        rows = self._conn.execute(
+            f"SELECT seller, offers, best_offers, ratio_sum FROM sellers WHERE offers >= ? "
+            f"ORDER BY {SELLER_ORDERINGS[by]} LIMIT ?",
+            (max(min_offers, 1), k),
+        ).fetchall()
+        return [
+            {"seller": seller, "offers": offers, "best_price_share": best / offers, "mean_price_ratio": ratio / offers}
+            for seller, offers, best, ratio in rows
+        ]
+
+    def cheapest_sellers_per_category(self, k: int = 1, min_offers: int = 3,
+                                      category: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Finds the cheapest sellers of every category (or of one category).
+
+        Products of a category have different prices, so sellers are compared by their mean
+        price relative to the best offer of each product they sell (1.0 = always the cheapest).
+
+        Returns:
+            dict: Category -> up to k {"seller", "offers", "mean_price_ratio", "best_price_share"} entries.
+        """
+        condition, params = ("WHERE category = ?", [category]) if category is not None else ("WHERE category IS NOT NULL", [])
+        rows = self._conn.execute(
+            f"""
+            SELECT category, seller, offers, mean_ratio, best_share FROM (
+                SELECT category, seller, offers, mean_ratio, best_share,
+                       ROW_NUMBER() OVER (PARTITION BY category ORDER BY mean_ratio, offers DESC) AS rank
+                FROM (
+                    SELECT category, seller, COUNT(*) AS offers, AVG(price_ratio) AS mean_ratio,
+                           AVG(is_best) AS best_share
+                    FROM offers {condition}
+                    GROUP BY category, seller
+                    HAVING COUNT(*) >= ?
+                )
+            )
+            WHERE rank <= ?
+            ORDER BY category, rank
+            """,
+            (*params, min_offers, k),
+        ).fetchall()
+
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for category_name, seller, offers, mean_ratio, best_share in rows:
+            result.setdefault(category_name, []).append(
+                {"seller": seller, "offers": offers, "mean_price_ratio": mean_ratio, "best_price_share": best_share}
+            )
+        return result
+
+    def cheapest_offers(self, category: str, k: int = 10) -> List[Dict[str, Any]]:
+        """Returns the k lowest-priced offers of a category, read from the (category, price) index."""
+        rows = self._conn.execute(
+            "SELECT o.product_id, p.name, o.seller, o.price FROM offers o JOIN products p USING (product_id) "
+            "WHERE o.category = ? ORDER BY o.price LIMIT ?",
+            (category, k),
+        ).fetchall()
+        return [{"product_id": pid, "name": name, "seller": seller, "price": price} for pid, name, seller, price in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seller statistics across Digikala products.")
+    parser.add_argument("--index", default="digikala_sellers.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="Add product reports or search results.")
+    add_parser.add_argument("kind", choices=["reports", "search"])
+    add_parser.add_argument("filename", help="A JSON file: reports (list or url -> report) or search results (list).")
+
+    seller_parser = subparsers.add_parser("seller", help="Statistics of one seller.")
+    seller_parser.add_argument("name")
+
+    top_parser = subparsers.add_parser("top", help="Top sellers over all categories.")
+    top_parser.add_argument("--by", choices=sorted(SELLER_ORDERINGS), default="best_share")
+    top_parser.add_argument("-k", type=int, default=10)
+
+    category_parser = subparsers.add_parser("categories", help="Cheapest sellers per category.")
+    category_parser.add_argument("-k", type=int, default=1)
+    category_parser.add_argument("--category")
+
+    args = parser.parse_args()
+    index = SellerIndex(args.index)
+    if args.command == "add":
+        with open(args.filename, encoding="utf-8") as f:
+            data = json.load(f)
+        if args.kind == "reports":
+            count = index.add_product_reports(data.values() if isinstance(data, dict) else data)
+        else:
+            count = index.add_search_results(data)
+        print(f"{count} offers indexed.")
+    elif args.command == "seller":
+        print(json.dumps(index.seller(args.name), ensure_ascii=False, indent=4))
+    elif args.command == "top":
+        print(json.dumps(index.top_sellers(args.k, args.by), ensure_ascii=False, indent=4))
+    elif args.command == "categories":
+        print(json.dumps(index.cheapest_sellers_per_category(args.k, category=args.category), ensure_ascii=False, indent=4))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
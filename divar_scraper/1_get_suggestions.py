@@ -1,13 +1,14 @@
 import requests
 import json
 
-def get_suggestions(query: str, city_id: str = '1'):
+def get_suggestions(query: str, city_id: str = '1', timeout: float = 15):
     """
     This function receives a search query, sends it to the Divar API,
     and returns the search suggestions in a clean and simple JSON format.
 
     :param query: The word you want to search for (e.g., 'guitar').
     :param city_id: The ID of the desired city (default is '1' for Tehran).
+    :param timeout: The request timeout in seconds.
     :return: A list of dictionaries containing simplified suggestions or None in case of an error.
     """
     api_url = 'https://api.divar.ir/v8/prediction/w/query'
@@ -28,7 +29,7 @@ def get_suggestions(query: str, city_id: str = '1'):
     }
 
     try:
-        response = requests.post(api_url, headers=headers, cookies=cookies, json=json_data)
+        response = requests.post(api_url, headers=headers, cookies=cookies, json=json_data, timeout=timeout)
         # Check if the request was successful
         response.raise_for_status()
 
@@ -63,19 +64,19 @@ def get_suggestions(query: str, city_id: str = '1'):
 
 
 # --- Example of how to use the function ---
-
-# The desired search query
-search_query = "گیتار"
-
-# Get clean and simplified suggestions
-simplified_suggestions = get_suggestions(search_query)
-
-# If suggestions are successfully received, save them to a file
-if simplified_suggestions:
-    # Save the output to a JSON file with a readable format
-    try:
-        with open('suggestions.json', 'w', encoding='utf-8') as f:
-            json.dump(simplified_suggestions, f, ensure_ascii=False, indent=4)
-
-    except IOError:
-        pass
\ No newline at end of file
+if __name__ == '__main__':
+    # The desired search query
+    search_query = "گیتار"
+
+    # Get clean and simplified suggestions
+    simplified_suggestions = get_suggestions(search_query)
+
+    # If suggestions are successfully received, save them to a file
+    if simplified_suggestions:
+        # Save the output to a JSON file with a readable format
+        try:
+            with open('suggestions.json', 'w', encoding='utf-8') as f:
+                json.dump(simplified_suggestions, f, ensure_ascii=False, indent=4)
+
+        except IOError:
+            pass
\ No newline at end of file
@@ -1,14 +1,15 @@
 import requests
 import json
 
-def get_filters_with_locations(query: str, category: str, filename: str = "filters_with_locations.json"):
+def fetch_filters_with_locations(query: str, category: str, timeout: float = 15):
     """
-    This function retrieves the main filters and the complete list of neighborhoods from the Divar API,
-    then merges and saves them into a single JSON file.
+    Retrieves the main filters and the complete list of neighborhoods from the Divar API
+    and merges them into a single structure, without writing any file.
 
     :param query: The title to search for (e.g., 'Yamaha guitar').
     :param category: The category ID (e.g., 'guitar-bass-amplifier').
-    :param filename: The name of the file where the final output will be saved.
+    :param timeout: The timeout of each request in seconds.
+    :return: The merged filters, or None in case of an error.
     """
     filters_url = 'https://api.divar.ir/v8/postlist/w/filters'
     locations_url = 'https://api.divar.ir/v8/w/lazy-multi-select-hierarchy-options'
@@ -31,7 +32,7 @@ def get_filters_with_locations(query: str, category: str, filename: str = "filte
 
     try:
         # --- Step 1: Get the main filters ---
-        response_filters = requests.post(filters_url, headers=headers, json=filters_payload)
+        response_filters = requests.post(filters_url, headers=headers, json=filters_payload, timeout=timeout)
         response_filters.raise_for_status()
         main_filters_data = response_filters.json()
 
@@ -43,8 +44,6 @@ def get_filters_with_locations(query: str, category: str, filename: str = "filte
                 break
         
         if not district_widget:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(main_filters_data, f, ensure_ascii=False, indent=4)
             return main_filters_data
 
         lazy_payload = district_widget.get("data", {}).get("lazy_payload")
@@ -53,18 +52,13 @@ def get_filters_with_locations(query: str, category: str, filename: str = "filte
 
         # --- Step 3: Get the list of neighborhoods ---
         locations_payload = {'payload': lazy_payload}
-        response_locations = requests.post(locations_url, headers=headers, json=locations_payload)
+        response_locations = requests.post(locations_url, headers=headers, json=locations_payload, timeout=timeout)
         response_locations.raise_for_status()
         locations_data = response_locations.json()
 
         # --- Step 4: Merge the list of neighborhoods into the main structure ---
         # Add the list of neighborhoods to the corresponding widget in the main JSON
         district_widget["data"]["loaded_options"] = locations_data.get("options")
-        
-        # Save the final JSON
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(main_filters_data, f, ensure_ascii=False, indent=4)
-            
         return main_filters_data
 
     except requests.exceptions.HTTPError:
@@ -76,6 +70,36 @@ def get_filters_with_locations(query: str, category: str, filename: str = "filte
     
     return None
 
+def get_filters_with_locations(query: str, category: str, filename: str = "filters_with_locations.json"):
+    """
+    This function retrieves the main filters and the complete list of neighborhoods from the Divar API,
+    then merges and saves them into a single JSON file.
+
+    :param query: The title to search for (e.g., 'Yamaha guitar').
+    :param category: The category ID (e.g., 'guitar-bass-amplifier').
+    :param filename: The name of the file where the final output will be saved.
+    """
+    filters_data = fetch_filters_with_locations(query, category)
+    if filters_data is None:
+        return None
+
+    # The district list may be missing when its payload is not provided; the filters are returned unsaved then.
+    district_rows = [
+        widget for widget in filters_data.get("page", {}).get("widget_list", [])
+        if widget.get("widget_type") == "I_LAZY_MULTI_SELECT_DISTRICT_ROW"
+    ]
+    if district_rows and "loaded_options" not in district_rows[0].get("data", {}):
+        return filters_data
+
+    # Save the final JSON
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(filters_data, f, ensure_ascii=False, indent=4)
+    except IOError:
+        pass
+
+    return filters_data
+
 # --- How to use the function ---
 if __name__ == '__main__':
     search_title = 'گیتار یاماها'
@@ -67,9 +67,13 @@ def extract_post_data(raw_json_data: dict, num_results: int = None) -> dict:
     return processed_results
 
 
-def search_divar_posts(query: str, category: str, num_results: int = None, filters: dict = None, processed_filename: str = "processed_results.json"):
+def fetch_search_posts(query: str, category: str, num_results: int = None, filters: dict = None, archive=None, timeout: float = 15):
     """
-    Performs the search, limits the results to the specified number, and saves only the processed results.
+    Performs the search and returns the processed results without writing any file.
+    If an archive (common.raw_archive.RawArchive) is given, the raw response is stored in it.
+
+    :param timeout: The request timeout in seconds.
+    :return: The processed results (see extract_post_data), or None if the request failed or found nothing.
     """
     api_url = 'https://api.divar.ir/v8/postlist/w/search'
     headers = {'Content-Type': 'application/json'}
@@ -91,8 +95,10 @@ def search_divar_posts(query: str, category: str, num_results: int = None, filte
         search_payload['search_data']['form_data']['data'].update(filters)
 
     try:
-        response = requests.post(api_url, headers=headers, json=search_payload)
+        response = requests.post(api_url, headers=headers, json=search_payload, timeout=timeout)
         response.raise_for_status()
+        if archive is not None:
+            archive.put("divar/search", json.dumps(search_payload, sort_keys=True, ensure_ascii=False), response.content)
 
         raw_results = response.json()
         
@@ -102,9 +108,6 @@ def search_divar_posts(query: str, category: str, num_results: int = None, filte
         if not processed_data:
              return None
 
-        with open(processed_filename, 'w', encoding='utf-8') as f:
-            json.dump(processed_data, f, ensure_ascii=False, indent=4)
-        
         return processed_data
 
     except requests.exceptions.HTTPError:
@@ -114,6 +117,24 @@ def search_divar_posts(query: str, category: str, num_results: int = None, filte
 
     return None
 
+
+def search_divar_posts(query: str, category: str, num_results: int = None, filters: dict = None, processed_filename: str = "processed_results.json", archive=None):
+    """
+    Performs the search, limits the results to the specified number, and saves only the processed results.
+    If an archive (common.raw_archive.RawArchive) is given, the raw response is stored in it.
+    """
+    processed_data = fetch_search_posts(query, category, num_results, filters, archive)
+    if not processed_data:
+        return None
+
+    try:
+        with open(processed_filename, 'w', encoding='utf-8') as f:
+            json.dump(processed_data, f, ensure_ascii=False, indent=4)
+    except IOError:
+        return None
+
+    return processed_data
+
 # --- How to use the function ---
 if __name__ == '__main__':
     search_title = 'گیتار یاماها'
@@ -2,17 +2,21 @@ import requests
 import json
 import os
 
-def get_divar_post_info(token):
+def get_divar_post_info(token, archive=None, timeout=15):
     """
     Retrieves the raw data of a post from the Divar API using its token.
+    If an archive (common.raw_archive.RawArchive) is given, the raw response is stored in it.
+    'timeout' is the request timeout in seconds.
     """
     url = f"https://api.divar.ir/v8/posts-v2/web/{token}"
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=timeout)
         response.raise_for_status()
+        if archive is not None:
+            archive.put("divar/post", token, response.content)
         return response.json()
     except requests.exceptions.RequestException:
         return None
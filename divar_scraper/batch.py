@@ -0,0 +1,66 @@
+import json
+from typing import Dict, Iterable
+
+from common.deadlines import Deadline, hedged_call
+from common.stages import load_stage
+from common.work_queue import WorkQueue, run_queue
+
+details_stage = load_stage("divar_scraper", "4_get_details_search.py")
+
+
+def fetch_simplified_post(token: str, payload=None, archive=None, deadline: Deadline = None):
+    """
+    Fetches one post and converts it with simplify_post_data. Returns None on failure.
+    The request is hedged when it is slower than usual and bounded by the batch deadline.
+    """
+    raw_post = hedged_call(
+        "divar/post", lambda timeout: details_stage.get_divar_post_info(token, archive, timeout), deadline
+    )
+    return details_stage.simplify_post_data(raw_post)
+
+
+def crawl_post_details(
+    tokens: Iterable[str],
+    queue_path: str = "divar_details_queue.db",
+    workers: int = 4,
+    checkpoint_every: int = 50,
+    archive=None,
+    deadline_seconds: float = None,
+) -> Dict[str, dict]:
+    """
+    Fetches the details of many posts through a durable work queue.
+
+    The queue file keeps track of every token, so if the crawl is interrupted,
+    running it again with the same 'queue_path' only fetches the tokens that
+    were not completed yet.
+
+    :param tokens: The post tokens to fetch (e.g. from the output of 3_get_search.py).
+    :param queue_path: The SQLite file used as the work queue.
+    :param workers: Number of parallel requests.
+    :param checkpoint_every: Number of completed posts written to disk at once.
+    :param archive: Optional RawArchive that keeps every raw post response.
+    :param deadline_seconds: Optional time limit for the whole crawl; tokens not fetched by then
+        stay in the queue for the next run.
+    :return: A dictionary mapping each completed token to its simplified post data.
+    """
+    with WorkQueue(queue_path, checkpoint_every=checkpoint_every) as queue:
+        queue.enqueue((token, None) for token in tokens if token)
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        run_queue(
+            queue,
+            lambda token, payload: fetch_simplified_post(token, payload, archive, deadline),
+            workers=workers,
+            deadline=deadline,
+        )
+        return dict(queue.results())
+
+
+# --- How to use the code ---
+if __name__ == "__main__":
+    # The output of 3_get_search.py: {"result_1": {"token": ...}, ...}
+    with open("result.json", encoding="utf-8") as f:
+        search_results = json.load(f)
+
+    post_tokens = [post.get("token") for post in search_results.values()]
+    all_details = crawl_post_details(post_tokens)
+    details_stage.save_to_json_file(all_details, "detail_posts.json")
@@ -0,0 +1,257 @@
+import hashlib
+import json
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common.text_index import normalize
+
+# A prime just above 2**32: with 32-bit shingle hashes and coefficients, a * x + b fits in uint64.
+SHINGLE_PRIME = np.uint64(4294967311)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (doc_id TEXT PRIMARY KEY, signature BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, bucket INTEGER NOT NULL, doc_id TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+# Version of normalize_text used for new index files. Signatures only compare within one
+# version, so an index file keeps the version it was created with.
+#   1: lowercase, ي/ك variants, ZWNJ and punctuation
+#   2: common/text_index.py normalize (also digits, diacritics and more letter variants)
+TEXT_VERSION = 2
+
+
+def normalize_text(text: str, version: int = TEXT_VERSION) -> str:
+    """
+    Lowercases the text, unifies Arabic/Persian letter variants and removes punctuation,
+    so small edits in a reposted ad do not change its shingles. Version 2 also unifies
+    digits and drops diacritics (see common/text_index.py).
+    """
+    if version == 1:
+        text = (text or "").lower().replace("ي", "ی").replace("ك", "ک").replace("‌", " ")
+        text = re.sub(r"[^\w\s]", " ", text)
+        return re.sub(r"\s+", " ", text).strip()
+    return normalize(text)
+
+
+def post_text(simplified_post: dict) -> str:
+    """
+    Builds the text compared for a post from the output of simplify_post_data (4_get_details_search.py).
+    The location is rounded to about 100 m, so the same spot yields the same token.
+    """
+    details = " ".join(f"{key} {value}" for key, value in (simplified_post.get("details") or {}).items())
+    location = simplified_post.get("location") or {}
+    location_token = ""
+    if location.get("latitude") is not None and location.get("longitude") is not None:
+        location_token = f"loc{round(location['latitude'], 3)}_{round(location['longitude'], 3)}"
+    parts = [simplified_post.get("title"), simplified_post.get("description"), details, location_token]
+    return " ".join(part for part in parts if part)
+
+
+def listing_text(search_result: dict) -> str:
+    """Builds the text compared for a search result row of extract_post_data (3_get_search.py)."""
+    parts = [
+        search_result.get("title"),
+        search_result.get("district_persian"),
+        search_result.get("top_description_text"),
+        search_result.get("middle_description_text"),
+        search_result.get("bottom_description_text"),
+    ]
+    return " ".join(part for part in parts if part)
+
+
+class NearDuplicateIndex:
+    """
+    A MinHash / LSH index of ad texts stored in a SQLite file.
+
+    Every document gets a MinHash signature of 'num_perm' values, split into
+    'bands' bands. Documents sharing at least one band bucket are candidates (with
+    the defaults, pairs above roughly 0.7 similarity almost always are);
+    candidates whose estimated Jaccard similarity reaches 'threshold' are reported
+    as near-duplicates. Lookups only read the matching buckets, so they stay fast
+    as the index grows, and new documents are added incrementally.
+    """
+
+    def __init__(self, path: str = "divar_minhash.db", num_perm: int = 128, bands: int = 16,
+                 threshold: float = 0.8, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        # The permutation coefficients must stay the same for the lifetime of the index file.
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+        self.text_version = self._text_version()
+        self._conn.commit()
+
+    def _text_version(self) -> int:
+        """
+        Reads the normalize_text version of the index file. Files written before the version
+        was recorded used version 1; new files use TEXT_VERSION.
+        """
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'text_version'").fetchone()
+        if row is not None:
+            return int(row[0])
+        has_documents = self._conn.execute("SELECT 1 FROM signatures LIMIT 1").fetchone() is not None
+        version = 1 if has_documents else TEXT_VERSION
+        self._conn.execute("INSERT INTO meta (key, value) VALUES ('text_version', ?)", (str(version),))
+        return version
+
+    # --- Signatures ---
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        text = normalize_text(text, self.text_version)
+        if len(text) < self.shingle_size:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """Returns the MinHash signature of a text."""
+        hashes = self._shingle_hashes(text)
+        # One row per permutation, one column per shingle; the minimum of each row is the signature.
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % SHINGLE_PRIME
+        return permuted.min(axis=1)
+
+    def _band_buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        return [
+            (band, int.from_bytes(hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                                  digest_size=7).digest(), "little"))
+            for band in range(self.bands)
+        ]
+
+    # --- Index ---
+    def __contains__(self, doc_id: str) -> bool:
+        return self._conn.execute("SELECT 1 FROM signatures WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def query(self, text: str = None, signature: np.ndarray = None, exclude: Optional[str] = None,
+              before: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Finds indexed documents that are near-duplicates of a text (or of a precomputed signature).
+        With 'before' (an insertion rowid), only documents added before that one are considered.
+
+        Returns:
+            list: (doc_id, estimated similarity) pairs, most similar first.
+        """
+        if signature is None:
+            signature = self.signature(text)
+
+        candidates = set()
+        for band, bucket in self._band_buckets(signature):
+            rows = self._conn.execute("SELECT doc_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket))
+            candidates.update(doc_id for (doc_id,) in rows)
+        candidates.discard(exclude)
+
+        # Verify the candidates against their full signatures, a chunk of ids per query.
+        matches = []
+        candidates = list(candidates)
+        for start in range(0, len(candidates), 500):
+            chunk = candidates[start:start + 500]
+            condition, params = ("AND rowid < ?", [before]) if before is not None else ("", [])
+            rows = self._conn.execute(
+                f"SELECT doc_id, signature FROM signatures WHERE doc_id IN ({', '.join('?' * len(chunk))}) {condition}",
+                (*chunk, *params),
+            ).fetchall()
+            if not rows:
+                continue
+            ids, stored = zip(*rows)
+            signatures = np.frombuffer(b"".join(stored), dtype=np.uint64).reshape(len(ids), self.num_perm)
+            similarities = (signatures == signature).mean(axis=1)
+            matches.extend((doc_id, float(sim)) for doc_id, sim in zip(ids, similarities) if sim >= self.threshold)
+        return sorted(matches, key=lambda match: -match[1])
+
+    def add(self, doc_id: str, text: str = None, signature: np.ndarray = None, commit: bool = True):
+        """Adds a document to the index. A document that is already indexed is left unchanged."""
+        if doc_id in self:
+            return
+        if signature is None:
+            signature = self.signature(text)
+        self._conn.execute("INSERT INTO signatures (doc_id, signature) VALUES (?, ?)", (doc_id, signature.tobytes()))
+        self._conn.executemany(
+            "INSERT INTO buckets (band, bucket, doc_id) VALUES (?, ?, ?)",
+            [(band, bucket, doc_id) for band, bucket in self._band_buckets(signature)],
+        )
+        if commit:
+            self._conn.commit()
+
+    def add_or_match(self, doc_id: str, text: str, commit: bool = True) -> List[Tuple[str, float]]:
+        """
+        Returns the near-duplicates of a document among the documents indexed before it, then adds
+        the document. A document that is already indexed is matched again with its stored signature
+        against the documents added before it, so re-running over the same posts gives the same
+        answer and an original is never reported as a duplicate of its later repost.
+        """
+        row = self._conn.execute("SELECT rowid, signature FROM signatures WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is not None:
+            return self.query(signature=np.frombuffer(row[1], dtype=np.uint64), exclude=doc_id, before=row[0])
+        signature = self.signature(text)
+        matches = self.query(signature=signature, exclude=doc_id)
+        self.add(doc_id, signature=signature, commit=commit)
+        return matches
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def mark_search_duplicates(processed_results: Dict[str, dict], index: NearDuplicateIndex) -> List[str]:
+    """
+    Pre-filter for the output of extract_post_data: marks rows that look like a repost
+    of an ad seen before, before any details request is spent on them.
+
+    Rows with a near-duplicate get "duplicate_of" (the earlier token) and "similarity" keys.
+    Every row is added to the index afterwards.
+
+    Returns:
+        list: The tokens that are not duplicates and are worth fetching in detail.
+    """
+    to_fetch = []
+    for post in processed_results.values():
+        token = post.get("token")
+        if not token:
+            continue
+        matches = index.add_or_match(token, listing_text(post), commit=False)
+        if matches:
+            post["duplicate_of"], post["similarity"] = matches[0]
+        else:
+            to_fetch.append(token)
+    index.commit()
+    return to_fetch
+
+
+def find_post_duplicates(token: str, simplified_post: dict, index: NearDuplicateIndex) -> List[Tuple[str, float]]:
+    """Checks a fully fetched post (simplify_post_data output) against the index and adds it."""
+    return index.add_or_match(token, post_text(simplified_post))
+
+
+# --- How to use the code ---
+if __name__ == "__main__":
+    # The output of 3_get_search.py
+    with open("result.json", encoding="utf-8") as f:
+        search_results = json.load(f)
+
+    listings_index = NearDuplicateIndex("divar_listings_minhash.db")
+    tokens_to_fetch = mark_search_duplicates(search_results, listings_index)
+    listings_index.close()
+
+    with open("result_deduplicated.json", "w", encoding="utf-8") as f:
+        json.dump(search_results, f, ensure_ascii=False, indent=4)
+    with open("tokens_to_fetch.json", "w", encoding="utf-8") as f:
+        json.dump(tokens_to_fetch, f, ensure_ascii=False, indent=4)
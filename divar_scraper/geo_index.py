@@ -0,0 +1,367 @@
+import json
+import math
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from common.text_index import normalize
+
+# Latitude and longitude are quantized to 26 bits each (about 0.6 m) and interleaved
+# into a 52-bit Z-order (geohash-like) cell, so every square of the grid is one
+# contiguous range of cell values and area queries are range scans of one index.
+CELL_BITS = 26
+EARTH_RADIUS_M = 6371008.8
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    token     TEXT PRIMARY KEY,
+    cell      INTEGER,
+    latitude  REAL,
+    longitude REAL,
+    district  TEXT,
+    title     TEXT,
+    updated   INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS posts_cell ON posts (cell, latitude, longitude);
+CREATE INDEX IF NOT EXISTS posts_district ON posts (district);
+CREATE TABLE IF NOT EXISTS districts (
+    key    TEXT PRIMARY KEY,
+    title  TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    parent TEXT
+);
+CREATE INDEX IF NOT EXISTS districts_name ON districts (name);
+"""
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """Inserts a zero bit after every bit of 32-bit values."""
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def _quantize(latitude, longitude) -> Tuple[np.ndarray, np.ndarray]:
+    scale = (1 << CELL_BITS) - 1
+    y = np.clip(np.round((np.asarray(latitude, dtype=np.float64) + 90.0) / 180.0 * scale), 0, scale)
+    x = np.clip(np.round((np.asarray(longitude, dtype=np.float64) + 180.0) / 360.0 * scale), 0, scale)
+    return y.astype(np.uint64), x.astype(np.uint64)
+
+
+def cell_of(latitude, longitude) -> np.ndarray:
+    """
+    Returns the grid cell(s) of coordinates (scalars or arrays).
+
+    :param latitude: Latitude(s) in degrees.
+    :param longitude: Longitude(s) in degrees.
+    :return: The 52-bit Z-order cell value(s), as int64.
+    """
+    y, x = _quantize(latitude, longitude)
+    return (_spread_bits(y) << np.uint64(1) | _spread_bits(x)).astype(np.int64)
+
+
+def _cell_ranges(south: float, west: float, north: float, east: float, max_cells: int = 64) -> List[Tuple[int, int]]:
+    """
+    Covers a bounding box with at most 'max_cells' squares of the grid and returns the
+    merged (first, last) cell ranges of those squares.
+    """
+    (y0, y1), (x0, x1) = _quantize([south, north], [west, east])
+    y0, y1, x0, x1 = int(y0), int(y1), int(x0), int(x1)
+    shift = 0
+    while ((y1 >> shift) - (y0 >> shift) + 1) * ((x1 >> shift) - (x0 >> shift) + 1) > max_cells:
+        shift += 1
+    ys = np.arange(y0 >> shift, (y1 >> shift) + 1, dtype=np.uint64)
+    xs = np.arange(x0 >> shift, (x1 >> shift) + 1, dtype=np.uint64)
+    squares = np.sort((_spread_bits(ys)[:, None] << np.uint64(1) | _spread_bits(xs)[None, :]).ravel().astype(np.int64))
+
+    ranges = []
+    for square in squares.tolist():
+        first, last = square << (2 * shift), ((square + 1) << (2 * shift)) - 1
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+
+def haversine_m(latitude, longitude, latitudes, longitudes) -> np.ndarray:
+    """Great-circle distances in meters from one point to arrays of points."""
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _radius_box(latitude: float, longitude: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """The (south, west, north, east) box that contains a circle."""
+    delta_latitude = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = max(latitude - delta_latitude, -90.0), min(latitude + delta_latitude, 90.0)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    delta_longitude = math.degrees(math.asin(min(1.0, math.sin(radius_m / EARTH_RADIUS_M) / math.cos(math.radians(latitude)))))
+    return south, max(longitude - delta_longitude, -180.0), north, min(longitude + delta_longitude, 180.0)
+
+
+def iter_district_options(filters_data: dict) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """
+    Walks the district hierarchy merged by get_filters_with_locations (2_get_fillters.py)
+    into the "loaded_options" of the district widget.
+
+    :param filters_data: The output of get_filters_with_locations (or of fetch_filters_with_locations).
+    :return: (key, title, parent key) for every district or district group, parents first.
+    """
+    def walk(options, parent):
+        if isinstance(options, dict):
+            options = options.get("options") or options.get("children") or [options]
+        for option in options or []:
+            if not isinstance(option, dict):
+                continue
+            title = option.get("title") or option.get("display") or option.get("name") or option.get("text")
+            key = option.get("key") or option.get("value") or option.get("id") or title
+            children = option.get("children") or option.get("options") or option.get("sub_options")
+            if title:
+                yield str(key), str(title), parent
+            yield from walk(children, str(key) if title else parent)
+
+    for widget in (filters_data or {}).get("page", {}).get("widget_list", []):
+        if widget.get("widget_type") == "I_LAZY_MULTI_SELECT_DISTRICT_ROW":
+            yield from walk(widget.get("data", {}).get("loaded_options"), None)
+
+
+class GeoIndex:
+    """
+    A spatial index of Divar post locations, stored in a SQLite file.
+
+    Every post is kept once per token with its grid cell, coordinates and district.
+    Bounding-box and radius queries read only the index ranges of the grid squares
+    that cover the area, then check the exact distance of the few posts found there;
+    nearest-neighbour queries widen a radius query until enough posts are found.
+    Posts are added or moved one batch at a time, without rebuilding anything.
+    """
+
+    def __init__(self, path: str = "divar_geo.db", max_cells: int = 64):
+        self.max_cells = max_cells
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    # --- Updates ---
+    def add_posts(self, posts: Dict[str, dict]) -> int:
+        """
+        Adds or moves posts in one transaction.
+
+        :param posts: Token -> output of simplify_post_data (4_get_details_search.py), e.g. the
+            result of crawl_post_details. Posts without a location are skipped.
+        :return: The number of posts stored.
+        """
+        rows = []
+        for token, post in posts.items():
+            location = (post or {}).get("location") or {}
+            if token and location.get("latitude") is not None and location.get("longitude") is not None:
+                rows.append((token, float(location["latitude"]), float(location["longitude"]), post.get("title")))
+        if not rows:
+            return 0
+
+        cells = cell_of([row[1] for row in rows], [row[2] for row in rows]).tolist()
+        now = int(time.time())
+        with self._conn:
+            # The district may already be known from a search row, so it is kept.
+            self._conn.executemany(
+                "INSERT INTO posts (token, cell, latitude, longitude, title, updated) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (token) DO UPDATE SET cell = excluded.cell, latitude = excluded.latitude, "
+                "longitude = excluded.longitude, title = COALESCE(excluded.title, title), updated = excluded.updated",
+                [(token, cell, latitude, longitude, title, now)
+                 for (token, latitude, longitude, title), cell in zip(rows, cells)],
+            )
+        return len(rows)
+
+    def add_search_results(self, processed_results: Dict[str, dict]) -> int:
+        """
+        Records the district of posts from the output of extract_post_data (3_get_search.py).
+        Search rows have no coordinates; their posts are placed once their details are added.
+
+        :return: The number of posts whose district was recorded.
+        """
+        rows = [
+            (post["token"], post["district_persian"], post.get("title"), int(time.time()))
+            for post in processed_results.values()
+            if post.get("token") and post.get("district_persian")
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO posts (token, district, title, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (token) DO UPDATE SET district = excluded.district, title = COALESCE(title, excluded.title)",
+                rows,
+            )
+        return len(rows)
+
+    def remove(self, tokens: Iterable[str]):
+        """Removes posts (e.g. deleted ads) from the index."""
+        with self._conn:
+            self._conn.executemany("DELETE FROM posts WHERE token = ?", [(token,) for token in tokens])
+
+    def load_districts(self, filters_data: dict) -> int:
+        """
+        Stores the district hierarchy of get_filters_with_locations (2_get_fillters.py), which
+        district aggregates are rolled up along. Loading it again replaces the known districts.
+
+        :return: The number of districts stored.
+        """
+        rows = [(key, title, normalize(title), parent) for key, title, parent in iter_district_options(filters_data)]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO districts (key, title, name, parent) VALUES (?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    # --- Queries ---
+    def _scan(self, south: float, west: float, north: float, east: float) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Returns the tokens and coordinates of all posts inside a box, read from the cell index."""
+        tokens, latitudes, longitudes = [], [], []
+        for first, last in _cell_ranges(south, west, north, east, self.max_cells):
+            for token, latitude, longitude in self._conn.execute(
+                "SELECT token, latitude, longitude FROM posts WHERE cell BETWEEN ? AND ? "
+                "AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+                (first, last, south, north, west, east),
+            ):
+                tokens.append(token)
+                latitudes.append(latitude)
+                longitudes.append(longitude)
+        return tokens, np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64)
+
+    def bbox(self, south: float, west: float, north: float, east: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Finds the posts inside a bounding box.
+
+        :return: {"token", "latitude", "longitude"} entries, at most 'limit' of them.
+        """
+        tokens, latitudes, longitudes = self._scan(south, west, north, east)
+        return [
+            {"token": token, "latitude": latitude, "longitude": longitude}
+            for token, latitude, longitude in zip(tokens[:limit], latitudes.tolist(), longitudes.tolist())
+        ]
+
+    def radius(self, latitude: float, longitude: float, radius_m: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Finds the posts within 'radius_m' meters of a point.
+
+        :return: {"token", "latitude", "longitude", "distance_m"} entries, nearest first.
+        """
+        tokens, latitudes, longitudes = self._scan(*_radius_box(latitude, longitude, radius_m))
+        if not tokens:
+            return []
+        distances = haversine_m(latitude, longitude, latitudes, longitudes)
+        inside = np.flatnonzero(distances <= radius_m)
+        order = inside[np.argsort(distances[inside], kind="stable")][:limit]
+        return [
+            {"token": tokens[i], "latitude": float(latitudes[i]), "longitude": float(longitudes[i]),
+             "distance_m": float(distances[i])}
+            for i in order.tolist()
+        ]
+
+    def nearest(self, latitude: float, longitude: float, k: int = 10, start_radius_m: float = 500,
+                max_radius_m: float = 50000) -> List[Dict[str, Any]]:
+        """
+        Finds the k posts nearest to a point. The search radius starts at 'start_radius_m' and
+        doubles until k posts are inside it, so dense areas only read a few grid squares.
+
+        :return: Up to k {"token", "latitude", "longitude", "distance_m"} entries, nearest first.
+        """
+        radius_m = start_radius_m
+        while True:
+            found = self.radius(latitude, longitude, radius_m, limit=k)
+            if len(found) >= k or radius_m >= max_radius_m:
+                return found
+            radius_m = min(radius_m * 2, max_radius_m)
+
+    def district_stats(self, roll_up: bool = True) -> List[Dict[str, Any]]:
+        """
+        Aggregates posts per district: number of posts, number with a location, the centroid and
+        the bounding box of their locations. Districts of the search rows are matched by name to
+        the hierarchy from load_districts; with 'roll_up', every parent district also counts the
+        posts of its children. Districts missing from the hierarchy are reported with key None.
+
+        :return: A list of {"key", "title", "parent", "posts", "located", "latitude", "longitude",
+            "bbox"} entries, most posts first.
+        """
+        hierarchy = self._conn.execute("SELECT key, title, name, parent FROM districts").fetchall()
+        by_name = {}
+        for key, _, name, _ in hierarchy:
+            by_name.setdefault(name, key)
+        parents = {key: parent for key, _, _, parent in hierarchy}
+
+        totals: Dict[Any, Dict[str, Any]] = {}
+        for key, title, _, parent in hierarchy:
+            totals[key] = {"key": key, "title": title, "parent": parent, "posts": 0, "located": 0,
+                           "_sum": [0.0, 0.0], "_box": [math.inf, math.inf, -math.inf, -math.inf]}
+
+        rows = self._conn.execute(
+            "SELECT district, COUNT(*), COUNT(cell), TOTAL(latitude), TOTAL(longitude), "
+            "MIN(latitude), MIN(longitude), MAX(latitude), MAX(longitude) "
+            "FROM posts WHERE district IS NOT NULL GROUP BY district"
+        ).fetchall()
+        for district, posts, located, latitude_sum, longitude_sum, *box in rows:
+            key = by_name.get(normalize(district))
+            targets = []
+            if key is None:
+                targets.append(totals.setdefault(("unmatched", district), {
+                    "key": None, "title": district, "parent": None, "posts": 0, "located": 0,
+                    "_sum": [0.0, 0.0], "_box": [math.inf, math.inf, -math.inf, -math.inf]}))
+            else:
+                seen = set()
+                while key is not None and key not in seen:
+                    seen.add(key)
+                    targets.append(totals[key])
+                    key = parents.get(key) if roll_up else None
+            for entry in targets:
+                entry["posts"] += posts
+                entry["located"] += located
+                if located:
+                    entry["_sum"][0] += latitude_sum
+                    entry["_sum"][1] += longitude_sum
+                    entry["_box"] = [min(entry["_box"][0], box[0]), min(entry["_box"][1], box[1]),
+                                     max(entry["_box"][2], box[2]), max(entry["_box"][3], box[3])]
+
+        result = []
+        for entry in totals.values():
+            if not entry["posts"]:
+                continue
+            latitude_sum, longitude_sum = entry.pop("_sum")
+            box = entry.pop("_box")
+            located = entry["located"]
+            entry["latitude"] = latitude_sum / located if located else None
+            entry["longitude"] = longitude_sum / located if located else None
+            entry["bbox"] = box if located else None
+            result.append(entry)
+        return sorted(result, key=lambda entry: -entry["posts"])
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM posts WHERE cell IS NOT NULL").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+# --- How to use the code ---
+if __name__ == "__main__":
+    # The outputs of 3_get_search.py, crawl_post_details (batch.py) and 2_get_fillters.py
+    with open("result.json", encoding="utf-8") as f:
+        search_results = json.load(f)
+    with open("detail_posts.json", encoding="utf-8") as f:
+        post_details = json.load(f)
+    with open("filters_with_locations.json", encoding="utf-8") as f:
+        filters_with_locations = json.load(f)
+
+    geo_index = GeoIndex("divar_geo.db")
+    geo_index.load_districts(filters_with_locations)
+    geo_index.add_search_results(search_results)
+    geo_index.add_posts(post_details)
+
+    # Posts within 1 km of Vanak Square, the 5 nearest ones and the busiest districts
+    print(json.dumps(geo_index.radius(35.7575, 51.4100, 1000, limit=20), ensure_ascii=False, indent=4))
+    print(json.dumps(geo_index.nearest(35.7575, 51.4100, k=5), ensure_ascii=False, indent=4))
+    print(json.dumps(geo_index.district_stats()[:10], ensure_ascii=False, indent=4))
+    geo_index.close()
@@ -4,29 +4,31 @@ import requests
 import json
 from urllib.parse import quote
 
-def receive_suggestions(query: str, output_filename="suggestions.json"):
+def fetch_suggestions(query: str, timeout: float = 10):
     """
-    Fetches search suggestions from the Jabama API based on a query and saves them to a file.
+    Fetches search suggestions from the Jabama API based on a query.
 
     Args:
         query (str): The user's search term (e.g., "khuzestan").
-        output_filename (str): The name of the output JSON file.
+        timeout (float): The request timeout in seconds.
+
+    Returns:
+        list: The suggestions (title, description, api_keyword, pre_filters),
+              or None if the request failed.
     """
     encoded_query = quote(query)
     api_url = f"https://gw.jabama.com/api/v1/yoda/guest/search/suggestions/{encoded_query}"
     headers = {'User-Agent': 'Mozilla/5.0'}
 
     try:
-        response = requests.get(api_url, headers=headers, timeout=10)
+        response = requests.get(api_url, headers=headers, timeout=timeout)
         response.raise_for_status()
         data = response.json()
     except requests.exceptions.RequestException:
-        return  # Fail silently on connection error
+        return None # Fail silently on connection error
 
     all_suggestions = []
     sections = data.get("result", {}).get("sections", [])
-    if not sections:
-        return # No suggestions found
 
     for section in sections:
         for item in section.get("items", []):
@@ -37,6 +39,19 @@ def receive_suggestions(query: str, output_filename="suggestions.json"):
                 "api_keyword": item.get("url"), # The keyword for the next API call
                 "pre_filters": item.get("app", {}).get("preFilters")
             })
+    return all_suggestions
+
+def receive_suggestions(query: str, output_filename="suggestions.json"):
+    """
+    Fetches search suggestions from the Jabama API based on a query and saves them to a file.
+
+    Args:
+        query (str): The user's search term (e.g., "khuzestan").
+        output_filename (str): The name of the output JSON file.
+    """
+    all_suggestions = fetch_suggestions(query)
+    if not all_suggestions:
+        return # No suggestions found
 
     try:
         with open(output_filename, 'w', encoding='utf-8') as f:
@@ -3,13 +3,16 @@
 import requests
 import json
 
-def receive_filters(api_keyword: str, output_filename="available_filters.json"):
+def fetch_filters(api_keyword: str, timeout: float = 15):
     """
-    Fetches the available search filters for a given API keyword and saves them to a file.
+    Fetches the available search filters for a given API keyword.
 
     Args:
         api_keyword (str): The specific destination keyword (e.g., 'city-ramsar').
-        output_filename (str): The name of the output JSON file.
+        timeout (float): The request timeout in seconds.
+
+    Returns:
+        dict: The filters keyed by field name, or None if the request failed.
     """
     api_url = f"https://gw.jabama.com/api/v4/keyword/{api_keyword}"
     headers = {'Content-Type': 'application/json', 'User-Agent': 'Mozilla/5.0'}
@@ -17,16 +20,13 @@ def receive_filters(api_keyword: str, output_filename="available_filters.json"):
     json_data = {"page-size": 1}
 
     try:
-        response = requests.post(api_url, headers=headers, json=json_data, timeout=15)
+        response = requests.post(api_url, headers=headers, json=json_data, timeout=timeout)
         response.raise_for_status()
         api_data = response.json()
     except requests.exceptions.RequestException:
-        return # Fail silently on API error
+        return None # Fail silently on API error
 
     raw_filters = api_data.get("result", {}).get("filters", [])
-    if not raw_filters:
-        return # No filters found
-
     available_filters = {}
 
     for f in raw_filters:
@@ -73,6 +73,20 @@ def receive_filters(api_keyword: str, output_filename="available_filters.json"):
                 'options': options
             }
 
+    return available_filters
+
+def receive_filters(api_keyword: str, output_filename="available_filters.json"):
+    """
+    Fetches the available search filters for a given API keyword and saves them to a file.
+
+    Args:
+        api_keyword (str): The specific destination keyword (e.g., 'city-ramsar').
+        output_filename (str): The name of the output JSON file.
+    """
+    available_filters = fetch_filters(api_keyword)
+    if not available_filters:
+        return # No filters found
+
     try:
         with open(output_filename, 'w', encoding='utf-8') as f:
             json.dump(available_filters, f, indent=4, ensure_ascii=False)
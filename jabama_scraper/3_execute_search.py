@@ -3,11 +3,152 @@
 import requests
 import json
 
+def clean_item(item: dict) -> dict:
+    """
+    Converts one raw listing from the keyword API into the structured format.
+
+    Args:
+        item (dict): A single element of 'result.items' in the API response.
+    """
+    item_type = item.get('type')
+    item_code = item.get('code')
+    details_url = "URL not available"
+    if item_type and item_code:
+        try:
+            # Ensure item_code is an integer before formatting
+            slug = f"{item_type}-{int(item_code)}"
+            details_url = f"https://www.jabama.com/stay/{slug}"
+        except (ValueError, TypeError):
+            # Handle cases where item_code might not be a valid number
+            pass
+
+    amenities_list = [amenity.get('name') for amenity in item.get('amenities', [])]
+
+    return {
+        "name": item.get('name'),
+        "details_page_url": details_url,
+        "place_id": item.get('id'),
+        "type": item_type,
+        "location": {
+            "province": item.get('location', {}).get('province'),
+            "city": item.get('location', {}).get('city'),
+        },
+        "price": {
+            "per_night_rials": item.get('price', {}).get('perNight'),
+            "description": item.get('price', {}).get('text'),
+            "discount_percent": item.get('price', {}).get('discountPercent', 0)
+        },
+        "rating": {
+            "score": item.get('rate_review', {}).get('score', 0),
+            "count": int(item.get('rate_review', {}).get('count', 0)),
+        },
+        "capacity": {
+            "base": int(item.get('capacity', {}).get('base', 0)),
+            "extra": int(item.get('capacity', {}).get('extra', 0)),
+            "total": int(item.get('capacity', {}).get('base', 0)) + int(item.get('capacity', {}).get('extra', 0))
+        },
+        "specs": {
+            "bedrooms": int(item.get('accommodationMetrics', {}).get('bedroomsCount', 0)),
+            "bathrooms": int(item.get('accommodationMetrics', {}).get('bathroomsCount', 0)),
+            "building_size_sqm": item.get('accommodationMetrics', {}).get('buildingSize'),
+            "area_size_sqm": item.get('accommodationMetrics', {}).get('areaSize'),
+        },
+        "main_image_url": item.get('image'),
+        "all_images_url": item.get('images', []),
+        "amenities": amenities_list,
+        "tags": item.get('tags', []),
+        "description": item.get('description', '').strip()
+    }
+
+
+def clean_result_items(raw_items: list) -> dict:
+    """
+    Converts the raw 'result.items' list into a dictionary keyed "result_1", "result_2", ...
+
+    Args:
+        raw_items (list): The raw listings returned by the keyword API.
+    """
+    cleaned_results_dict = {}
+
+    # Use enumerate to create a 1-based index for the keys
+    for index, item in enumerate(raw_items, start=1):
+        # Create a key (e.g., "result_1") and add the item to the dictionary
+        cleaned_results_dict[f"result_{index}"] = clean_item(item)
+
+    return cleaned_results_dict
+
+
+def search_archive_key(api_keyword: str, json_data: dict) -> str:
+    """Builds the id under which a search response is stored in a raw archive."""
+    return f"{api_keyword}?{json.dumps(json_data, sort_keys=True, ensure_ascii=False)}"
+
+
+def build_search_request(api_keyword: str, selected_filters: dict = None, results_count: int = 10):
+    """
+    Builds the URL, headers and JSON payload of a keyword search.
+
+    Returns:
+        tuple: (api_url, headers, json_data)
+    """
+    api_url = f"https://gw.jabama.com/api/v4/keyword/{api_keyword}"
+    headers = {'User-Agent': 'Mozilla/5.0', 'Content-Type': 'application/json'}
+
+    json_data = {"page-size": results_count}
+    json_data.update(selected_filters or {})
+    return api_url, headers, json_data
+
+
+def open_search_stream(api_keyword: str, selected_filters: dict = None, results_count: int = 10, timeout: float = 20):
+    """
+    Sends the search request without reading the response body, for large page sizes.
+    The caller reads the body as a stream (e.g. common/json_stream.py) and closes the response.
+
+    Returns:
+        requests.Response: The open response, or None if the request failed.
+    """
+    api_url, headers, json_data = build_search_request(api_keyword, selected_filters, results_count)
+    try:
+        response = requests.post(api_url, headers=headers, json=json_data, timeout=timeout, stream=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return None # Fail silently on request error
+    return response
+
+
+def fetch_search_items(api_keyword: str, selected_filters: dict = None, results_count: int = 10, archive=None, timeout: float = 20):
+    """
+    Sends the search request and returns the raw 'result.items' list.
+
+    Args:
+        api_keyword (str): The exact destination keyword.
+        selected_filters (dict): A dictionary of selected filters.
+        results_count (int): The desired number of results.
+        archive (RawArchive, optional): Stores the raw response (see common/raw_archive.py).
+        timeout (float): The request timeout in seconds.
+
+    Returns:
+        list: The raw listings, or None if the request failed.
+    """
+    api_url, headers, json_data = build_search_request(api_keyword, selected_filters, results_count)
+
+    try:
+        response = requests.post(api_url, headers=headers, json=json_data, timeout=timeout)
+        response.raise_for_status()
+        if archive is not None:
+            archive.put("jabama/keyword", search_archive_key(api_keyword, json_data), response.content)
+        api_data = response.json()
+    except requests.exceptions.RequestException:
+        return None # Fail silently on request error
+
+    return api_data.get("result", {}).get("items", [])
+
+
 def receive_result(
     api_keyword: str,
     selected_filters: dict,
     results_count: int = 10,
-    output_filename="final_cleaned_results.json"
+    output_filename="final_cleaned_results.json",
+    archive=None
 ):
     """
     Executes a search with a specific keyword and filters, then saves the
@@ -18,89 +159,24 @@ def receive_result(
         selected_filters (dict): A dictionary of selected filters.
         results_count (int): The desired number of results.
         output_filename (str): The name for the final output file.
-    """
-    if selected_filters is None:
-        selected_filters = {}
+        archive (RawArchive, optional): Stores the raw response (see common/raw_archive.py).
 
-    api_url = f"https://gw.jabama.com/api/v4/keyword/{api_keyword}"
-    headers = {'User-Agent': 'Mozilla/5.0', 'Content-Type': 'application/json'}
-    
-    json_data = {"page-size": results_count}
-    json_data.update(selected_filters)
-
-    try:
-        response = requests.post(api_url, headers=headers, json=json_data, timeout=20)
-        response.raise_for_status()
-        api_data = response.json()
-    except requests.exceptions.RequestException:
+    Returns:
+        dict: The cleaned results, or None if the request failed.
+    """
+    raw_items = fetch_search_items(api_keyword, selected_filters, results_count, archive)
+    if raw_items is None:
         return # Fail silently on request error
 
-    raw_items = api_data.get("result", {}).get("items", [])
     if not raw_items:
         try:
             with open(output_filename, 'w', encoding='utf-8') as f:
                 json.dump({}, f) # Save an empty object if no results
         except IOError:
             pass # Fail silently on file error
-        return
+        return {}
 
-    cleaned_results_dict = {}
-    
-    # Use enumerate to create a 1-based index for the keys
-    for index, item in enumerate(raw_items, start=1):
-        item_type = item.get('type')
-        item_code = item.get('code')
-        details_url = "URL not available"
-        if item_type and item_code:
-            try:
-                # Ensure item_code is an integer before formatting
-                slug = f"{item_type}-{int(item_code)}"
-                details_url = f"https://www.jabama.com/stay/{slug}"
-            except (ValueError, TypeError):
-                # Handle cases where item_code might not be a valid number
-                pass
-
-        amenities_list = [amenity.get('name') for amenity in item.get('amenities', [])]
-
-        cleaned_item = {
-            "name": item.get('name'),
-            "details_page_url": details_url,
-            "place_id": item.get('id'),
-            "type": item_type,
-            "location": {
-                "province": item.get('location', {}).get('province'),
-                "city": item.get('location', {}).get('city'),
-            },
-            "price": {
-                "per_night_rials": item.get('price', {}).get('perNight'),
-                "description": item.get('price', {}).get('text'),
-                "discount_percent": item.get('price', {}).get('discountPercent', 0)
-            },
-            "rating": {
-                "score": item.get('rate_review', {}).get('score', 0),
-                "count": int(item.get('rate_review', {}).get('count', 0)),
-            },
-            "capacity": {
-                "base": int(item.get('capacity', {}).get('base', 0)),
-                "extra": int(item.get('capacity', {}).get('extra', 0)),
-                "total": int(item.get('capacity', {}).get('base', 0)) + int(item.get('capacity', {}).get('extra', 0))
-            },
-            "specs": {
-                "bedrooms": int(item.get('accommodationMetrics', {}).get('bedroomsCount', 0)),
-                "bathrooms": int(item.get('accommodationMetrics', {}).get('bathroomsCount', 0)),
-                "building_size_sqm": item.get('accommodationMetrics', {}).get('buildingSize'),
-                "area_size_sqm": item.get('accommodationMetrics', {}).get('areaSize'),
-            },
-            "main_image_url": item.get('image'),
-            "all_images_url": item.get('images', []),
-            "amenities": amenities_list,
-            "tags": item.get('tags', []),
-            "description": item.get('description', '').strip()
-        }
-        
-        # Create a key (e.g., "result_1") and add the item to the dictionary
-        result_key = f"result_{index}"
-        cleaned_results_dict[result_key] = cleaned_item
+    cleaned_results_dict = clean_result_items(raw_items)
 
     try:
         with open(output_filename, 'w', encoding='utf-8') as f:
@@ -108,6 +184,8 @@ def receive_result(
     except IOError:
         pass # Fail silently on file write error
 
+    return cleaned_results_dict
+
 if __name__ == "__main__":
     final_api_keyword = "city-ramsar"
     final_selections = {
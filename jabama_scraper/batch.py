@@ -0,0 +1,54 @@
+from typing import Any, Dict
+
+import requests
+
+from common.deadlines import Deadline, request_timeout
+from common.json_stream import iter_response_items
+from common.stages import load_stage
+
+search_stage = load_stage("jabama_scraper", "3_execute_search.py")
+
+
+def fetch_search_results(key: str, payload: Dict[str, Any], archive=None, deadline: Deadline = None):
+    """
+    Runs one keyword search and returns the cleaned results, or None on failure.
+
+    Args:
+        key (str): The work item key (e.g. "city-ramsar:villa").
+        payload (dict): The arguments of fetch_search_items:
+            {"api_keyword": ..., "selected_filters": ..., "results_count": ...}
+            With "stream": true, the response is parsed incrementally (common/json_stream.py),
+            so the raw body and the decoded response are not held for large results_count values
+            (the cleaned listings still are). The raw body is needed for an archive, so the
+            response is not streamed when one is given.
+        archive (RawArchive, optional): Keeps the raw search response (common/raw_archive.py).
+        deadline (Deadline, optional): The batch deadline. The search is a POST request,
+            so it is not hedged; its timeout is shortened to the time left.
+    """
+    timeout = request_timeout(deadline, 20)
+    if timeout is None:
+        return None
+    if payload.get("stream") and archive is None:
+        response = search_stage.open_search_stream(
+            payload["api_keyword"],
+            payload.get("selected_filters"),
+            payload.get("results_count", 10),
+            timeout=timeout,
+        )
+        if response is None:
+            return None
+        try:
+            items = iter_response_items(response, "result.items", deadline=deadline)
+            return search_stage.clean_result_items(items)
+        except (ValueError, TimeoutError, requests.exceptions.RequestException):
+            return None
+    raw_items = search_stage.fetch_search_items(
+        payload["api_keyword"],
+        payload.get("selected_filters"),
+        payload.get("results_count", 10),
+        archive,
+        timeout=timeout,
+    )
+    if raw_items is None:
+        return None
+    return search_stage.clean_result_items(raw_items)
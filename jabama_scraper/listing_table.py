@@ -0,0 +1,258 @@
+# file: listing_table.py
+
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Numeric columns and how to read them from a cleaned listing (see clean_item in 3_execute_search.py).
+NUMERIC_COLUMNS = {
+    "price": lambda item: item.get("price", {}).get("per_night_rials"),
+    "discount_percent": lambda item: item.get("price", {}).get("discount_percent"),
+    "rating": lambda item: item.get("rating", {}).get("score"),
+    "rating_count": lambda item: item.get("rating", {}).get("count"),
+    "capacity": lambda item: item.get("capacity", {}).get("total"),
+    "base_capacity": lambda item: item.get("capacity", {}).get("base"),
+    "bedrooms": lambda item: item.get("specs", {}).get("bedrooms"),
+    "bathrooms": lambda item: item.get("specs", {}).get("bathrooms"),
+}
+# Text columns stored as integer codes into a vocabulary.
+CATEGORY_COLUMNS = {
+    "type": lambda item: item.get("type"),
+    "province": lambda item: item.get("location", {}).get("province"),
+    "city": lambda item: item.get("location", {}).get("city"),
+}
+# List columns stored as bitsets, one bit per distinct value.
+SET_COLUMNS = {
+    "amenities": lambda item: item.get("amenities", []),
+    "tags": lambda item: item.get("tags", []),
+}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _set_value(value) -> str:
+    # Tags may be plain strings or small objects; both become a hashable text key.
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class ListingTable:
+    """
+    An in-memory, columnar table of cleaned Jabama listings.
+
+    Numeric fields are NumPy arrays, categories are integer codes and amenities/tags
+    are bitsets, so filter, sort and top-k queries run as vectorised operations
+    without calling the API again. Listings are keyed by 'place_id': loading a new
+    crawl updates the known listings in place and appends the new ones.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._capacity = capacity
+        self._row_of: Dict[Any, int] = {}
+        self._records: List[Dict[str, Any]] = []
+
+        self._numeric = {name: np.full(capacity, np.nan) for name in NUMERIC_COLUMNS}
+        self._codes = {name: np.full(capacity, -1, dtype=np.int32) for name in CATEGORY_COLUMNS}
+        self._vocab: Dict[str, Dict[str, int]] = {name: {} for name in list(CATEGORY_COLUMNS) + list(SET_COLUMNS)}
+        self._bits = {name: np.zeros((capacity, 1), dtype=np.uint64) for name in SET_COLUMNS}
+
+    def __len__(self) -> int:
+        return self._size
+
+    # --- Loading ---
+    def _grow(self, needed: int):
+        if needed <= self._capacity:
+            return
+        new_capacity = max(needed, self._capacity * 2)
+        extra = new_capacity - self._capacity
+        for name, values in self._numeric.items():
+            self._numeric[name] = np.concatenate([values, np.full(extra, np.nan)])
+        for name, values in self._codes.items():
+            self._codes[name] = np.concatenate([values, np.full(extra, -1, dtype=np.int32)])
+        for name, bits in self._bits.items():
+            self._bits[name] = np.concatenate([bits, np.zeros((extra, bits.shape[1]), dtype=np.uint64)])
+        self._capacity = new_capacity
+
+    def _code(self, column: str, value: str) -> int:
+        vocab = self._vocab[column]
+        if value not in vocab:
+            vocab[value] = len(vocab)
+            # Widen the bitset by one 64-bit word when the vocabulary outgrows it.
+            if column in self._bits and len(vocab) > self._bits[column].shape[1] * 64:
+                bits = self._bits[column]
+                self._bits[column] = np.hstack([bits, np.zeros((bits.shape[0], 1), dtype=np.uint64)])
+        return vocab[value]
+
+    def upsert(self, listings: Iterable[Dict[str, Any]]) -> int:
+        """
+        Adds cleaned listings to the table, replacing earlier versions with the same 'place_id'.
+
+        Returns:
+            int: The number of listings that were new to the table.
+        """
+        # row -> latest version of the listing in this batch
+        batch: Dict[int, Dict[str, Any]] = {}
+        added = 0
+        for item in listings:
+            place_id = item.get("place_id")
+            row = self._row_of.get(place_id)
+            if row is None:
+                row = self._size + added
+                if place_id is not None:
+                    self._row_of[place_id] = row
+                self._records.append(item)
+                added += 1
+            else:
+                self._records[row] = item
+            batch[row] = item
+
+        if not batch:
+            return 0
+        self._grow(self._size + added)
+        self._size += added
+        rows = np.fromiter(batch.keys(), dtype=np.int64, count=len(batch))
+        items = list(batch.values())
+
+        # Columns are written for the whole batch at once.
+        for name, getter in NUMERIC_COLUMNS.items():
+            self._numeric[name][rows] = [_to_float(getter(item)) for item in items]
+        for name, getter in CATEGORY_COLUMNS.items():
+            values = [getter(item) for item in items]
+            self._codes[name][rows] = [self._code(name, v) if v is not None else -1 for v in values]
+        for name, getter in SET_COLUMNS.items():
+            set_rows, codes = [], []
+            for row, item in zip(rows, items):
+                for value in getter(item) or []:
+                    if value is not None:
+                        set_rows.append(row)
+                        codes.append(self._code(name, _set_value(value)))
+            bits = self._bits[name]
+            bits[rows] = 0
+            codes = np.asarray(codes, dtype=np.uint64)
+            np.bitwise_or.at(
+                bits,
+                (np.asarray(set_rows, dtype=np.int64), (codes // 64).astype(np.int64)),
+                np.left_shift(np.uint64(1), codes % np.uint64(64)),
+            )
+        return added
+
+    def load_results_file(self, filename: str) -> int:
+        """Loads the output file of receive_result (e.g. 'final_cleaned_results.json')."""
+        with open(filename, encoding="utf-8") as f:
+            results = json.load(f)
+        return self.upsert(results.values() if isinstance(results, dict) else results)
+
+    # --- Querying ---
+    def _set_mask(self, column: str, values: Iterable[str]) -> Optional[np.ndarray]:
+        """Returns the required-bits mask for 'values', or None if one of them was never seen."""
+        mask = np.zeros(self._bits[column].shape[1], dtype=np.uint64)
+        for value in values:
+            code = self._vocab[column].get(_set_value(value))
+            if code is None:
+                return None
+            mask[code // 64] |= np.uint64(1) << np.uint64(code % 64)
+        return mask
+
+    def filter(
+        self,
+        min_price: float = None,
+        max_price: float = None,
+        min_capacity: int = None,
+        min_bedrooms: int = None,
+        min_bathrooms: int = None,
+        min_rating: float = None,
+        min_rating_count: int = None,
+        types: List[str] = None,
+        provinces: List[str] = None,
+        cities: List[str] = None,
+        amenities: List[str] = None,
+        tags: List[str] = None,
+    ) -> np.ndarray:
+        """
+        Returns the row numbers of listings that match every given condition.
+        'types', 'provinces' and 'cities' match any of the values; 'amenities' and
+        'tags' require all of the values.
+        """
+        n = self._size
+        mask = np.ones(n, dtype=bool)
+
+        ranges = [
+            ("price", min_price, max_price),
+            ("capacity", min_capacity, None),
+            ("bedrooms", min_bedrooms, None),
+            ("bathrooms", min_bathrooms, None),
+            ("rating", min_rating, None),
+            ("rating_count", min_rating_count, None),
+        ]
+        for column, low, high in ranges:
+            values = self._numeric[column][:n]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+
+        for column, wanted in (("type", types), ("province", provinces), ("city", cities)):
+            if wanted:
+                codes = [self._vocab[column][v] for v in wanted if v in self._vocab[column]]
+                mask &= np.isin(self._codes[column][:n], codes)
+
+        for column, wanted in (("amenities", amenities), ("tags", tags)):
+            if wanted:
+                required = self._set_mask(column, wanted)
+                if required is None:
+                    return np.empty(0, dtype=np.int64)
+                bits = self._bits[column][:n]
+                mask &= np.all((bits & required) == required, axis=1)
+
+        return np.flatnonzero(mask)
+
+    def query(self, sort_by: str = None, descending: bool = False, limit: int = None, **conditions) -> List[Dict[str, Any]]:
+        """
+        Filters, sorts and limits the listings.
+
+        Args:
+            sort_by (str): A numeric column, e.g. 'price', 'rating' or 'capacity'.
+            descending (bool): Sort from the highest value down.
+            limit (int): Return only the first 'limit' listings (top-k).
+            **conditions: The filter conditions accepted by filter().
+
+        Returns:
+            list: The matching cleaned listings.
+        """
+        rows = self.filter(**conditions)
+
+        if sort_by is not None:
+            keys = self._numeric[sort_by][rows]
+            # Listings without a value always go last.
+            keys = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+            if limit is not None and limit < len(rows):
+                # Top-k: partition first, then sort only the k selected rows.
+                top = np.argpartition(keys, limit)[:limit]
+                rows = rows[top[np.argsort(keys[top], kind="stable")]]
+            else:
+                rows = rows[np.argsort(keys, kind="stable")]
+
+        if limit is not None:
+            rows = rows[:limit]
+        return [self._records[row] for row in rows]
+
+
+if __name__ == "__main__":
+    table = ListingTable()
+    table.load_results_file("final_cleaned_results.json")
+
+    cheapest_villas_with_pool = table.query(
+        types=["villa"],
+        amenities=["استخر"],
+        min_capacity=6,
+        sort_by="price",
+        limit=10,
+    )
+    with open("local_query_results.json", "w", encoding="utf-8") as f:
+        json.dump(cheapest_villas_with_pool, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,349 @@
+# file: price_sweep.py
+
+import argparse
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.deadlines import Deadline, request_timeout
+from common.stages import load_stage
+
+search_stage = load_stage("jabama_scraper", "3_execute_search.py")
+
+CELLS_TABLE = """
+CREATE TABLE IF NOT EXISTS cells (
+    place_id         TEXT NOT NULL,
+    check_in         TEXT NOT NULL,
+    nights           INTEGER NOT NULL,
+    keyword          TEXT NOT NULL,
+    price            REAL,
+    discount_percent REAL,
+    fetched_at       REAL NOT NULL,
+    PRIMARY KEY (place_id, check_in, nights, keyword)
+);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    keyword    TEXT NOT NULL,
+    check_in   TEXT NOT NULL,
+    nights     INTEGER NOT NULL,
+    results    INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    truncated  INTEGER,
+    PRIMARY KEY (keyword, check_in, nights)
+);
+""" + CELLS_TABLE
+
+CELL_COLUMNS = "place_id, check_in, nights, keyword, price, discount_percent, fetched_at"
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def date_filters(check_in: date, check_out: date) -> Dict[str, Any]:
+    """
+    The search payload fields that select a stay. They are merged into the filters of
+    fetch_search_items; override this function (the 'date_payload' argument of sweep)
+    if the API expects another format.
+    """
+    return {"date": {"checkIn": check_in.isoformat(), "checkOut": check_out.isoformat()}}
+
+
+def date_grid(start: date, end: date, nights: Sequence[int] = (1,), step_days: int = 1) -> List[Tuple[date, int]]:
+    """
+    Builds the (check-in date, number of nights) cells of a sweep.
+
+    Args:
+        start (date): The first check-in date.
+        end (date): The last check-in date (inclusive).
+        nights (list): The stay lengths to query for every check-in date.
+        step_days (int): Days between two check-in dates (e.g. 7 for one date per week).
+    """
+    cells = []
+    day = start
+    while day <= end:
+        cells.extend((day, n) for n in nights)
+        day += timedelta(days=step_days)
+    return cells
+
+
+class PriceSweep:
+    """
+    Sweeps Jabama searches over a calendar and keeps the price of every
+    (listing, check-in date, nights) cell in a SQLite cache.
+
+    A (keyword, date) search fetched less than 'max_age' seconds ago is skipped,
+    so an interrupted sweep resumes where it stopped and a nightly sweep only
+    refreshes stale cells.
+
+    A listing found by several keywords has a cell per keyword, so what one keyword's
+    search returned does not depend on the order the searches ran in. The API serves
+    a single page of results; a search that filled the page is marked as truncated,
+    since listings it did not return may simply be on a later page.
+    """
+
+    def __init__(self, path: str = "jabama_price_sweep.db", max_age: float = 24 * 3600):
+        self.max_age = max_age
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _migrate(self):
+        """Upgrades a cache file created by an older version of the schema."""
+        if "truncated" not in {row[1] for row in self._conn.execute("PRAGMA table_info(queries)")}:
+            # Whether the older searches were truncated is unknown (NULL).
+            self._conn.execute("ALTER TABLE queries ADD COLUMN truncated INTEGER")
+        key = {row[1] for row in self._conn.execute("PRAGMA table_info(cells)") if row[5]}
+        if "keyword" not in key:
+            self._conn.executescript(f"""
+                ALTER TABLE cells RENAME TO cells_old;
+                {CELLS_TABLE}
+                INSERT INTO cells ({CELL_COLUMNS}) SELECT {CELL_COLUMNS} FROM cells_old;
+                DROP TABLE cells_old;
+            """)
+
+    # --- Cache ---
+    def _is_fresh(self, keyword: str, check_in: date, nights: int, place_ids: Optional[List[str]]) -> bool:
+        threshold = time.time() - self.max_age
+        with self._lock:
+            if place_ids is None:
+                row = self._conn.execute(
+                    "SELECT 1 FROM queries WHERE keyword = ? AND check_in = ? AND nights = ? AND fetched_at >= ?",
+                    (keyword, check_in.isoformat(), nights, threshold),
+                ).fetchone()
+                return row is not None
+            # When only some listings matter, the search is skipped if all of them have a recent cell.
+            fresh = self._conn.execute(
+                f"SELECT COUNT(DISTINCT place_id) FROM cells WHERE check_in = ? AND nights = ? AND fetched_at >= ? "
+                f"AND place_id IN ({', '.join('?' * len(place_ids))})",
+                (check_in.isoformat(), nights, threshold, *place_ids),
+            ).fetchone()[0]
+            return fresh == len(place_ids)
+
+    def _store(self, keyword: str, check_in: date, nights: int, listings: List[Dict[str, Any]], truncated: bool):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queries (keyword, check_in, nights, results, fetched_at, truncated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (keyword, check_in.isoformat(), nights, len(listings), now, int(truncated)),
+            )
+            # A refreshed search replaces its previous result: listings it no longer returns lose their cell.
+            self._conn.execute(
+                "DELETE FROM cells WHERE keyword = ? AND check_in = ? AND nights = ?",
+                (keyword, check_in.isoformat(), nights),
+            )
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO cells ({CELL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (str(item["place_id"]), check_in.isoformat(), nights, keyword,
+                     _to_float(item.get("price", {}).get("per_night_rials")),
+                     _to_float(item.get("price", {}).get("discount_percent")), now)
+                    for item in listings if item.get("place_id") is not None
+                ],
+            )
+
+    # --- Sweep ---
+    def _fetch_cell(self, keyword: str, selected_filters: Dict[str, Any], check_in: date, nights: int,
+                    results_count: int, date_payload: Callable[[date, date], Dict[str, Any]],
+                    deadline: Optional[Deadline]) -> Optional[int]:
+        timeout = request_timeout(deadline, 20)
+        if timeout is None:
+            return None
+        filters = {**selected_filters, **date_payload(check_in, check_in + timedelta(days=nights))}
+        raw_items = search_stage.fetch_search_items(keyword, filters, results_count, timeout=timeout)
+        if raw_items is None:
+            return None  # Not stored: the cell is retried by the next sweep
+        listings = [search_stage.clean_item(item) for item in raw_items]
+        self._store(keyword, check_in, nights, listings, truncated=len(raw_items) >= results_count)
+        return len(listings)
+
+    def sweep(
+        self,
+        keywords: Iterable[str],
+        cells: Iterable[Tuple[date, int]],
+        selected_filters: Optional[Dict[str, Any]] = None,
+        place_ids: Optional[Iterable[Any]] = None,
+        results_count: int = 100,
+        workers: int = 4,
+        date_payload: Callable[[date, date], Dict[str, Any]] = date_filters,
+        deadline_seconds: Optional[float] = None,
+    ) -> Dict[str, int]:
+        """
+        Runs one search per (keyword, check-in date, nights) cell that is not fresh in the cache.
+
+        Args:
+            keywords (list): Jabama API keywords (e.g. 'city-ramsar').
+            cells (list): (check-in date, nights) pairs, e.g. from date_grid.
+            selected_filters (dict, optional): Extra filters for every search (see 3_execute_search.py).
+            place_ids (list, optional): Only these listings matter; a search is skipped when
+                all of them already have a fresh cell for its date.
+            results_count (int): Page size of each search. A search that returns a full page is
+                marked as truncated (see matrix).
+            workers (int): Maximum number of searches in flight.
+            date_payload (callable): Builds the date fields of the payload, see date_filters.
+            deadline_seconds (float, optional): Stop sending searches after this many seconds.
+
+        Returns:
+            dict: Number of searches fetched, skipped as fresh and failed.
+        """
+        selected_filters = selected_filters or {}
+        cells = list(cells)
+        place_ids = [str(place_id) for place_id in place_ids] if place_ids is not None else None
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        stats = {"fetched": 0, "skipped": 0, "failed": 0}
+
+        tasks = []
+        for keyword in keywords:
+            for check_in, nights in cells:
+                if self._is_fresh(keyword, check_in, nights, place_ids):
+                    stats["skipped"] += 1
+                else:
+                    tasks.append((keyword, check_in, nights))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._fetch_cell, keyword, selected_filters, check_in, nights,
+                                results_count, date_payload, deadline)
+                for keyword, check_in, nights in tasks
+            ]
+            for future in as_completed(futures):
+                try:
+                    fetched = future.result()
+                except Exception:
+                    fetched = None
+                stats["fetched" if fetched is not None else "failed"] += 1
+        return stats
+
+    # --- Matrix ---
+    def matrix(self, nights: int = 1, start: Optional[date] = None, end: Optional[date] = None,
+               keywords: Optional[Iterable[str]] = None, field: str = "price"):
+        """
+        Builds a listing x check-in date matrix from the cache.
+
+        Args:
+            nights (int): The stay length to read.
+            start / end (date, optional): Limit the check-in dates.
+            keywords (list, optional): Only listings found through these keywords.
+            field (str): 'price', 'discount_percent' or 'available'. For 'available', a cell is
+                1 if the listing was returned for that date, 0 if a complete (not truncated) search
+                of one of its keywords for that date did not return it, and NaN otherwise (the date
+                was never searched, or only by searches that filled their page).
+
+        Returns:
+            tuple: (place ids, check-in dates as ISO strings, float32 array of shape (listings, dates)).
+        """
+        if field not in ("price", "discount_percent", "available"):
+            raise ValueError(f"Unknown field: {field}")
+
+        conditions, params = ["nights = ?"], [nights]
+        if start is not None:
+            conditions.append("check_in >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            conditions.append("check_in <= ?")
+            params.append(end.isoformat())
+        if keywords is not None:
+            keywords = list(keywords)
+            conditions.append(f"keyword IN ({', '.join('?' * len(keywords))})")
+            params.extend(keywords)
+        where = " AND ".join(conditions)
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT place_id, check_in, keyword, price, discount_percent FROM cells WHERE {where}", params
+            ).fetchall()
+            searched = self._conn.execute(
+                f"SELECT keyword, check_in, truncated FROM queries WHERE {where}", params
+            ).fetchall()
+
+        place_ids = sorted({row[0] for row in rows})
+        dates = sorted({row[1] for row in rows} | {row[1] for row in searched})
+        row_of = {place_id: i for i, place_id in enumerate(place_ids)}
+        column_of = {day: j for j, day in enumerate(dates)}
+        values = np.full((len(place_ids), len(dates)), np.nan, dtype=np.float32)
+        if not rows:
+            return place_ids, dates, values
+
+        rows_index = np.fromiter((row_of[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        columns_index = np.fromiter((column_of[row[1]] for row in rows), dtype=np.int64, count=len(rows))
+        if field == "available":
+            # Listings of a keyword that a complete search of that keyword did not return are unavailable
+            # on that date. A truncated search says nothing about the listings it did not return.
+            keyword_rows: Dict[str, set] = {}
+            for place_id, _, keyword, _, _ in rows:
+                keyword_rows.setdefault(keyword, set()).add(row_of[place_id])
+            for keyword, day, truncated in searched:
+                if truncated is None or truncated:
+                    continue
+                listing_rows = list(keyword_rows.get(keyword, ()))
+                values[listing_rows, column_of[day]] = 0
+            values[rows_index, columns_index] = 1
+        else:
+            position = 3 if field == "price" else 4
+            values[rows_index, columns_index] = [np.nan if row[position] is None else row[position] for row in rows]
+        return place_ids, dates, values
+
+    def save_matrix(self, filename: str, nights: Sequence[int] = (1,), **options):
+        """
+        Saves the price and availability matrices of every stay length to a compressed .npz file.
+
+        The arrays 'price' and 'available' have the shape (len(nights), listings, dates); the
+        arrays 'nights', 'place_ids' and 'dates' label the three axes. A listing or date that
+        only occurs for some stay lengths is NaN for the others.
+        """
+        matrices = [(self.matrix(n, field="price", **options), self.matrix(n, field="available", **options))
+                    for n in nights]
+        place_ids = sorted({place_id for (ids, _, _), _ in matrices for place_id in ids})
+        dates = sorted({day for (_, days, _), _ in matrices for day in days})
+        row_of = {place_id: i for i, place_id in enumerate(place_ids)}
+        column_of = {day: j for j, day in enumerate(dates)}
+        shape = (len(nights), len(place_ids), len(dates))
+        prices, available = np.full(shape, np.nan, dtype=np.float32), np.full(shape, np.nan, dtype=np.float32)
+        for k, ((ids, days, price_values), (_, _, available_values)) in enumerate(matrices):
+            rows = np.array([row_of[place_id] for place_id in ids], dtype=np.int64)
+            columns = np.array([column_of[day] for day in days], dtype=np.int64)
+            prices[k][np.ix_(rows, columns)] = price_values
+            available[k][np.ix_(rows, columns)] = available_values
+        np.savez_compressed(filename, nights=np.array(list(nights)), place_ids=np.array(place_ids),
+                            dates=np.array(dates), price=prices, available=available)
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep Jabama prices over a range of check-in dates.")
+    parser.add_argument("keywords", nargs="+", help="Jabama API keywords, e.g. city-ramsar.")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="First check-in date (YYYY-MM-DD).")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="Last check-in date (YYYY-MM-DD).")
+    parser.add_argument("--nights", type=int, nargs="+", default=[1])
+    parser.add_argument("--step-days", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-age-hours", type=float, default=24)
+    parser.add_argument("--cache", default="jabama_price_sweep.db")
+    parser.add_argument("--output", default="jabama_price_matrix.npz")
+    args = parser.parse_args()
+
+    sweep = PriceSweep(args.cache, max_age=args.max_age_hours * 3600)
+    stats = sweep.sweep(args.keywords, date_grid(args.start, args.end, args.nights, args.step_days),
+                        workers=args.workers)
+    print(stats)
+    sweep.save_matrix(args.output, nights=args.nights, start=args.start, end=args.end, keywords=args.keywords)
+    sweep.close()
+
+
+if __name__ == "__main__":
+    main()
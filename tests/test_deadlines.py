@@ -0,0 +1,35 @@
+import random
+import time
+
+from common.deadlines import Hedger
+
+
+def _p99(latencies):
+    ordered = sorted(latencies)
+    return ordered[int(len(ordered) * 0.99) - 1]
+
+
+def test_hedging_cuts_the_latency_tail():
+    # 3% of the attempts stall for 100 ms, independently of each other, the rest answer in 2 ms.
+    rng = random.Random(7)
+
+    def request(timeout):
+        time.sleep(0.1 if rng.random() < 0.03 else 0.002)
+        return "ok"
+
+    def run(hedger, calls=500):
+        latencies = []
+        for _ in range(calls):
+            started = time.monotonic()
+            assert hedger.call("test/endpoint", request) == "ok"
+            latencies.append(time.monotonic() - started)
+        return latencies
+
+    plain = run(Hedger(max_hedge_ratio=0))
+    hedger = Hedger(workers=8)
+    hedged = run(hedger)
+
+    stats = hedger.stats()["test/endpoint"]
+    assert 0 < stats["hedges"] <= 0.1 * stats["requests"]
+    assert _p99(plain) > 0.09
+    assert _p99(hedged) < _p99(plain) / 2
@@ -0,0 +1,63 @@
+from divar_scraper.dedup import NearDuplicateIndex, mark_search_duplicates
+
+ORIGINAL = "گیتار یاماها C40 نو در حد آکبند با کاور و پیک، فروش فوری به دلیل مهاجرت"
+REPOST = "گیتار یاماها C40 نو در حد آکبند با کاور و پیک، فروش فوری به دلیل مهاجرت!"
+
+
+def _results():
+    return {
+        "result_1": {"token": "original", "title": ORIGINAL},
+        "result_2": {"token": "repost", "title": REPOST},
+        "result_3": {"token": "other", "title": "میز تحریر چوبی کودک، سالم و تمیز، تحویل در محل"},
+    }
+
+
+def test_marking_is_idempotent_on_a_persisted_index(tmp_path):
+    path = str(tmp_path / "minhash.db")
+
+    index = NearDuplicateIndex(path)
+    first = _results()
+    assert mark_search_duplicates(first, index) == ["original", "other"]
+    assert first["result_2"]["duplicate_of"] == "original"
+    index.close()
+
+    # A second run over the same rows, with the original and its repost both already indexed.
+    index = NearDuplicateIndex(path)
+    second = _results()
+    assert mark_search_duplicates(second, index) == ["original", "other"]
+    assert "duplicate_of" not in second["result_1"]
+    assert second["result_2"]["duplicate_of"] == "original"
+    index.close()
+
+
+def test_known_document_only_matches_earlier_documents(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "minhash.db"))
+    assert index.add_or_match("original", ORIGINAL) == []
+    assert [doc_id for doc_id, _ in index.add_or_match("repost", REPOST)] == ["original"]
+    assert index.add_or_match("original", ORIGINAL) == []
+    index.close()
+
+
+def test_existing_index_keeps_its_text_normalization(tmp_path):
+    import sqlite3
+
+    from divar_scraper.dedup import TEXT_VERSION
+
+    text = "آپارتمان ۱۲۰ متری، طبقه ۳، ونک"
+    assert NearDuplicateIndex(str(tmp_path / "new.db")).text_version == TEXT_VERSION
+
+    # An index file written before the version was recorded holds version-1 signatures.
+    path = str(tmp_path / "old.db")
+    index = NearDuplicateIndex(path)
+    index.text_version = 1
+    index.add("old", text)
+    index.close()
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE meta")
+    conn.commit()
+    conn.close()
+
+    index = NearDuplicateIndex(path)
+    assert index.text_version == 1
+    assert index.query(text) == [("old", 1.0)]
+    index.close()
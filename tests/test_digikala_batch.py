@@ -0,0 +1,38 @@
+import requests
+
+from common.work_queue import DONE, WorkQueue, run_queue
+from digikala_scraper import batch
+
+
+class _EmptyPage:
+    content = b'{"data": {"products": []}}'
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"data": {"products": []}}
+
+
+def _unreachable(*args, **kwargs):
+    raise requests.exceptions.ConnectionError("connection refused")
+
+
+def test_failed_search_request_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch.search_stage.requests, "get", _unreachable)
+    assert batch.fetch_search_page("q:1", {"query": "q", "page": 1}) is None
+
+    with WorkQueue(str(tmp_path / "queue.db"), max_attempts=3) as queue:
+        queue.enqueue([("q:1", {"query": "q", "page": 1})])
+        run_queue(queue, batch.fetch_search_page, workers=1, batch_size=1)
+        # Every attempt failed; the item is failed instead of completed with an empty result.
+        assert dict(queue.results()) == {}
+
+
+def test_empty_page_is_a_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch.search_stage.requests, "get", lambda *args, **kwargs: _EmptyPage())
+    with WorkQueue(str(tmp_path / "queue.db")) as queue:
+        queue.enqueue([("q:99", {"query": "q", "page": 99})])
+        run_queue(queue, batch.fetch_search_page, workers=1)
+        assert queue.counts() == {DONE: 1}
+        assert dict(queue.results()) == {"q:99": []}
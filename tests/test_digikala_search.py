@@ -0,0 +1,71 @@
+import requests
+
+from common.stages import load_stage
+
+search_stage = load_stage("digikala_scraper", "2_search.py")
+
+
+class _Response:
+    def __init__(self, status=200, data=None, body=None):
+        self.status = status
+        self._data = data
+        self.content = body if body is not None else b"{}"
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status} Server Error")
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("Expecting value")
+        return self._data
+
+    def close(self):
+        self.closed = True
+
+
+def _serve(monkeypatch, response):
+    sent = []
+
+    def get(url, params=None, headers=None, timeout=None, stream=False):
+        sent.append({"params": params, "timeout": timeout, "stream": stream})
+        return response
+
+    monkeypatch.setattr(search_stage.requests, "get", get)
+    return sent
+
+
+def test_failed_stream_is_closed(monkeypatch):
+    response = _Response(status=503)
+    sent = _serve(monkeypatch, response)
+    assert search_stage.open_search_stream("گوشی", 2, timeout=3) is None
+    assert response.closed
+    assert sent == [{"params": {"q": "گوشی", "page": 2}, "timeout": 3, "stream": True}]
+
+
+def test_errors_and_empty_pages(monkeypatch):
+    for response in (_Response(status=500), _Response(data=None)):
+        _serve(monkeypatch, response)
+        assert search_stage.search_digikala("گوشی") is None
+        assert search_stage.search_digikala_page("گوشی") is None
+
+    _serve(monkeypatch, _Response(data={"data": {"products": []}}))
+    assert search_stage.search_digikala("گوشی", page=99) == []
+    assert search_stage.search_digikala_page("گوشی", page=99) == {"products": [], "total_items": 0, "total_pages": 1}
+
+
+def test_products_and_pager(monkeypatch):
+    data = {"data": {"products": [{"id": 1, "title_fa": "گوشی"}], "pager": {"total_items": 250, "total_pages": 13}}}
+    _serve(monkeypatch, _Response(data=data, body=b"raw"))
+
+    class Archive:
+        def put(self, endpoint, item_id, body):
+            self.stored = (endpoint, item_id, body)
+
+    archive = Archive()
+    products = search_stage.search_digikala("گوشی", filters={"price": {"min": 1, "max": 9}}, archive=archive)
+    assert [product["id"] for product in products] == [1]
+    assert archive.stored[0] == "digikala/search" and archive.stored[2] == b"raw"
+    page = search_stage.search_digikala_page("گوشی")
+    assert (page["total_items"], page["total_pages"], len(page["products"])) == (250, 13, 1)
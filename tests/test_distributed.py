@@ -0,0 +1,30 @@
+import time
+
+from common.distributed import SQLiteCoordinator
+from jabama_scraper import batch as jabama_batch
+
+
+def test_steal_takes_items_leased_without_an_owner(tmp_path):
+    with SQLiteCoordinator(str(tmp_path / "queue.db"), steal_after=0) as coordinator:
+        coordinator.enqueue([("a", 1), ("b", 2), ("c", 3)])
+        assert [key for key, _ in coordinator.lease(1)] == ["a"]
+        assert [key for key, _ in coordinator.lease(1, owner="node-1")] == ["b"]
+        time.sleep(0.01)
+        # node-1 does not steal its own item; the one without an owner can be taken.
+        assert [key for key, _ in coordinator.steal("node-1", 10)] == ["a"]
+        time.sleep(0.01)
+        assert sorted(key for key, _ in coordinator.steal("node-2", 10)) == ["a", "b"]
+
+
+def test_jabama_search_results_are_archived(monkeypatch):
+    calls = []
+
+    def fetch_search_items(api_keyword, selected_filters, results_count, archive=None, timeout=20):
+        calls.append((api_keyword, archive))
+        return []
+
+    monkeypatch.setattr(jabama_batch.search_stage, "fetch_search_items", fetch_search_items)
+    archive = object()
+    assert jabama_batch.fetch_search_results("city-ramsar", {"api_keyword": "city-ramsar", "stream": True},
+                                             archive) == {}
+    assert calls == [("city-ramsar", archive)]
@@ -0,0 +1,114 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from digikala_scraper import feedback_stream
+
+
+class _Response:
+    def __init__(self, data, status=200):
+        self._data = data
+        self.status = status
+        self.content = json.dumps(data).encode("utf-8")
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status} Server Error")
+
+    def json(self):
+        return self._data
+
+
+def _comment(i, date):
+    return {"body": f"comment {i}", "rate": 5, "created_at": date}
+
+
+class _FakeApi:
+    """
+    Serves 'pages' (page number -> items) as comments and as questions. 'failures' maps a comment
+    page to the number of times it fails before it is served.
+    """
+
+    def __init__(self, pages, failures=None):
+        self.pages = pages
+        self.failures = dict(failures or {})
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.sent.append((url, dict(params)))
+            page = params["page"]
+            if "rate-review" in url and self.failures.get(page):
+                self.failures[page] -= 1
+                return _Response({}, status=503)
+        items = self.pages[page]
+        key = "comments" if "rate-review" in url else "questions"
+        return _Response({"data": {key: items, "pager": {"total_pages": len(self.pages)}}})
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(feedback_stream, "RETRY_DELAY", 0)
+
+    def install(pages, failures=None):
+        fake = _FakeApi(pages, failures)
+        monkeypatch.setattr(feedback_stream.requests, "get", fake.get)
+        return fake
+    return install
+
+
+def test_failed_pages_are_retried(api):
+    fake = api({1: [_comment(1, "۲ دی ۱۴۰۲")], 2: [_comment(2, "۱ دی ۱۴۰۲")], 3: [_comment(3, "۱ آذر ۱۴۰۲")]},
+               failures={2: 2})
+    comments = list(feedback_stream.iter_comments(390759, prefetch=2))
+    assert [comment["body"] for comment in comments] == ["comment 1", "comment 2", "comment 3"]
+    assert [params["page"] for _, params in fake.sent].count(2) == 3
+
+
+def test_a_page_that_keeps_failing_ends_the_stream_with_an_error(api, tmp_path):
+    pages = {1: [_comment(1, "۲ دی ۱۴۰۲")], 2: [_comment(2, "۱ دی ۱۴۰۲")], 3: [_comment(3, "۱ آذر ۱۴۰۲")]}
+    api(pages, failures={2: 10})
+    received = []
+    with pytest.raises(requests.exceptions.RequestException):
+        for comment in feedback_stream.iter_comments(390759, prefetch=2):
+            received.append(comment["body"])
+    assert received == ["comment 1"]
+
+    fake = api(pages, failures={2: 10})
+    counts = feedback_stream.save_feedback_stream(390759, str(tmp_path / "feedback.jsonl"))
+    # The questions are still written (none of these pages has an answered question).
+    assert counts == {"comments": 1, "questions": 0, "complete": False}
+    assert [params["page"] for url, params in fake.sent if "questions" in url] == [1, 2, 3]
+
+
+def test_since_requests_newest_first_and_stops_after_an_older_page(api):
+    fake = api({
+        1: [{"body": "pinned", "created_at": "۱ فروردین ۱۳۹۹"}, _comment(1, "۲ دی ۱۴۰۲")],
+        2: [_comment(2, "۱ دی ۱۴۰۲"), _comment(3, "۱ آذر ۱۴۰۲")],
+        3: [_comment(4, "۱ مهر ۱۴۰۲")],
+        4: [_comment(5, "۱ تیر ۱۴۰۲")],
+    })
+    comments = list(feedback_stream.iter_comments(390759, since=(1402, 10, 1), prefetch=1))
+    assert [comment["body"] for comment in comments] == ["comment 1", "comment 2"]
+    assert all(params["sort"] == "created_at" for _, params in fake.sent)
+    assert 4 not in [params["page"] for _, params in fake.sent]
+
+
+def test_save_feedback_stream_forwards_the_options_to_questions(api, tmp_path):
+    class Archive:
+        def __init__(self):
+            self.ids = []
+
+        def put(self, endpoint, item_id, body):
+            self.ids.append((endpoint, item_id))
+
+    question = {"text": "سوال", "answers": [{"text": "جواب"}]}
+    api({1: [question, question], 2: [question]})
+    archive = Archive()
+    counts = feedback_stream.save_feedback_stream(390759, str(tmp_path / "feedback.jsonl"), max_items=2,
+                                                  prefetch=1, archive=archive)
+    assert counts == {"comments": 2, "questions": 2, "complete": True}
+    assert ("digikala/questions", "390759:1") in archive.ids
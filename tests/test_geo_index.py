@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from divar_scraper import geo_index
+from divar_scraper.geo_index import GeoIndex
+
+VANAK = (35.7575, 51.4100)
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(7)
+    latitudes = VANAK[0] + rng.uniform(-0.1, 0.1, 2000)
+    longitudes = VANAK[1] + rng.uniform(-0.1, 0.1, 2000)
+    return {f"post{i}": (float(lat), float(lon)) for i, (lat, lon) in enumerate(zip(latitudes, longitudes))}
+
+
+@pytest.fixture
+def index(tmp_path, points):
+    index = GeoIndex(str(tmp_path / "geo.db"), max_cells=16)
+    index.add_posts({token: {"title": token, "location": {"latitude": lat, "longitude": lon}}
+                     for token, (lat, lon) in points.items()})
+    yield index
+    index.close()
+
+
+def test_cell_ranges_cover_the_box():
+    box = (35.70, 51.35, 35.80, 51.47)
+    rng = np.random.default_rng(1)
+    latitudes, longitudes = rng.uniform(box[0], box[2], 1000), rng.uniform(box[1], box[3], 1000)
+    cells = geo_index.cell_of(latitudes, longitudes)
+    for max_cells in (1, 4, 64):
+        ranges = geo_index._cell_ranges(*box, max_cells=max_cells)
+        assert all(any(first <= cell <= last for first, last in ranges) for cell in cells.tolist())
+        assert all(previous[1] + 1 < following[0] for previous, following in zip(ranges, ranges[1:]))
+
+
+def test_bbox_matches_a_full_scan(index, points):
+    assert len(index) == len(points)
+    for south, west, north, east in [(35.70, 51.36, 35.75, 51.44), (35.74, 51.40, 35.76, 51.41), (0, 0, 1, 1)]:
+        expected = {token for token, (lat, lon) in points.items() if south <= lat <= north and west <= lon <= east}
+        assert {post["token"] for post in index.bbox(south, west, north, east)} == expected
+
+
+def test_radius_and_nearest_match_a_full_scan(index, points):
+    tokens = list(points)
+    latitudes = np.array([points[token][0] for token in tokens])
+    longitudes = np.array([points[token][1] for token in tokens])
+    distances = geo_index.haversine_m(*VANAK, latitudes, longitudes)
+
+    found = index.radius(*VANAK, 1500)
+    assert [post["token"] for post in found] == [tokens[i] for i in np.argsort(distances) if distances[i] <= 1500]
+    assert all(a["distance_m"] <= b["distance_m"] for a, b in zip(found, found[1:]))
+
+    nearest = index.nearest(*VANAK, k=7, start_radius_m=50)
+    assert [post["token"] for post in nearest] == [tokens[i] for i in np.argsort(distances)[:7]]
+
+
+def test_moved_and_removed_posts(index):
+    index.add_posts({"post0": {"location": {"latitude": 10.0, "longitude": 10.0}}})
+    assert [post["token"] for post in index.nearest(10.0, 10.0, k=1)] == ["post0"]
+    index.remove(["post0"])
+    assert index.nearest(10.0, 10.0, k=1, max_radius_m=1000) == []
+
+
+def test_district_stats_roll_up_to_parent_districts(tmp_path):
+    filters = {"page": {"widget_list": [{
+        "widget_type": "I_LAZY_MULTI_SELECT_DISTRICT_ROW",
+        "data": {"loaded_options": [{"key": "north", "title": "شمال تهران", "children": [
+            {"key": "vanak", "title": "ونک"},
+            {"key": "tajrish", "title": "تجریش"},
+        ]}]},
+    }]}}
+    index = GeoIndex(str(tmp_path / "geo.db"))
+    assert index.load_districts(filters) == 3
+    index.add_search_results({
+        "result_1": {"token": "a", "district_persian": "ونک"},
+        "result_2": {"token": "b", "district_persian": "ونك"},  # Arabic kaf, matched after normalization
+        "result_3": {"token": "c", "district_persian": "تجریش"},
+        "result_4": {"token": "d", "district_persian": "کرج"},
+    })
+    index.add_posts({"a": {"location": {"latitude": 35.75, "longitude": 51.40}},
+                     "c": {"location": {"latitude": 35.81, "longitude": 51.43}}})
+
+    stats = {entry["key"] or entry["title"]: entry for entry in index.district_stats()}
+    assert {key: (entry["posts"], entry["located"]) for key, entry in stats.items()} == \
+        {"north": (3, 2), "vanak": (2, 1), "tajrish": (1, 1), "کرج": (1, 0)}
+    assert stats["north"]["latitude"] == pytest.approx(35.78)
+    assert stats["north"]["bbox"] == [35.75, 51.40, 35.81, 51.43]
+    assert stats["کرج"]["bbox"] is None
+
+    flat = {entry["key"]: entry["posts"] for entry in index.district_stats(roll_up=False) if entry["key"]}
+    assert flat == {"vanak": 2, "tajrish": 1}
+    index.close()
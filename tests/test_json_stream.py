@@ -0,0 +1,67 @@
+import json
+import random
+
+import pytest
+
+from common.deadlines import Deadline
+from common.json_stream import iter_json_array, iter_response_items
+
+
+def _chunks(text, size=3):
+    data = text.encode("utf-8")
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _random_value(rng, depth=0):
+    kind = rng.randrange(6 if depth < 3 else 4)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.random() * 1000
+    if kind == 2:
+        return rng.choice(["", "گیتار", 'quote " and \\ slash', "a,b]}"])
+    if kind == 3:
+        return rng.choice([True, False, None])
+    if kind == 4:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}": _random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def test_matches_json_loads():
+    rng = random.Random(3)
+    for _ in range(200):
+        items = [_random_value(rng) for _ in range(rng.randrange(5))]
+        document = {"meta": _random_value(rng), "result": {"skip": _random_value(rng), "items": items}}
+        text = json.dumps(document, ensure_ascii=False, indent=rng.choice([None, 2]))
+        assert list(iter_json_array(_chunks(text, rng.randint(1, 16)), "result.items")) == items
+
+
+@pytest.mark.parametrize("text", ["[1,,2]", "[1 2]", "[,1]", "[1,]", '{"a": 1 "items": []}',
+                                  '{"a": 1,, "items": [1]}', "[1", '{"items": [1, 2'])
+def test_invalid_json_raises(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(text), "items" if text.startswith("{") else ""))
+
+
+def test_missing_path_yields_nothing():
+    assert list(iter_json_array(_chunks('{"data": null}'), "data.products")) == []
+    assert list(iter_json_array(_chunks('{"data": {}}'), "data.products")) == []
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(_chunks(self.text, 4))
+
+    def close(self):
+        self.closed = True
+
+
+def test_deadline_stops_reading():
+    response = _Response(json.dumps({"items": list(range(100))}))
+    with pytest.raises(TimeoutError):
+        list(iter_response_items(response, "items", deadline=Deadline(0)))
+    assert response.closed
@@ -0,0 +1,69 @@
+import numpy as np
+
+from jabama_scraper.listing_table import ListingTable
+
+
+def _listing(place_id, price, amenities=(), type_="villa", capacity=4, rating=4.5):
+    return {
+        "place_id": place_id,
+        "type": type_,
+        "location": {"province": "مازندران", "city": "رامسر"},
+        "price": {"per_night_rials": price, "discount_percent": 0},
+        "rating": {"score": rating, "count": 10},
+        "capacity": {"base": capacity, "extra": 0, "total": capacity},
+        "specs": {"bedrooms": 2, "bathrooms": 1},
+        "amenities": list(amenities),
+        "tags": [],
+    }
+
+
+def test_upsert_replaces_listings_by_place_id():
+    table = ListingTable(capacity=2)
+    assert table.upsert([_listing(1, 100, ["استخر"]), _listing(2, 200), _listing(1, 150, ["استخر"])]) == 2
+    assert table.upsert([_listing(2, 50, ["باربیکیو"]), _listing(3, 300)]) == 1
+    assert len(table) == 3
+    assert [(item["place_id"], item["price"]["per_night_rials"]) for item in table.query(sort_by="price")] == \
+        [(2, 50), (1, 150), (3, 300)]
+    # The old amenities of a replaced listing are cleared.
+    assert [item["place_id"] for item in table.query(amenities=["استخر"])] == [1]
+    table.upsert([_listing(1, 150)])
+    assert table.query(amenities=["استخر"]) == []
+    assert [item["place_id"] for item in table.query(amenities=["باربیکیو"])] == [2]
+
+
+def test_amenity_bitsets_widen_past_64_values():
+    table = ListingTable(capacity=4)
+    amenities = [f"amenity-{i}" for i in range(150)]
+    table.upsert([_listing(1, 100, amenities[:70]), _listing(2, 200, amenities[60:])])
+    assert table._bits["amenities"].shape[1] == 3
+    # A listing added after the widening and one with values in several words.
+    table.upsert([_listing(3, 300, ["amenity-0", "amenity-149"])])
+
+    def ids(**conditions):
+        return [item["place_id"] for item in table.query(sort_by="price", **conditions)]
+
+    assert ids(amenities=["amenity-0"]) == [1, 3]
+    assert ids(amenities=["amenity-65"]) == [1, 2]
+    assert ids(amenities=["amenity-149", "amenity-0"]) == [3]
+    assert ids(amenities=["amenity-69", "amenity-70"]) == [2]
+    assert ids(amenities=["amenity-59", "amenity-70"]) == []
+    assert ids(amenities=["unknown"]) == []
+
+
+def test_top_k_matches_a_full_sort():
+    rng = np.random.default_rng(3)
+    prices = rng.permutation(500).astype(float) * 1000
+    listings = [_listing(i, None if i % 7 == 0 else prices[i], capacity=int(rng.integers(1, 10)))
+                for i in range(500)]
+    table = ListingTable()
+    table.upsert(listings)
+
+    for descending in (False, True):
+        full = table.query(sort_by="price", descending=descending, min_capacity=4)
+        for k in (1, 10, 100, len(full) + 5):
+            assert table.query(sort_by="price", descending=descending, limit=k, min_capacity=4) == full[:k]
+        prices_sorted = [item["price"]["per_night_rials"] for item in full]
+        known = [price for price in prices_sorted if price is not None]
+        assert known == sorted(known, reverse=descending)
+        # Listings without a price come last.
+        assert all(price is None for price in prices_sorted[len(known):])
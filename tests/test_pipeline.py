@@ -0,0 +1,82 @@
+import threading
+
+from common import pipeline
+
+
+def test_partial_batches_reach_the_next_stage_while_the_parent_runs(monkeypatch):
+    received = threading.Event()
+
+    def slow_parent(record, archive=None, deadline=None):
+        yield {"value": 1}
+        # Keeps running until the child has seen the first record (or gives up after 5 s).
+        received.wait(5)
+        yield {"value": 2}
+
+    def child(record, archive=None, deadline=None):
+        received.set()
+        yield record
+
+    monkeypatch.setitem(pipeline.STAGE_TYPES, "test.parent", slow_parent)
+    monkeypatch.setitem(pipeline.STAGE_TYPES, "test.child", child)
+    config = {
+        "batch_size": 20,
+        "flush_seconds": 0.1,
+        "inputs": [{"query": "q"}],
+        "stages": [
+            {"name": "parent", "type": "test.parent"},
+            {"name": "child", "type": "test.child", "after": "parent"},
+        ],
+    }
+    stats = pipeline.run_pipeline(config)
+    assert received.is_set()
+    assert stats["parent"]["seconds"] < 4
+    assert stats["child"]["emitted"] == 2
+
+
+def _run_into(monkeypatch, config):
+    received = []
+
+    def collect(record, archive=None, deadline=None):
+        received.append(record)
+        yield record
+
+    monkeypatch.setitem(pipeline.STAGE_TYPES, "test.collect", collect)
+    pipeline.run_pipeline(config)
+    return received
+
+
+def test_divar_suggestions_pass_the_category_slug_downstream(monkeypatch):
+    stage = pipeline.load_stage("divar_scraper", "1_get_suggestions.py")
+    monkeypatch.setattr(stage, "get_suggestions", lambda query, city_id, timeout: [
+        {"suggestion_title": "گیتار", "category": "آلات موسیقی", "ad_count": 12, "value": "musical-instruments"},
+        {"suggestion_title": "گیتار", "category": "بدون دسته", "ad_count": 0, "value": None},
+    ])
+    received = _run_into(monkeypatch, {
+        "inputs": [{"query": "گیتار"}],
+        "stages": [
+            {"name": "suggestions", "type": "divar.suggestions"},
+            {"name": "next", "type": "test.collect", "after": "suggestions"},
+        ],
+    })
+    assert received == [{"suggestion_title": "گیتار", "category": "musical-instruments", "ad_count": 12,
+                         "value": "musical-instruments", "query": "گیتار", "category_title": "آلات موسیقی"}]
+
+
+def test_jabama_search_applies_the_suggestion_pre_filters(monkeypatch):
+    stage = pipeline.load_stage("jabama_scraper", "3_execute_search.py")
+    calls = []
+
+    def fetch_search_items(api_keyword, selected_filters, results_count, archive, timeout):
+        calls.append((api_keyword, selected_filters))
+        return []
+
+    monkeypatch.setattr(stage, "fetch_search_items", fetch_search_items)
+    list(pipeline.jabama_search({"api_keyword": "city-ramsar", "pre_filters": {"types": ["villa"]}}))
+    list(pipeline.jabama_search({"api_keyword": "city-ramsar", "pre_filters": {"types": ["villa"]},
+                                 "selected_filters": {"types": ["cottage"], "scores": ["4.0-5.0"]}}))
+    list(pipeline.jabama_search({"api_keyword": "city-ramsar", "pre_filters": None}))
+    assert calls == [
+        ("city-ramsar", {"types": ["villa"]}),
+        ("city-ramsar", {"types": ["cottage"], "scores": ["4.0-5.0"]}),
+        ("city-ramsar", None),
+    ]
@@ -0,0 +1,36 @@
+import math
+
+import pytest
+
+from digikala_scraper import price_bands
+from digikala_scraper.price_bands import PriceBandCrawler, split_range
+
+
+@pytest.mark.parametrize("low, high, parts", [(0, 1, 2), (0, 1, 50), (0, 8, 3), (1, 2, 4), (5, 6, 4),
+                                              (999, 1000, 10), (0, 10 ** 10, 40)])
+def test_split_range_makes_progress(low, high, parts):
+    bands = split_range(low, high, parts)
+    assert len(bands) >= 2
+    assert bands[0][0] == low and bands[-1][1] == high
+    assert all(band[0] <= band[1] for band in bands)
+    assert all(left[1] + 1 == right[0] for left, right in zip(bands, bands[1:]))
+
+
+def test_single_price_is_not_split():
+    assert split_range(7, 7, 3) == [(7, 7)]
+
+
+def test_plan_terminates_on_narrow_crowded_bands(monkeypatch):
+    # 5000 products at price 0 and 5000 at price 1: more than the cap at every single price.
+    prices = [0] * 5000 + [1] * 5000
+
+    def search_page(query, page, filters, timeout):
+        low, high = filters["price"]["min"], filters["price"]["max"]
+        ids = [i for i, price in enumerate(prices) if low <= price <= high]
+        total_pages = min(10, math.ceil(len(ids) / 20))
+        return {"products": [{"id": i} for i in ids[(page - 1) * 20:page * 20]],
+                "total_items": len(ids), "total_pages": total_pages}
+
+    monkeypatch.setattr(price_bands.search_stage, "search_digikala_page", search_page)
+    bands = PriceBandCrawler("q", page_cap=10).plan(0, 1)
+    assert [(band["min"], band["max"], band["complete"]) for band in bands] == [(0, 0, False), (1, 1, False)]
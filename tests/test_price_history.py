@@ -0,0 +1,29 @@
+import numpy as np
+
+from digikala_scraper.price_history import PriceHistoryStore
+
+
+def _snapshot(product_id, price, seller="s"):
+    return {"product_id": product_id, "seller": seller, "selling_price": price, "rrp_price": price}
+
+
+def test_previous_low_ignores_single_snapshot_series(tmp_path):
+    store = PriceHistoryStore(str(tmp_path / "history"))
+    # Series of product 2 has one snapshot and sits between the series of products 1 and 3.
+    store.append([_snapshot(1, 500), _snapshot(2, 10), _snapshot(3, 900)], timestamp=1)
+    store.append([_snapshot(1, 450), _snapshot(3, 800)], timestamp=2)
+
+    changes = store.latest_changes()
+    keys = store.series_keys(changes["series"])
+    previous_low = dict(zip(keys, changes["previous_low"].tolist()))
+
+    assert previous_low == {(1, "s"): 500, (3, "s"): 900}
+    assert [key for key in store.series_keys(store.new_lows()["series"])] == [(1, "s"), (3, "s")]
+
+
+def test_empty_store(tmp_path):
+    store = PriceHistoryStore(str(tmp_path / "history"))
+    assert len(store.latest_changes()["series"]) == 0
+    anomalies = store.discount_anomalies()
+    assert all(len(values) == 0 for values in anomalies.values())
+    assert anomalies["mismatch"].dtype == np.bool_
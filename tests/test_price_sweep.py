@@ -0,0 +1,107 @@
+import sqlite3
+from datetime import date
+
+import numpy as np
+
+from jabama_scraper import price_sweep
+
+JULY_1, JULY_2 = date(2025, 7, 1), date(2025, 7, 2)
+
+# (keyword, check-in, nights) -> ids of the listings the search returns
+RESULTS = {
+    ("city-ramsar", "2025-07-01", 1): ["A", "B"],
+    ("city-ramsar", "2025-07-02", 1): ["A"],
+    ("villa-ramsar", "2025-07-01", 1): ["B", "C"],
+    ("villa-ramsar", "2025-07-02", 1): ["C"],
+    ("city-ramsar", "2025-07-01", 2): ["A"],
+    ("city-ramsar", "2025-07-02", 2): ["B"],
+    ("villa-ramsar", "2025-07-01", 2): [],
+    ("villa-ramsar", "2025-07-02", 2): ["C"],
+}
+
+
+def _install_fake_search(monkeypatch, results=RESULTS):
+    def fetch_search_items(keyword, filters, results_count, timeout=None):
+        check_in, check_out = (date.fromisoformat(filters["date"][key]) for key in ("checkIn", "checkOut"))
+        ids = results[(keyword, check_in.isoformat(), (check_out - check_in).days)]
+        return [{"id": place_id, "price": {"perNight": 1000 * (i + 1)}} for i, place_id in enumerate(ids)][:results_count]
+
+    monkeypatch.setattr(price_sweep.search_stage, "fetch_search_items", fetch_search_items)
+
+
+def _availability(sweep, **options):
+    place_ids, dates, values = sweep.matrix(field="available", **options)
+    return {(place_id, day): None if np.isnan(values[i, j]) else int(values[i, j])
+            for i, place_id in enumerate(place_ids) for j, day in enumerate(dates)}
+
+
+def test_availability_per_keyword_does_not_depend_on_search_order(monkeypatch, tmp_path):
+    _install_fake_search(monkeypatch)
+    grid = price_sweep.date_grid(JULY_1, JULY_2, nights=(1,))
+    expected = {
+        ("A", "2025-07-01"): 1, ("A", "2025-07-02"): 1,
+        ("B", "2025-07-01"): 1, ("B", "2025-07-02"): 0,
+    }
+    for order in (["city-ramsar", "villa-ramsar"], ["villa-ramsar", "city-ramsar"]):
+        sweep = price_sweep.PriceSweep(str(tmp_path / f"{order[0]}.db"))
+        assert sweep.sweep(order, grid, workers=1) == {"fetched": 4, "skipped": 0, "failed": 0}
+        assert _availability(sweep, keywords=["city-ramsar"]) == expected
+        assert _availability(sweep)[("C", "2025-07-01")] == 1
+        sweep.close()
+
+
+def test_truncated_searches_do_not_mark_listings_unavailable(monkeypatch, tmp_path):
+    _install_fake_search(monkeypatch, {
+        ("city-ramsar", "2025-07-01", 1): ["A", "B"],
+        ("city-ramsar", "2025-07-02", 1): ["A", "C"],
+    })
+    sweep = price_sweep.PriceSweep(str(tmp_path / "sweep.db"))
+    # Both searches fill their page of two: B may be on the second page of July 2.
+    sweep.sweep(["city-ramsar"], price_sweep.date_grid(JULY_1, JULY_2), results_count=2, workers=1)
+    assert _availability(sweep)[("B", "2025-07-02")] is None
+    assert _availability(sweep)[("C", "2025-07-01")] is None
+
+    sweep.max_age = 0
+    sweep.sweep(["city-ramsar"], price_sweep.date_grid(JULY_1, JULY_2), results_count=10, workers=1)
+    assert _availability(sweep)[("B", "2025-07-02")] == 0
+    assert _availability(sweep)[("C", "2025-07-01")] == 0
+    sweep.close()
+
+
+def test_save_matrix_keeps_every_stay_length(monkeypatch, tmp_path):
+    _install_fake_search(monkeypatch)
+    sweep = price_sweep.PriceSweep(str(tmp_path / "sweep.db"))
+    sweep.sweep(["city-ramsar", "villa-ramsar"], price_sweep.date_grid(JULY_1, JULY_2, nights=(1, 2)), workers=2)
+    sweep.save_matrix(str(tmp_path / "matrix.npz"), nights=(1, 2))
+    sweep.close()
+
+    saved = np.load(tmp_path / "matrix.npz")
+    assert saved["nights"].tolist() == [1, 2]
+    assert saved["place_ids"].tolist() == ["A", "B", "C"]
+    assert saved["dates"].tolist() == ["2025-07-01", "2025-07-02"]
+    assert saved["price"].shape == saved["available"].shape == (2, 3, 2)
+    np.testing.assert_array_equal(saved["available"][1], [[1, 0], [0, 1], [0, 1]])
+    assert saved["price"][1, 0, 0] == 1000
+
+
+def test_old_cache_files_are_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE queries (keyword TEXT NOT NULL, check_in TEXT NOT NULL, nights INTEGER NOT NULL,
+                              results INTEGER NOT NULL, fetched_at REAL NOT NULL,
+                              PRIMARY KEY (keyword, check_in, nights));
+        CREATE TABLE cells (place_id TEXT NOT NULL, check_in TEXT NOT NULL, nights INTEGER NOT NULL,
+                            keyword TEXT NOT NULL, price REAL, discount_percent REAL, fetched_at REAL NOT NULL,
+                            PRIMARY KEY (place_id, check_in, nights));
+        INSERT INTO queries VALUES ('city-ramsar', '2025-07-01', 1, 1, 0);
+        INSERT INTO cells VALUES ('A', '2025-07-01', 1, 'city-ramsar', 1000, 0, 0);
+    """)
+    conn.close()
+
+    sweep = price_sweep.PriceSweep(path)
+    place_ids, dates, prices = sweep.matrix()
+    assert (place_ids, dates, prices.tolist()) == (["A"], ["2025-07-01"], [[1000]])
+    sweep._store("villa-ramsar", JULY_1, 1, [{"place_id": "A", "price": {"per_night_rials": 1100}}], truncated=False)
+    assert _availability(sweep, keywords=["city-ramsar"]) == {("A", "2025-07-01"): 1}
+    sweep.close()
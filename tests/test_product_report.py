@@ -0,0 +1,55 @@
+from common.deadlines import Deadline
+from digikala_scraper import batch
+
+PRODUCT_URL = "https://www.digikala.com/product/dkp-390759/"
+
+
+class _Response:
+    content = b"{}"
+
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+def _fake_get(sent):
+    def get(url, params=None, headers=None, timeout=None):
+        sent.append((url, timeout))
+        if "/v2/product/" in url:
+            return _Response({"data": {"product": {"id": 390759, "title_fa": "ترازو", "variants": []}}})
+        return _Response({"data": {}})
+    return get
+
+
+def test_each_request_is_wrapped_separately(monkeypatch):
+    sent, calls = [], []
+    monkeypatch.setattr(batch.report_stage.requests, "get", _fake_get(sent))
+
+    def call(endpoint, send):
+        calls.append(endpoint)
+        return send(7)
+
+    report = batch.report_stage.product_details(PRODUCT_URL, call=call)
+    assert report["product_summary"]["id"] == 390759
+    assert calls == ["digikala/product", "digikala/comments", "digikala/questions"]
+    assert [timeout for _, timeout in sent] == [7, 7, 7]
+
+
+def test_expired_deadline_sends_nothing(monkeypatch):
+    sent = []
+    monkeypatch.setattr(batch.report_stage.requests, "get", _fake_get(sent))
+    assert batch.fetch_product_report(PRODUCT_URL, deadline=Deadline(0)) is None
+    assert sent == []
+
+
+def test_requests_are_bounded_by_the_time_left(monkeypatch):
+    sent = []
+    monkeypatch.setattr(batch.report_stage.requests, "get", _fake_get(sent))
+    assert batch.fetch_product_report(PRODUCT_URL, deadline=Deadline(5)) is not None
+    assert len(sent) == 3
+    assert all(timeout <= 5 for _, timeout in sent)
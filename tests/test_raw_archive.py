@@ -0,0 +1,43 @@
+import json
+import threading
+
+from common.raw_archive import RawArchive
+
+
+def _body(worker, i):
+    return json.dumps({"worker": worker, "i": i, "text": "آگهی " * (i % 50)}, ensure_ascii=False).encode("utf-8")
+
+
+def test_put_and_get_from_many_threads(tmp_path):
+    archive = RawArchive(str(tmp_path / "archive"), segment_size=64 * 1024)
+    errors = []
+
+    def work(worker):
+        try:
+            for i in range(200):
+                archive.put("test/item", f"{worker}:{i}", _body(worker, i))
+                assert archive.get("test/item", f"{worker}:{i}") == _body(worker, i)
+        except Exception as e:  # collected, so a failure in a thread fails the test
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(archive) == 8 * 200
+    archive.close()
+
+    with RawArchive(str(tmp_path / "archive")) as reopened:
+        assert reopened.get("test/item", "7:199") == _body(7, 199)
+        assert sum(1 for _ in reopened.scan("test/item")) == 8 * 200
+
+
+def test_latest_version_wins(tmp_path):
+    with RawArchive(str(tmp_path / "archive")) as archive:
+        archive.put("divar/post", "Aa5BgqFj", b"old")
+        archive.put("divar/post", "Aa5BgqFj", b"new")
+        assert archive.get("divar/post", "Aa5BgqFj") == b"new"
+        assert [body for *_, body in archive.scan(latest_only=False)] == [b"old", b"new"]
+        assert archive.get("divar/post", "missing") is None
@@ -0,0 +1,47 @@
+import json
+
+from common import reparse
+from common.raw_archive import RawArchive
+
+
+def _search_page(*posts):
+    widgets = [{"widget_type": "POST_ROW", "data": {"token": token, "title": title}} for token, title in posts]
+    return json.dumps({"list_widgets": widgets}, ensure_ascii=False).encode("utf-8")
+
+
+def _reparse(archive_dir, output, previous=None):
+    return reparse.reparse_archive(str(archive_dir), str(output), str(previous) if previous else None,
+                                   endpoints=["divar/search"], workers=1)
+
+
+def test_rerun_over_the_same_archive_reports_no_changes(tmp_path):
+    with RawArchive(str(tmp_path / "archive")) as archive:
+        # The same post on two pages, with a title edited in between, plus a post without a token.
+        archive.put("divar/search", "page-1", _search_page(("AaBb", "گیتار"), (None, "بنر تبلیغاتی")))
+        archive.put("divar/search", "page-2", _search_page(("AaBb", "گیتار یاماها"), ("CcDd", "پیانو")))
+
+    _reparse(tmp_path / "archive", tmp_path / "first.jsonl")
+    rows = [json.loads(line) for line in open(tmp_path / "first.jsonl", encoding="utf-8")]
+    assert [(row["item"], row["key"]) for row in rows] == [("page-1", "AaBb"), ("page-2", "AaBb"), ("page-2", "CcDd")]
+
+    report = _reparse(tmp_path / "archive", tmp_path / "second.jsonl", tmp_path / "first.jsonl")
+    assert {key: report["diff"][key] for key in ("added", "changed", "unchanged", "removed")} == \
+        {"added": 0, "changed": 0, "unchanged": 3, "removed": 0}
+
+
+def test_diff_against_a_previous_run(tmp_path):
+    with RawArchive(str(tmp_path / "archive")) as archive:
+        archive.put("divar/search", "page-1", _search_page(("AaBb", "گیتار"), ("CcDd", "پیانو")))
+    _reparse(tmp_path / "archive", tmp_path / "first.jsonl")
+
+    with RawArchive(str(tmp_path / "archive")) as archive:
+        archive.put("divar/search", "page-1", _search_page(("AaBb", "گیتار کلاسیک"), ("EeFf", "ویولن")))
+        archive.put("divar/search", "page-2", _search_page(("AaBb", "گیتار الکتریک")))
+    report = _reparse(tmp_path / "archive", tmp_path / "second.jsonl", tmp_path / "first.jsonl")
+
+    diff = report["diff"]
+    assert (diff["added"], diff["changed"], diff["unchanged"], diff["removed"]) == (2, 1, 0, 1)
+    assert diff["samples"]["changed"] == ["divar/search:page-1:AaBb"]
+    assert sorted(diff["samples"]["added"]) == ["divar/search:page-1:EeFf", "divar/search:page-2:AaBb"]
+    assert diff["samples"]["removed"] == ["divar/search:page-1:CcDd"]
+    assert report["throughput"]["raw_records"] == 2
@@ -0,0 +1,79 @@
+import random
+import statistics
+
+import pytest
+
+from digikala_scraper.seller_index import SellerIndex
+
+
+def _report(product_id, offers, category="گوشی موبایل"):
+    return {
+        "product_summary": {"id": product_id, "name": f"محصول {product_id}", "category": category},
+        "seller_offers": [{"seller_name": seller, "price": price} for seller, price in offers.items()],
+    }
+
+
+def _search_result(product_id, seller, price):
+    return {"id": product_id, "title_fa": f"محصول {product_id}", "price": {"selling_price": price},
+            "seller": {"name": seller}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SellerIndex(str(tmp_path / "sellers.db"))
+    yield index
+    index.close()
+
+
+def test_a_report_replaces_the_offers_of_its_product(index):
+    index.add_product_reports([_report(1, {"دیجی‌کالا": 100, "فروشگاه الف": 120})])
+    index.add_product_report(_report(1, {"فروشگاه الف": 90, "فروشگاه ب": 95}))
+
+    assert index.seller("دیجی‌کالا") is None
+    seller = index.seller("فروشگاه الف")
+    assert (seller["offers"], seller["min_price"], seller["best_price_share"]) == (1, 90, 1.0)
+    assert index.seller("فروشگاه ب")["mean_price_ratio"] == pytest.approx(95 / 90)
+
+
+def test_a_search_result_merges_one_offer(index):
+    index.add_product_reports([_report(1, {"دیجی‌کالا": 100, "فروشگاه الف": 120})])
+    # The search shows a new seller at the best price: the other offers stay, but are no longer best.
+    assert index.add_search_results([_search_result(1, "فروشگاه ب", 80), _search_result(2, "نامشخص", 10)]) == 1
+
+    assert [offer["seller"] for offer in index.cheapest_offers("گوشی موبایل")] == ["فروشگاه ب", "دیجی‌کالا", "فروشگاه الف"]
+    assert index.seller("دیجی‌کالا")["best_price_share"] == 0
+    assert index.seller("دیجی‌کالا")["mean_price_ratio"] == pytest.approx(100 / 80)
+    # The new offer gets the category of the product's report.
+    assert index.cheapest_sellers_per_category(k=1, min_offers=1)["گوشی موبایل"][0]["seller"] == "فروشگاه ب"
+
+
+def test_seller_counters_match_a_full_recount(index):
+    rng = random.Random(11)
+    sellers = [f"seller-{i}" for i in range(8)]
+    categories = ["گوشی موبایل", "لپ‌تاپ", None]
+    for _ in range(300):
+        product_id = rng.randrange(30)
+        if rng.random() < 0.5:
+            offers = {seller: rng.randrange(50, 150) for seller in rng.sample(sellers, rng.randrange(0, 5))}
+            index.add_product_report(_report(product_id, offers, rng.choice(categories)))
+        else:
+            index.add_search_results([_search_result(product_id, rng.choice(sellers), rng.randrange(50, 150))])
+
+    rows = index._conn.execute("SELECT product_id, seller, price FROM offers").fetchall()
+    by_product = {}
+    for product_id, seller, price in rows:
+        by_product.setdefault(product_id, {})[seller] = price
+    for seller in sellers:
+        prices = [(offers[seller], min(offers.values())) for offers in by_product.values() if seller in offers]
+        stats = index.seller(seller)
+        if not prices:
+            assert stats is None
+            continue
+        assert stats["offers"] == len(prices)
+        assert stats["min_price"] == min(price for price, _ in prices)
+        assert stats["median_price"] == statistics.median(price for price, _ in prices)
+        assert stats["best_price_share"] == pytest.approx(sum(price == best for price, best in prices) / len(prices))
+        assert stats["mean_price_ratio"] == pytest.approx(sum(price / best for price, best in prices) / len(prices))
+
+    ranked = index.top_sellers(k=len(sellers), by="offers", min_offers=1)
+    assert [entry["offers"] for entry in ranked] == sorted((entry["offers"] for entry in ranked), reverse=True)
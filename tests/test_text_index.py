@@ -0,0 +1,72 @@
+import pytest
+
+from common.text_index import TextIndex, _load_records, normalize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TextIndex(str(tmp_path / "index.db"))
+    index.add_records("digikala-products", [
+        {"id": 1, "title_fa": "گیتار یاماها C40"},
+        {"id": 2, "title_fa": "گیتار برقی یاماها"},
+        {"id": 3, "title_fa": "ویولن ۴/۴ دِلتا"},
+        {"id": 4, "title_fa": "لپ‌تاپ ایسوس"},
+    ])
+    index.add_records("jabama-listings", [{"place_id": 10, "name": "ويلا استخردار", "description": "لپ تاپ دارد"}])
+    yield index
+    index.close()
+
+
+def _keys(index, query):
+    return sorted(result["key"] for result in index.search(query, limit=None))
+
+
+def test_normalize():
+    assert normalize("كيف  ۱۲۳٤ آبی‌رنگ!") == "کیف 1234 ابی رنگ"
+    assert normalize("مُحَمَّد") == "محمد"
+
+
+def test_boolean_queries(index):
+    assert _keys(index, "گیتار یاماها") == ["1", "2"]
+    assert _keys(index, "گیتار -برقی") == ["1"]
+    assert _keys(index, "برقی OR ویولن") == ["2", "3"]
+    assert _keys(index, "گیتار -یاماها OR ویولن") == ["3"]
+    assert _keys(index, "-گیتار") == []
+    assert _keys(index, "پیانو") == []
+
+
+def test_prefix_and_normalized_queries(index):
+    assert _keys(index, "یاما*") == ["1", "2"]
+    assert _keys(index, "گیتار یا*") == ["1", "2"]
+    # Persian digits, Arabic letter forms and the zero-width non-joiner are normalised on both sides.
+    assert _keys(index, "ویولن 4") == ["3"]
+    assert _keys(index, "ويلا") == ["10"]
+    assert _keys(index, "لپ‌تاپ") == ["10", "4"]
+    assert _keys(index, "c40") == ["1"]
+
+
+def test_replace_and_compact(index):
+    index.add_records("digikala-products", [{"id": 2, "title_fa": "گیتار کلاسیک"}])
+    assert _keys(index, "برقی") == []
+    assert _keys(index, "گیتار کلاسیک") == ["2"]
+    assert [result["title"] for result in index.search("گیتار", source="digikala-products")] == \
+        ["گیتار کلاسیک", "گیتار یاماها C40"]
+
+    before = {query: _keys(index, query) for query in ("گیتار", "یاما*", "برقی", "لپ تاپ", "گیتار -کلاسیک")}
+    index.compact()
+    assert index._conn.execute("SELECT COUNT(*) FROM postings GROUP BY term HAVING COUNT(*) > 1").fetchall() == []
+    assert {query: _keys(index, query) for query in before} == before
+    index.add_records("digikala-products", [{"id": 5, "title_fa": "گیتار باس"}])
+    assert _keys(index, "گیتار") == ["1", "2", "5"]
+
+
+def test_divar_posts_need_a_token(tmp_path):
+    (tmp_path / "posts.json").write_text('{"AaBb": {"title": "گیتار", "description": "نو"}}', encoding="utf-8")
+    (tmp_path / "posts.jsonl").write_text('{"token": "CcDd", "title": "ویولن"}\n', encoding="utf-8")
+    index = TextIndex(str(tmp_path / "index.db"))
+    assert index.add_records("divar-posts", _load_records(str(tmp_path / "posts.json"))) == 1
+    assert index.add_records("divar-posts", _load_records(str(tmp_path / "posts.jsonl"))) == 1
+    assert _keys(index, "گیتار OR ویولن") == ["AaBb", "CcDd"]
+    with pytest.raises(ValueError):
+        index.add_records("divar-posts", [{"title": "پیانو"}])
+    index.close()
@@ -0,0 +1,100 @@
+import sqlite3
+import threading
+import time
+
+from common.work_queue import DONE, LEASED, PENDING, WorkQueue, run_queue
+
+# The schema of queue files created before leases recorded their owner.
+OLD_SCHEMA = """
+CREATE TABLE items (
+    key           TEXT PRIMARY KEY,
+    payload       TEXT,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    updated       REAL
+);
+CREATE INDEX items_state ON items (state, lease_expires);
+INSERT INTO items (key, payload) VALUES ('a', '{"page": 1}');
+"""
+
+
+def test_old_queue_file_is_migrated(tmp_path):
+    path = str(tmp_path / "queue.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.close()
+
+    with WorkQueue(path) as queue:
+        assert queue.lease(10, owner="worker-1") == [("a", {"page": 1})]
+        queue.complete("a", {"ok": True})
+        queue.checkpoint()
+        assert queue.counts() == {DONE: 1}
+        assert dict(queue.results()) == {"a": {"ok": True}}
+
+
+def test_items_cut_off_by_the_deadline_keep_their_attempts(tmp_path):
+    from common.deadlines import Deadline
+
+    deadline = Deadline(0.05)
+
+    def handler(key, payload):
+        # Waits for the deadline, like a request whose timeout was cut to the time left.
+        while not deadline.expired():
+            pass
+        return None
+
+    with WorkQueue(str(tmp_path / "queue.db"), max_attempts=1) as queue:
+        queue.enqueue([("a", None), ("b", None)])
+        run_queue(queue, handler, workers=2, deadline=deadline)
+        assert queue.counts() == {PENDING: 2}
+        # The next run still has its single attempt for every item.
+        assert sorted(key for key, _ in queue.lease(10)) == ["a", "b"]
+
+
+def test_release_refunds_the_attempt(tmp_path):
+    with WorkQueue(str(tmp_path / "queue.db"), max_attempts=2) as queue:
+        queue.enqueue([("a", None), ("b", None)])
+        for _ in range(5):
+            assert [key for key, _ in queue.lease(1)] == ["a"]
+            queue.release("a")
+        assert queue._conn.execute("SELECT state, attempts FROM items WHERE key = 'a'").fetchone() == (PENDING, 0)
+
+        # Only a leased item is released: a completed one keeps its state and attempts.
+        assert [key for key, _ in queue.lease(2)] == ["a", "b"]
+        queue.complete("b", {"ok": True})
+        queue.checkpoint()
+        queue.release("b")
+        rows = dict(((key, (state, attempts)) for key, state, attempts in
+                     queue._conn.execute("SELECT key, state, attempts FROM items")))
+        assert rows == {"a": (LEASED, 1), "b": (DONE, 1)}
+
+
+def test_buffered_results_are_written_before_their_leases_expire(tmp_path):
+    path = str(tmp_path / "queue.db")
+    release_slow_item = threading.Event()
+
+    def handler(key, payload):
+        if key == "slow":
+            # Runs for several lease lengths, while "fast" waits in the checkpoint buffer.
+            release_slow_item.wait(5)
+        return {"key": key}
+
+    with WorkQueue(path, lease_seconds=0.2, checkpoint_every=50) as queue, \
+            WorkQueue(path, lease_seconds=0.2) as other_worker:
+        queue.enqueue([("fast", None), ("slow", None)])
+        stolen = []
+
+        def other():
+            time.sleep(0.6)
+            stolen.extend(key for key, _ in other_worker.lease(10))
+            release_slow_item.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        run_queue(queue, handler, workers=2, batch_size=2)
+        thread.join()
+        # The expired lease of the slow item may be taken over, but the finished one must not be redone.
+        assert "fast" not in stolen